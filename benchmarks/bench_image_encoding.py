@@ -0,0 +1,110 @@
+"""キーフレーム前処理（リサイズ＋エンコード）のマイクロベンチマーク
+
+従来の処理（PILで全解像度デコード → LANCZOS縮小 → 品質95で逐次エンコード）と、
+VLMClient の現在の処理（JPEGドラフトデコード・設定可能なフィルタと品質・
+NumPyフレームの直接エンコード・スレッドプールでの並列エンコード）を比較する。
+
+使い方:
+    python benchmarks/bench_image_encoding.py --width 1920 --height 1080 --count 5 --repeat 20
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+# VLMClient の生成にAPIキーが必要なため、ベンチマーク用のダミー値を設定する（通信は行わない）
+os.environ.setdefault("VLM_API_KEY", "benchmark")
+
+import config  # noqa: E402
+from vlm_client import VLMClient  # noqa: E402
+
+
+def legacy_encode(image_path: Path) -> str:
+    """変更前の resize_and_encode_image と同等の処理"""
+    img = Image.open(image_path)
+    img.thumbnail(config.get_vlm_image_max_size(), Image.Resampling.LANCZOS)
+    buffered = BytesIO()
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img.save(buffered, format="PNG", quality=95)
+        mime_type = "image/png"
+    else:
+        img.save(buffered, format="JPEG", quality=95)
+        mime_type = "image/jpeg"
+    return f"data:{mime_type};base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+
+
+def make_frames(count: int, width: int, height: int) -> list:
+    """グラデーションとノイズを含む合成フレームを生成"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    frames = []
+    for i in range(count):
+        base = np.broadcast_to(gradient, (height, width, 3)) + i * 20
+        noise = rng.normal(0, 12, (height, width, 3))
+        frames.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+def measure(label: str, func, repeat: int) -> dict:
+    """関数を繰り返し実行し、所要時間とペイロードサイズを計測"""
+    timings = []
+    payload = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data_urls = func()
+        timings.append(time.perf_counter() - start)
+        payload = sum(len(url) for url in data_urls)
+    result = {
+        "label": label,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "payload_bytes": payload,
+    }
+    print(f"{label:<40} median {result['median_ms']:8.2f} ms  min {result['min_ms']:8.2f} ms  "
+          f"payload {payload / 1024:8.1f} KiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="キーフレーム前処理のマイクロベンチマーク")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--count", type=int, default=config.get_ffmpeg_keyframe_count(),
+                        help="1セグメントあたりのキーフレーム数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    frames = make_frames(args.count, args.width, args.height)
+    client = VLMClient()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i, frame in enumerate(frames):
+            path = Path(tmp_dir) / f"keyframe_{i:04d}.jpg"
+            cv2.imwrite(str(path), frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            paths.append(path)
+
+        print(f"{args.count} keyframes, {args.width}x{args.height} -> max {config.get_vlm_image_max_size()}, "
+              f"resample={config.get_vlm_image_resample()}, quality={config.get_vlm_image_jpeg_quality()}, "
+              f"workers={config.get_vlm_encode_workers()}")
+        measure("legacy (PIL full decode, serial)", lambda: [legacy_encode(p) for p in paths], args.repeat)
+        measure("files: draft decode, serial",
+                lambda: [client.resize_and_encode_image(p)[1] for p in paths], args.repeat)
+        measure("files: draft decode, thread pool", lambda: client.encode_images(paths), args.repeat)
+        measure("frames: cv2 direct, serial",
+                lambda: [client.encode_frame(f)[1] for f in frames], args.repeat)
+        measure("frames: cv2 direct, thread pool", lambda: client.encode_images(frames), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
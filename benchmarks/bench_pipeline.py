@@ -0,0 +1,210 @@
+"""パイプライン全体のベンチマーク
+
+合成映像ソース（synthetic://）とOpenAI互換のスタブVLMサーバーを使い、カメラや
+有料APIなしで VideoProcessor を一定時間動かして以下を計測する。
+
+  - スループット（分析したセグメント数/秒、キャプチャFPS）
+  - セグメント処理時間・記録終了から公開までの遅延の p50/p95/p99
+  - CPU使用率（本プロセスと終了済みの子プロセス（ffmpeg）、スタブサーバーは含まない）とピークRSS
+
+結果はJSONで出力し、--baseline で保存済みの結果との差分を表示する。
+環境ごとに値が変わるため、比較は同じマシン・同じ設定で記録したベースライン同士で行う。
+
+使い方:
+    python benchmarks/bench_pipeline.py --duration 60 --output benchmarks/baselines/pipeline_memory.json
+    python benchmarks/bench_pipeline.py --duration 60 --baseline benchmarks/baselines/pipeline_memory.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+# 比較時に小さいほど良い指標（それ以外は大きいほど良い）
+LOWER_IS_BETTER = ("latency", "lag", "cpu", "rss", "failed", "dropped", "missed")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """線形補間による分位点"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def start_stub_server(args) -> subprocess.Popen:
+    """スタブVLMサーバーを子プロセスとして起動し、待ち受けを開始するまで待つ"""
+    process = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "stub_vlm_server.py"),
+         "--port", str(args.port),
+         "--latency-median", str(args.latency_median),
+         "--latency-sigma", str(args.latency_sigma),
+         "--failure-rate", str(args.failure_rate),
+         "--seed", str(args.seed)],
+        stdout=subprocess.PIPE, text=True
+    )
+    process.stdout.readline()
+    return process
+
+
+def configure_environment(args) -> None:
+    """ベンチマーク用の設定を環境変数で指定（.envより優先される）"""
+    os.environ.update({
+        "CAMERA_SOURCES": ",".join([args.source] * args.cameras),
+        "CAPTURE_INTERVAL": str(args.capture_interval),
+        "SEGMENT_MODE": args.segment_mode,
+        "VLM_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "VLM_BASE_URLS": "",
+        "VLM_API_KEY": "benchmark",
+        "VLM_MODEL": "stub-vlm",
+        "VLM_STREAMING": "true" if args.stream else "false",
+        # 履歴はすべてメモリ上に保持して集計に使う
+        "HISTORY_PATH": "",
+        "HISTORY_MEMORY_SIZE": "1000000",
+        "VLM_CACHE_ENABLED": "false",
+        "METRICS_PORT": "0",
+    })
+
+
+def cpu_seconds() -> Dict[str, float]:
+    """本プロセスと終了済み子プロセスのCPU時間（秒）"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"self": own.ru_utime + own.ru_stime, "children": children.ru_utime + children.ru_stime}
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """ピークRSS（MB、ru_maxrssはLinuxではKB、macOSではバイト単位）"""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor,
+    }
+
+
+def run_benchmark(args) -> dict:
+    """VideoProcessorを指定時間動かして計測結果を返す"""
+    configure_environment(args)
+
+    import metrics  # noqa: E402
+    from utils import setup_directories  # noqa: E402
+    from video_processor import VideoProcessor  # noqa: E402
+
+    setup_directories()
+    processor = VideoProcessor()
+    cpu_start = cpu_seconds()
+    wall_start = time.time()
+    processor.start()
+    time.sleep(args.duration)
+    # 計測区間はキャプチャ停止まで（処理中のセグメントは集計に含めない）
+    processor.stop()
+    wall = time.time() - wall_start
+    cpu_end = cpu_seconds()
+
+    records = processor.history_store.query(limit=1_000_000)
+    latencies = [record.latency for record in records]
+    snapshot = metrics.REGISTRY.snapshot()
+    lag = snapshot.get("vlm_analyzer_capture_to_description_seconds", {}).get("values", [])
+    frames = sum(value["value"] for value in snapshot["vlm_analyzer_capture_frames_total"]["values"])
+    dropped_frames = sum(
+        value["value"] for value in snapshot["vlm_analyzer_capture_dropped_frames_total"]["values"]
+    )
+    queue_stats = processor.get_queue_stats()
+    slo_stats = processor.get_slo_stats()
+    rss = peak_rss_mb()
+
+    return {
+        "segments_completed": len(records),
+        "segments_per_second": len(records) / wall,
+        "capture_fps": frames / wall / args.cameras,
+        "dropped_frames": dropped_frames,
+        "segment_latency_p50": percentile(latencies, 0.5),
+        "segment_latency_p95": percentile(latencies, 0.95),
+        "segment_latency_p99": percentile(latencies, 0.99),
+        # 遅延はヒストグラムのバケットから推定した値
+        "capture_to_description_lag_p50": lag[0]["p50"] if lag else 0.0,
+        "capture_to_description_lag_p95": lag[0]["p95"] if lag else 0.0,
+        "capture_to_description_lag_p99": lag[0]["p99"] if lag else 0.0,
+        "queue_dropped_segments": queue_stats["dropped_total"],
+        "vlm_timeouts": slo_stats.get("timeouts", 0),
+        "cpu_percent": 100 * (cpu_end["self"] - cpu_start["self"]) / wall,
+        "cpu_children_percent": 100 * (cpu_end["children"] - cpu_start["children"]) / wall,
+        "peak_rss_mb": rss["self"],
+        "peak_rss_children_mb": rss["children"],
+        "wall_seconds": wall,
+    }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """ベースラインとの差分を表示"""
+    print(f"{'metric':<34} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        change = (current - previous) / previous * 100 if previous else 0.0
+        worse = change > 0 if any(key in name for key in LOWER_IS_BETTER) else change < 0
+        marker = " !" if worse and abs(change) >= 10 else ""
+        print(f"{name:<34} {previous:>12.3f} {current:>12.3f} {change:>+8.1f}%{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パイプライン全体のベンチマーク（合成映像＋スタブVLM）")
+    parser.add_argument("--duration", type=float, default=60.0, help="計測時間（秒）")
+    parser.add_argument("--source", default="synthetic://1280x720@30",
+                        help="映像ソース（synthetic://幅x高さ@FPS、loop://ファイルパス、replay://記録ファイル?speed=N）")
+    parser.add_argument("--cameras", type=int, default=1, help="同じソースを使うカメラ数")
+    parser.add_argument("--capture-interval", type=int, default=5, help="セグメント間隔（秒）")
+    parser.add_argument("--segment-mode", choices=("file", "memory"), default="memory")
+    parser.add_argument("--stream", action="store_true", help="VLMの応答をストリーミングで受信")
+    parser.add_argument("--port", type=int, default=18080, help="スタブVLMサーバーのポート")
+    parser.add_argument("--latency-median", type=float, default=1.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.25)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="結果のJSONを保存するパス")
+    parser.add_argument("--baseline", type=Path, default=None, help="比較するベースラインのJSON")
+    args = parser.parse_args()
+
+    stub = start_stub_server(args)
+    try:
+        results = run_benchmark(args)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report = {
+        "settings": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("settings") != report["settings"]:
+            print("警告: ベースラインと設定が異なります", file=sys.stderr)
+        compare(results, baseline.get("results", {}))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""ベンチマーク用のOpenAI互換VLMスタブサーバー
+
+/v1/chat/completions（ストリーミング対応）と /v1/models を実装し、
+実際のモデルの代わりに固定の説明文を返す。レイテンシは対数正規分布
+（中央値とσを指定）に従って待機し、指定した割合でHTTP 500を返す。
+乱数のシードを固定するため、同じ設定では同じレイテンシ列になる。
+
+使い方:
+    python benchmarks/stub_vlm_server.py --port 18080 --latency-median 1.5 --latency-sigma 0.3 --failure-rate 0.05
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_TEXT = ("合成映像には画面を横切って移動する四角形と円が映っています。"
+                 "背景は左から右へ明るくなるグラデーションで、一定時間ごとに色味が切り替わります。")
+
+
+class StubSettings:
+    """スタブサーバーの応答設定"""
+
+    def __init__(self, latency_median: float = 1.0, latency_sigma: float = 0.25,
+                 failure_rate: float = 0.0, ttft_ratio: float = 0.3, seed: int = 0,
+                 model: str = "stub-vlm"):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.ttft_ratio = ttft_ratio
+        self.model = model
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    def sample(self):
+        """1リクエスト分のレイテンシ（秒）と失敗するかどうかを決める"""
+        with self._lock:
+            self.requests += 1
+            latency = self.latency_median * math.exp(self._rng.gauss(0.0, self.latency_sigma))
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        return latency, failed
+
+
+class StubVLMHandler(BaseHTTPRequestHandler):
+    """OpenAI互換APIのスタブハンドラ"""
+    protocol_version = "HTTP/1.1"
+    settings: StubSettings = StubSettings()
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.settings.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        latency, failed = self.settings.sample()
+        if failed:
+            time.sleep(latency * self.settings.ttft_ratio)
+            self._send_json(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            return
+
+        image_count = sum(
+            1 for message in request.get("messages", []) if isinstance(message.get("content"), list)
+            for part in message["content"] if part.get("type") == "image_url"
+        )
+        text = f"（画像{image_count}枚）{RESPONSE_TEXT}"
+        model = request.get("model", self.settings.model)
+        if request.get("stream"):
+            self._stream(text, model, latency, request.get("stream_options", {}).get("include_usage", False))
+        else:
+            time.sleep(latency)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(text), "total_tokens": len(text)},
+            })
+
+    def _stream(self, text: str, model: str, latency: float, include_usage: bool) -> None:
+        """Server-Sent Eventsで1文字ずつ返す（最初のトークンまで latency * ttft_ratio 秒）"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(choices: list, **extra) -> None:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices, **extra}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        ttft = latency * self.settings.ttft_ratio
+        interval = (latency - ttft) / max(1, len(text))
+        time.sleep(ttft)
+        for token in text:
+            send([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            time.sleep(interval)
+        send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            send([], usage={"prompt_tokens": 0, "completion_tokens": len(text), "total_tokens": len(text)})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host: str, port: int, settings: StubSettings) -> ThreadingHTTPServer:
+    """設定を指定してスタブサーバーを作成"""
+    handler = type("ConfiguredStubVLMHandler", (StubVLMHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI互換VLMスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-median", type=float, default=1.0, help="レイテンシの中央値（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.25, help="レイテンシの対数標準偏差")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="HTTP 500を返す割合（0〜1）")
+    parser.add_argument("--ttft-ratio", type=float, default=0.3, help="ストリーミング時にレイテンシのうち最初のトークンまでに使う割合")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = StubSettings(args.latency_median, args.latency_sigma, args.failure_rate, args.ttft_ratio, args.seed)
+    server = create_server(args.host, args.port, settings)
+    print(f"stub VLM server listening on http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import streamlit as st
-import cv2
 import time
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
 
+import config
 from utils import setup_directories, format_time, get_elapsed_time, get_segment_start_time
+from preview import PreviewEncoder
 from video_processor import VideoProcessor
 
 # 環境変数の読み込み
@@ -32,21 +33,40 @@ class VideoAnalysisPipeline:
         self.video_processor = VideoProcessor()
         self.is_running = False
         self.start_time = None
-        self.analysis_history = []
 
     def set_description(self, description: str):
         self.video_processor.set_description(description)
 
-    def get_description(self) -> str:
-        return self.video_processor.get_description()
+    def get_description(self, camera_id: int = 0) -> str:
+        return self.video_processor.get_description(camera_id)
 
-    def add_to_history(self, item: str):
-        """履歴にアイテムを追加"""
-        self.analysis_history.append(item)
+    def get_description_version(self, camera_id: int = 0) -> int:
+        return self.video_processor.get_description_version(camera_id)
 
-    def get_history(self) -> list:
-        """履歴を取得"""
-        return self.analysis_history
+    def get_history_version(self) -> int:
+        """履歴の版番号を取得（履歴が追加されるたびに増える）"""
+        return self.video_processor.history_store.version
+
+    @property
+    def camera_count(self) -> int:
+        return self.video_processor.camera_count
+
+    def get_history(self, limit: int = 50, offset: int = 0) -> list:
+        """今回の分析開始以降の履歴を新しい順に取得"""
+        if self.start_time is None:
+            return []
+        return self.video_processor.history_store.query(since=self.start_time.timestamp(),
+                                                        limit=limit, offset=offset)
+
+    def get_metrics(self) -> dict:
+        """各処理段の計測値のスナップショットを取得"""
+        return self.video_processor.get_metrics()
+
+    def get_history_count(self) -> int:
+        """今回の分析開始以降の履歴件数を取得"""
+        if self.start_time is None:
+            return 0
+        return self.video_processor.history_store.count(since=self.start_time.timestamp())
 
     def start(self):
         """パイプラインの開始"""
@@ -54,8 +74,6 @@ class VideoAnalysisPipeline:
         setup_directories()
         self.is_running = True
         self.start_time = datetime.now()
-        # 履歴更新コールバックを設定
-        self.video_processor.history_callback = self.add_to_history
         self.video_processor.start()
 
     def stop(self):
@@ -64,9 +82,13 @@ class VideoAnalysisPipeline:
         self.is_running = False
         self.video_processor.stop()
 
-    def update_frame(self):
-        """フレームを読み込み、必要に応じてセグメント化する"""
-        return self.video_processor.update_frame()
+    def get_latest_frame(self, camera_id: int = 0, out=None):
+        """キャプチャスレッドが取得した最新フレームと通算フレーム番号を取得（outは再利用するコピー先）"""
+        return self.video_processor.get_latest_frame(camera_id, out)
+
+    def get_frame_count(self, camera_id: int = 0) -> int:
+        """キャプチャスレッドが取得した通算フレーム数を取得"""
+        return self.video_processor.get_frame_count(camera_id)
 
     def get_elapsed_time(self) -> str:
         """経過時間を取得"""
@@ -76,6 +98,21 @@ class VideoAnalysisPipeline:
         """セグメント開始時間を取得"""
         return get_segment_start_time(self.start_time)
 
+def format_metrics_rows(snapshot: dict) -> list:
+    """計測値のスナップショットを表示用の行に変換"""
+    rows = []
+    for metric in snapshot.values():
+        for value in metric["values"]:
+            labels = ", ".join(f"{name}={label}" for name, label in value["labels"].items())
+            name = f"{metric['help']} ({labels})" if labels else metric["help"]
+            if metric["type"] == "histogram":
+                rows.append({"指標": name, "件数": value["count"],
+                             "p50": f"{value['p50']:.3g}", "p95": f"{value['p95']:.3g}"})
+            else:
+                rows.append({"指標": name, "件数": "", "p50": f"{value['value']:.3g}", "p95": ""})
+    return rows
+
+
 def render_ui(pipeline: VideoAnalysisPipeline):
     """UIレンダリング関数"""
     st.markdown("<h2 style='font-size: 28px;'>リアルタイムVLM分析システム</h2>", unsafe_allow_html=True)
@@ -92,6 +129,12 @@ def render_ui(pipeline: VideoAnalysisPipeline):
             st.rerun()
 
     if pipeline.is_running:
+        # 複数カメラの場合は表示するカメラを選択（履歴は全カメラ分を表示）
+        camera_id = 0
+        if pipeline.camera_count > 1:
+            camera_id = st.selectbox("表示するカメラ", range(pipeline.camera_count),
+                                     format_func=lambda i: f"カメラ{i + 1}")
+
         # 動画と説明文を横に並べるためのレイアウト
         video_col, description_col = st.columns([3, 2], gap="small")
 
@@ -101,64 +144,70 @@ def render_ui(pipeline: VideoAnalysisPipeline):
         with description_col:
             with st.container(height=300):
                 text_placeholder = st.empty()
+            # 履歴はページ単位で表示（1ページ目が最新）し、描画コストをセッションの長さによらず一定にする
+            # ページ数は分析中に増えるため上限は設けず、表示時に履歴件数で丸める
+            page_size = config.get_history_page_size()
+            page = st.number_input("履歴ページ", min_value=1, value=1, step=1)
+            page_caption_holder = st.empty()
             with st.container(height=500):
                 history_holder = st.empty()
-
-        # フレーム更新の処理
+            with st.expander("パイプライン指標"):
+                metrics_holder = st.empty()
+
+        # フレーム更新の処理（キャプチャは別スレッドで行い、ここでは最新フレームを表示するのみ）
+        # プレビューは PREVIEW_MAX_FPS・PREVIEW_MAX_SIZE に制限して縮小済みのJPEGを送信する
+        # 説明文と履歴は版番号が変わったときのみ再描画する
+        preview = PreviewEncoder()
+        last_description_version = -1
+        last_history_version = -1
+        next_metrics_time = 0.0
         while pipeline.is_running:
-            frame = pipeline.update_frame()
-
-            if frame is not None:
-                # 表示用に変換
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-                # 経過時間をビデオ画像上に表示
-                elapsed_time = pipeline.get_elapsed_time()
-                segment_start_time = pipeline.get_segment_start_time()
-
-                # OpenCVでフレームにテキストを追加
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                text = f"{elapsed_time}"
-                position = (10, 30)  # 左上に表示
-                font_scale = 0.8
-                color = (255, 255, 255)  # 白色
-                thickness = 2
-
-                # テキストの背景を黒に設定（視認性向上）
-                text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
-                cv2.rectangle(rgb_frame, (position[0]-5, position[1]-text_size[1]-5),
-                               (position[0]+text_size[0]+5, position[1]+5), (0, 0, 0), -1)
-                cv2.putText(rgb_frame, text, position, font, font_scale, color, thickness)
-
-                # 動画を表示
-                frame_placeholder.image(rgb_frame, channels="RGB", width="stretch")
-
-                # 最新の説明文と時間範囲を表示
-                description = pipeline.get_description()
+            # 新しいフレームが届いていなければ、コピー・エンコードせずに前回の表示を残す
+            if preview.is_due(frame_count=pipeline.get_frame_count(camera_id)):
+                frame, frame_count = pipeline.get_latest_frame(camera_id, out=preview.frame_buffer)
+                if frame is not None:
+                    preview.frame_buffer = frame
+                    # 経過時間をビデオ画像上に表示
+                    jpeg = preview.render(frame, frame_count, pipeline.get_elapsed_time())
+                    if jpeg is not None:
+                        frame_placeholder.image(jpeg, output_format="JPEG", width="stretch")
+
+            # 最新の説明文と時間範囲を表示
+            description_version = pipeline.get_description_version(camera_id)
+            if description_version != last_description_version:
+                last_description_version = description_version
+                description = pipeline.get_description(camera_id)
                 text_placeholder.info(f"**VLM分析結果**{description}")
 
-                # 履歴をテーブル形式で表示
-                history_items = pipeline.get_history()
-                if history_items:
-                    # テーブル形式で履歴を表示
+            # 履歴をテーブル形式で表示（新しい順）
+            history_version = pipeline.get_history_version()
+            if history_version != last_history_version:
+                last_history_version = history_version
+                page_count = max(1, -(-pipeline.get_history_count() // page_size))
+                shown_page = min(page, page_count)
+                page_caption_holder.caption(f"{shown_page} / {page_count} ページ")
+                history_records = pipeline.get_history(limit=page_size, offset=(shown_page - 1) * page_size)
+                if history_records:
                     history_data = []
-                    for item in reversed(history_items):
-                        # 時刻と分析結果に分ける（「（時刻）」の部分を抽出）
-                        if "（" in item and "）" in item:
-                            time_part = item.split("（")[1].split("）")[0]
-                            content = item.split("）\n\n")[1] if "）\n\n" in item else item
-                        else:
-                            time_part = "時刻不明"
-                            content = item
-
+                    for record in history_records:
+                        time_part = record.time_range
+                        if pipeline.camera_count > 1:
+                            time_part = f"カメラ{record.camera_id + 1} {time_part}"
                         history_data.append({
                             "時刻": time_part,
-                            "分析結果": content
+                            "分析結果": record.description
                         })
 
                     # テーブルを表示
                     history_holder.table(history_data)
 
+            # 計測値は1秒ごとに更新
+            if time.time() >= next_metrics_time:
+                next_metrics_time = time.time() + 1.0
+                metrics_rows = format_metrics_rows(pipeline.get_metrics())
+                if metrics_rows:
+                    metrics_holder.table(metrics_rows)
+
             time.sleep(0.03) # 約30fps
 
 def main():
@@ -0,0 +1,229 @@
+"""録画済み動画ファイルを一括で分析するバッチモード
+
+Streamlitアプリのように実時間で再生せず、動画を時間窓に区切って並列に処理する。
+各時間窓はffmpegの入力シークで直接読み込む（セグメントファイルへの再エンコードは行わない）。
+キーフレーム抽出はプロセスプールで複数の時間窓を同時に実行し、VLMリクエストは
+同時実行数を制限して送信する。結果は時間窓の順にタイムライン（JSONL/CSV）へ書き出す。
+
+使い方:
+    python src/batch_analyze.py recording.mp4 --output timeline.jsonl
+    python src/batch_analyze.py recording.mp4 --window 10 --output timeline.csv --workers 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import config
+from image_utils import ImageSource
+from keyframe_extractor import KeyframeExtractor
+from utils import format_time
+from vlm_client import VLMClient
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ["window", "start", "end", "start_time", "end_time", "keyframes", "keyframe_times", "description"]
+
+# プロセスプールのワーカーごとのキーフレーム抽出器
+_worker_extractor: Optional[KeyframeExtractor] = None
+
+
+def _init_worker() -> None:
+    """プロセスプールのワーカーを初期化"""
+    global _worker_extractor
+    # 中間ファイルが不要なため、キーフレームは常にffmpegの標準出力から受け取る
+    _worker_extractor = KeyframeExtractor(output="pipe")
+
+
+def _extract_window(video_path: str, window: int, start: float, duration: float) -> List[ImageSource]:
+    """時間窓のキーフレームを抽出（プロセスプールのワーカーで実行）"""
+    return _worker_extractor.extract_from_video(Path(video_path), window, start=start, duration=duration)
+
+
+def probe_duration(video_path: Path, ffprobe_path: str = "ffprobe") -> Optional[float]:
+    """ffprobeで動画の長さ（秒）を取得"""
+    try:
+        result = subprocess.run(
+            [ffprobe_path, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', str(video_path)],
+            check=True,
+            capture_output=True,
+            timeout=config.get_ffmpeg_timeout()
+        )
+        return float(result.stdout.decode().strip())
+    except FileNotFoundError:
+        logger.error(f"ffprobeが見つかりません。パスを確認してください: {ffprobe_path}")
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+        logger.error(f"動画の長さを取得できませんでした ({video_path}): {e}")
+    return None
+
+
+def split_windows(duration: float, window_seconds: float) -> List[Tuple[float, float]]:
+    """動画の長さを時間窓（開始秒, 長さ）に分割"""
+    windows = []
+    start = 0.0
+    while start < duration:
+        windows.append((start, min(window_seconds, duration - start)))
+        start += window_seconds
+    return windows
+
+
+def keyframe_times(keyframes: List[ImageSource], start: float, duration: float) -> List[Optional[float]]:
+    """キーフレームの動画先頭からの時刻（秒）を求める（時刻が分からない場合はNone）
+
+    diverse選択の候補フレームは fps フィルタで等間隔に抽出されているため、出力順の連番から求める。
+    """
+    if config.get_keyframe_selection() != "diverse":
+        return [None] * len(keyframes)
+    interval = duration / config.get_keyframe_candidate_count()
+    times: List[Optional[float]] = []
+    for keyframe in keyframes:
+        number = getattr(keyframe, 'number', None)
+        times.append(round(start + (number - 1) * interval, 3) if number is not None else None)
+    return times
+
+
+class TimelineWriter:
+    """分析結果を時間窓の順にJSONL/CSVへ書き出すクラス（完了順が前後しても順序を保つ）"""
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.is_csv = output_path.suffix.lower() == ".csv"
+        self.file = open(output_path, "w", encoding="utf-8", newline="")
+        self.csv_writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS) if self.is_csv else None
+        if self.csv_writer:
+            self.csv_writer.writeheader()
+        self.pending: Dict[int, dict] = {}
+        self.next_window = 0
+
+    def add(self, record: dict) -> None:
+        """結果を追加し、順番が来たものから書き出す"""
+        self.pending[record["window"]] = record
+        while self.next_window in self.pending:
+            self._write(self.pending.pop(self.next_window))
+            self.next_window += 1
+        self.file.flush()
+
+    def _write(self, record: dict) -> None:
+        if self.csv_writer:
+            row = dict(record)
+            row["keyframe_times"] = " ".join("" if t is None else f"{t:g}" for t in record["keyframe_times"])
+            row["description"] = record["description"] or ""
+            self.csv_writer.writerow(row)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+async def analyze_window(executor: ProcessPoolExecutor, vlm_client: VLMClient,
+                         vlm_semaphore: asyncio.Semaphore, window_slots: asyncio.Semaphore,
+                         video_path: Path, window: int, start: float, duration: float,
+                         prompt: Optional[str]) -> dict:
+    """1つの時間窓のキーフレームを抽出し、VLMで分析"""
+    loop = asyncio.get_running_loop()
+    async with window_slots:
+        keyframes = await loop.run_in_executor(executor, _extract_window, str(video_path), window, start, duration)
+        times = keyframe_times(keyframes, start, duration)
+        description = None
+        if keyframes:
+            labels = [format_time(int(t)) if t is not None else f"#{n + 1}" for n, t in enumerate(times)]
+            async with vlm_semaphore:
+                description = await vlm_client.aanalyze_images(keyframes, prompt=prompt, labels=labels)
+        else:
+            logger.warning(f"時間窓 {window} ({format_time(int(start))}) のキーフレームを抽出できませんでした")
+
+    return {
+        "window": window,
+        "start": round(start, 3),
+        "end": round(start + duration, 3),
+        "start_time": format_time(int(start)),
+        "end_time": format_time(int(start + duration)),
+        "keyframes": len(keyframes),
+        "keyframe_times": times,
+        "description": description,
+    }
+
+
+async def run(video_path: Path, output_path: Path, window_seconds: float, workers: int,
+              concurrency: int, prompt: Optional[str]) -> int:
+    """動画全体を分析してタイムラインを書き出す（失敗した時間窓の数を返す）"""
+    duration = probe_duration(video_path)
+    if duration is None:
+        return -1
+    windows = split_windows(duration, window_seconds)
+    logger.info(f"{video_path} ({duration:.1f} 秒) を {len(windows)} 個の時間窓に分割しました "
+                f"(ワーカー数: {workers}, VLM同時実行数: {concurrency})")
+
+    vlm_client = VLMClient()
+    vlm_semaphore = asyncio.Semaphore(concurrency)
+    # 抽出済みでVLM待ちのキーフレームを溜め込みすぎないよう、処理中の時間窓数を制限する
+    window_slots = asyncio.Semaphore(workers + concurrency * 2)
+    writer = TimelineWriter(output_path)
+    failures = 0
+    started = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        tasks = [
+            asyncio.create_task(analyze_window(executor, vlm_client, vlm_semaphore, window_slots,
+                                               video_path, window, start, length, prompt))
+            for window, (start, length) in enumerate(windows)
+        ]
+        try:
+            for completed, task in enumerate(asyncio.as_completed(tasks), start=1):
+                record = await task
+                if record["description"] is None:
+                    failures += 1
+                writer.add(record)
+                logger.info(f"進捗: {completed}/{len(windows)} (経過 {time.time() - started:.1f} 秒)")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            await vlm_client.aclose()
+
+    elapsed = time.time() - started
+    logger.info(f"タイムラインを書き出しました: {output_path} (処理時間 {elapsed:.1f} 秒, "
+                f"動画の {duration / elapsed:.1f} 倍速, 失敗 {failures} 件)")
+    cache_stats = vlm_client.get_cache_stats()
+    if cache_stats is not None:
+        logger.info(f"VLM応答キャッシュ: {cache_stats}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録画済み動画ファイルを時間窓ごとに一括分析")
+    parser.add_argument("video", type=Path, help="分析する動画ファイル")
+    parser.add_argument("--output", type=Path, default=Path("timeline.jsonl"),
+                        help="タイムラインの出力先（拡張子 .csv ならCSV、それ以外はJSONL）")
+    parser.add_argument("--window", type=float, default=config.get_capture_interval(),
+                        help="時間窓の長さ（秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="キーフレーム抽出のプロセス数")
+    parser.add_argument("--concurrency", type=int, default=config.get_vlm_max_concurrency(),
+                        help="VLMへの同時リクエスト数")
+    parser.add_argument("--prompt", default=None, help="プロンプト（未指定の場合は VLM_PROMPT）")
+    args = parser.parse_args()
+
+    if not args.video.is_file():
+        parser.error(f"動画ファイルが見つかりません: {args.video}")
+    if args.window <= 0:
+        parser.error("--window には正の値を指定してください")
+
+    failures = asyncio.run(run(args.video, args.output, args.window, max(1, args.workers),
+                               max(1, args.concurrency), args.prompt))
+    sys.exit(0 if failures == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
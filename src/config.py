@@ -6,7 +6,7 @@
 from pathlib import Path
 from dotenv import load_dotenv
 import os
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List, Optional
 
 # .envファイルを読み込む
 load_dotenv()
@@ -15,15 +15,77 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent
 OUTPUT_DIR = BASE_DIR.parent / "captured_videos"
 KEYFRAMES_DIR = BASE_DIR.parent / "keyframes"
+DEFAULT_HISTORY_PATH = BASE_DIR.parent / "analysis_history.sqlite3"
 
 # デフォルト値の定義（型ヒント付き）
 DEFAULT_CAPTURE_INTERVAL: int = 5
 DEFAULT_CAMERA_INDEX: int = 0
 DEFAULT_TARGET_FPS: float = 30.0
+DEFAULT_FRAME_BUFFER_SIZE: int = 8
+DEFAULT_SEGMENT_MODE: str = "file"
+SEGMENT_MODES: Tuple[str, ...] = ("file", "memory")
+DEFAULT_MEMORY_SEGMENT_CANDIDATE_COUNT: int = 15
+DEFAULT_SEGMENT_WRITER_BACKEND: str = "opencv"
+SEGMENT_WRITER_BACKENDS: Tuple[str, ...] = ("opencv", "ffmpeg")
+DEFAULT_SEGMENT_ENCODER_CODEC: str = "libx264"
+DEFAULT_SEGMENT_ENCODER_PRESET: str = "veryfast"
+DEFAULT_SEGMENT_ANALYSIS_RESOLUTION: bool = False
+DEFAULT_SEGMENT_TRIGGER: str = "time"
+SEGMENT_TRIGGERS: Tuple[str, ...] = ("time", "motion")
+DEFAULT_MOTION_THRESHOLD: float = 0.002
+DEFAULT_MOTION_HEARTBEAT_INTERVAL: int = 60
+DEFAULT_MOTION_MIN_SEGMENT_SECONDS: float = 1.0
 DEFAULT_VLM_MODEL: str = "gpt-4o"
 DEFAULT_VLM_IMAGE_MAX_SIZE: Tuple[int, int] = (800, 800)
+DEFAULT_VLM_IMAGE_RESAMPLE: str = "lanczos"
+DEFAULT_VLM_IMAGE_JPEG_QUALITY: int = 95
+DEFAULT_VLM_ENCODE_WORKERS: int = min(4, os.cpu_count() or 1)
+VLM_IMAGE_RESAMPLE_FILTERS: Tuple[str, ...] = ("lanczos", "bicubic", "bilinear", "area", "nearest")
 DEFAULT_FFMPEG_KEYFRAME_COUNT: int = 5
+DEFAULT_FFMPEG_MAX_CONCURRENCY: int = 2
+DEFAULT_FFMPEG_TIMEOUT: float = 30.0
+DEFAULT_KEYFRAME_OUTPUT: str = "file"
+KEYFRAME_OUTPUTS: Tuple[str, ...] = ("file", "pipe")
+DEFAULT_KEYFRAME_SELECTION: str = "diverse"
+KEYFRAME_SELECTIONS: Tuple[str, ...] = ("iframe", "diverse")
+DEFAULT_KEYFRAME_CANDIDATE_COUNT: int = 15
+DEFAULT_KEYFRAME_MIN_COUNT: int = 1
+DEFAULT_KEYFRAME_DIVERSITY_THRESHOLD: float = 0.08
 DEFAULT_VLM_PROMPT: str = "動画の内容を簡潔に200文字以内で説明してください。"
+DEFAULT_VLM_MAX_CONCURRENCY: int = 2
+DEFAULT_VLM_EJECT_FAILURES: int = 3
+DEFAULT_VLM_EJECT_COOLOFF: float = 30.0
+DEFAULT_VLM_HEALTH_CHECK_INTERVAL: float = 10.0
+DEFAULT_VLM_REQUEST_TIMEOUT: float = 60.0
+DEFAULT_VLM_HEDGE_ENABLED: bool = False
+DEFAULT_VLM_MAX_LAG: float = 0.0
+DEFAULT_VLM_RESULT_REORDER_LIMIT: int = 8
+DEFAULT_VLM_STREAMING: bool = False
+DEFAULT_VLM_CACHE_ENABLED: bool = False
+DEFAULT_VLM_CACHE_MAX_ENTRIES: int = 256
+DEFAULT_VLM_CACHE_MAX_BYTES: int = 100 * 1024 * 1024
+DEFAULT_HISTORY_MEMORY_SIZE: int = 200
+DEFAULT_HISTORY_PAGE_SIZE: int = 20
+DEFAULT_PREVIEW_MAX_FPS: float = 10.0
+DEFAULT_PREVIEW_MAX_SIZE: Tuple[int, int] = (960, 540)
+DEFAULT_PREVIEW_JPEG_QUALITY: int = 70
+DEFAULT_METRICS_HOST: str = "127.0.0.1"
+DEFAULT_METRICS_PORT: int = 0
+DEFAULT_SESSION_RECORD_JPEG_QUALITY: int = 90
+DEFAULT_SESSION_RECORD_CHUNK_FRAMES: int = 64
+DEFAULT_VLM_IMAGE_MODE: str = "separate"
+VLM_IMAGE_MODES: Tuple[str, ...] = ("separate", "mosaic")
+DEFAULT_VLM_MOSAIC_TILE_SIZE: Tuple[int, int] = (400, 225)
+DEFAULT_VLM_MOSAIC_PROMPT: str = ("画像は動画から時系列順に抽出したフレームを左上から右へ、上段から下段へ並べたタイル画像です。"
+                                  "各タイルの左上に撮影時刻を表示しています。")
+DEFAULT_SCENE_DEDUP_ENABLED: bool = False
+DEFAULT_SCENE_DEDUP_THRESHOLD: int = 6
+DEFAULT_SCENE_DEDUP_HASH: str = "dhash"
+SCENE_DEDUP_HASHES: Tuple[str, ...] = ("ahash", "dhash")
+DEFAULT_SEGMENT_QUEUE_MAX_SIZE: int = 10
+DEFAULT_SEGMENT_QUEUE_POLICY: str = "drop_oldest"
+DEFAULT_SEGMENT_QUEUE_COALESCE_MAX_FILES: int = 3
+SEGMENT_QUEUE_POLICIES: Tuple[str, ...] = ("drop_oldest", "drop_newest", "latest_wins", "coalesce")
 
 
 def get_capture_interval() -> int:
@@ -36,10 +98,13 @@ def get_capture_interval() -> int:
 
 def get_camera_source() -> int | str:
     """カメラソース(インデックスまたはURL)を取得"""
-    camera_source = os.getenv("CAMERA_SOURCE", DEFAULT_CAMERA_INDEX)
+    return _parse_camera_source(os.getenv("CAMERA_SOURCE", DEFAULT_CAMERA_INDEX))
 
-    # 文字列の場合はそのまま返す（URL形式の場合）
-    if isinstance(camera_source, str) and (camera_source.startswith('http://') or camera_source.startswith('https://')):
+
+def _parse_camera_source(camera_source: int | str) -> int | str:
+    """カメラソースの設定値をインデックスまたはURLに変換"""
+    # 文字列の場合はそのまま返す（URL形式・合成映像ソース・セッション再生の場合）
+    if isinstance(camera_source, str) and camera_source.startswith(('http://', 'https://', 'synthetic://', 'loop://', 'replay://')):
         return camera_source
 
     # 数値に変換可能な場合、数値として扱う
@@ -49,6 +114,25 @@ def get_camera_source() -> int | str:
         return DEFAULT_CAMERA_INDEX
 
 
+def get_camera_sources() -> List[int | str]:
+    """複数カメラのソース一覧を取得（CAMERA_SOURCES をカンマ区切りで指定、未設定の場合は CAMERA_SOURCE のみ）"""
+    sources_str = os.getenv("CAMERA_SOURCES", "")
+    sources = [_parse_camera_source(source.strip()) for source in sources_str.split(",") if source.strip()]
+    return sources or [get_camera_source()]
+
+
+def get_camera_weights() -> List[int]:
+    """カメラごとのVLM分析の重み（CAMERA_WEIGHTS をカンマ区切りで指定、未指定のカメラは1）を取得"""
+    count = len(get_camera_sources())
+    weights = [1] * count
+    for index, weight_str in enumerate(os.getenv("CAMERA_WEIGHTS", "").split(",")[:count]):
+        try:
+            weights[index] = max(1, int(weight_str))
+        except ValueError:
+            pass
+    return weights
+
+
 def get_target_fps() -> float:
     """ターゲットFPSを取得"""
     try:
@@ -57,6 +141,125 @@ def get_target_fps() -> float:
         return DEFAULT_TARGET_FPS
 
 
+def get_frame_buffer_size() -> int:
+    """フレームリングバッファのフレーム数を取得"""
+    try:
+        return max(1, int(os.getenv("FRAME_BUFFER_SIZE", DEFAULT_FRAME_BUFFER_SIZE)))
+    except ValueError:
+        return DEFAULT_FRAME_BUFFER_SIZE
+
+
+def get_segment_mode() -> str:
+    """セグメントモード（file: mp4に記録 / memory: 候補フレームをメモリ上に保持）を取得"""
+    mode = os.getenv("SEGMENT_MODE", DEFAULT_SEGMENT_MODE).strip().lower()
+    if mode in SEGMENT_MODES:
+        return mode
+    return DEFAULT_SEGMENT_MODE
+
+
+def get_segment_writer_backend() -> str:
+    """fileモードのセグメント書き出し方式（opencv: セグメントごとにVideoWriter / ffmpeg: 常駐ffmpegプロセス）を取得"""
+    backend = os.getenv("SEGMENT_WRITER_BACKEND", DEFAULT_SEGMENT_WRITER_BACKEND).strip().lower()
+    if backend in SEGMENT_WRITER_BACKENDS:
+        return backend
+    return DEFAULT_SEGMENT_WRITER_BACKEND
+
+
+def get_segment_encoder_codec() -> str:
+    """ffmpegバックエンドで使用するエンコーダ名を取得"""
+    return os.getenv("SEGMENT_ENCODER_CODEC", DEFAULT_SEGMENT_ENCODER_CODEC).strip() or DEFAULT_SEGMENT_ENCODER_CODEC
+
+
+def get_segment_encoder_preset() -> str:
+    """ffmpegバックエンドのエンコードプリセットを取得（空文字の場合は指定しない）"""
+    return os.getenv("SEGMENT_ENCODER_PRESET", DEFAULT_SEGMENT_ENCODER_PRESET).strip()
+
+
+def get_segment_encoder_size() -> Optional[Tuple[int, int]]:
+    """ffmpegバックエンドのエンコード解像度（幅,高さ）を取得（未設定の場合は入力解像度のまま）"""
+    size_str = os.getenv("SEGMENT_ENCODER_SIZE", "")
+    if size_str:
+        try:
+            width, height = map(int, size_str.split(","))
+            if width > 0 and height > 0:
+                return (width, height)
+        except (ValueError, TypeError):
+            pass
+    return None
+
+
+def get_segment_analysis_resolution() -> bool:
+    """セグメントを分析用解像度（VLM_IMAGE_MAX_SIZE）に縮小して記録するかを取得"""
+    value = os.getenv("SEGMENT_ANALYSIS_RESOLUTION")
+    if value is None:
+        return DEFAULT_SEGMENT_ANALYSIS_RESOLUTION
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_memory_segment_candidate_count() -> int:
+    """memoryモードで1セグメントあたりに保持する候補フレーム数を取得"""
+    try:
+        return max(1, int(os.getenv("MEMORY_SEGMENT_CANDIDATE_COUNT", DEFAULT_MEMORY_SEGMENT_CANDIDATE_COUNT)))
+    except ValueError:
+        return DEFAULT_MEMORY_SEGMENT_CANDIDATE_COUNT
+
+
+def get_segment_trigger() -> str:
+    """セグメント区切り方式（time: 一定間隔 / motion: 動き検知で省略・早期区切り）を取得"""
+    trigger = os.getenv("SEGMENT_TRIGGER", DEFAULT_SEGMENT_TRIGGER).strip().lower()
+    if trigger in SEGMENT_TRIGGERS:
+        return trigger
+    return DEFAULT_SEGMENT_TRIGGER
+
+
+def get_motion_threshold() -> float:
+    """動きありと判定する、フレーム間で変化した画素の割合のしきい値（0〜1）を取得"""
+    try:
+        return float(os.getenv("MOTION_THRESHOLD", DEFAULT_MOTION_THRESHOLD))
+    except ValueError:
+        return DEFAULT_MOTION_THRESHOLD
+
+
+def get_motion_heartbeat_interval() -> int:
+    """動きがない場合に分析対象とするセグメントの間隔（秒、0で常に省略）を取得"""
+    try:
+        return max(0, int(os.getenv("MOTION_HEARTBEAT_INTERVAL", DEFAULT_MOTION_HEARTBEAT_INTERVAL)))
+    except ValueError:
+        return DEFAULT_MOTION_HEARTBEAT_INTERVAL
+
+
+def get_motion_min_segment_seconds() -> float:
+    """動きの開始でセグメントを区切る際の最小セグメント長（秒）を取得"""
+    try:
+        return float(os.getenv("MOTION_MIN_SEGMENT_SECONDS", DEFAULT_MOTION_MIN_SEGMENT_SECONDS))
+    except ValueError:
+        return DEFAULT_MOTION_MIN_SEGMENT_SECONDS
+
+
+def get_segment_queue_max_size() -> int:
+    """セグメントキューの最大長を取得"""
+    try:
+        return max(1, int(os.getenv("SEGMENT_QUEUE_MAX_SIZE", DEFAULT_SEGMENT_QUEUE_MAX_SIZE)))
+    except ValueError:
+        return DEFAULT_SEGMENT_QUEUE_MAX_SIZE
+
+
+def get_segment_queue_policy() -> str:
+    """セグメントキューが満杯の場合のポリシーを取得"""
+    policy = os.getenv("SEGMENT_QUEUE_POLICY", DEFAULT_SEGMENT_QUEUE_POLICY).strip().lower()
+    if policy in SEGMENT_QUEUE_POLICIES:
+        return policy
+    return DEFAULT_SEGMENT_QUEUE_POLICY
+
+
+def get_segment_queue_coalesce_max_files() -> int:
+    """coalesceポリシーで1つに統合するセグメントファイル数の上限を取得"""
+    try:
+        return max(1, int(os.getenv("SEGMENT_QUEUE_COALESCE_MAX_FILES", DEFAULT_SEGMENT_QUEUE_COALESCE_MAX_FILES)))
+    except ValueError:
+        return DEFAULT_SEGMENT_QUEUE_COALESCE_MAX_FILES
+
+
 def get_vlm_config() -> Dict[str, Any]:
     """VLM設定を取得"""
     config = {
@@ -72,6 +275,140 @@ def get_vlm_config() -> Dict[str, Any]:
     return config
 
 
+def get_vlm_base_urls() -> List[Optional[str]]:
+    """VLMエンドポイントのベースURL一覧を取得（VLM_BASE_URLS をカンマ区切りで指定、未設定の場合は VLM_BASE_URL）"""
+    base_urls = [url.strip() for url in os.getenv("VLM_BASE_URLS", "").split(",") if url.strip()]
+    return base_urls or [os.getenv("VLM_BASE_URL") or None]
+
+
+def get_vlm_max_concurrency() -> int:
+    """VLMへの同時リクエスト数の上限を取得（未設定の場合はエンドポイント数に比例）"""
+    default = DEFAULT_VLM_MAX_CONCURRENCY * len(get_vlm_base_urls())
+    try:
+        return max(1, int(os.getenv("VLM_MAX_CONCURRENCY", default)))
+    except ValueError:
+        return default
+
+
+def get_vlm_eject_failures() -> int:
+    """エンドポイントを切り離すまでの連続失敗回数を取得"""
+    try:
+        return max(1, int(os.getenv("VLM_EJECT_FAILURES", DEFAULT_VLM_EJECT_FAILURES)))
+    except ValueError:
+        return DEFAULT_VLM_EJECT_FAILURES
+
+
+def get_vlm_eject_cooloff() -> float:
+    """切り離したエンドポイントを復帰させるまでの待機時間（秒）を取得"""
+    try:
+        return max(0.0, float(os.getenv("VLM_EJECT_COOLOFF", DEFAULT_VLM_EJECT_COOLOFF)))
+    except ValueError:
+        return DEFAULT_VLM_EJECT_COOLOFF
+
+
+def get_vlm_health_check_interval() -> float:
+    """エンドポイントのヘルスチェック間隔（秒、0で無効）を取得"""
+    try:
+        return max(0.0, float(os.getenv("VLM_HEALTH_CHECK_INTERVAL", DEFAULT_VLM_HEALTH_CHECK_INTERVAL)))
+    except ValueError:
+        return DEFAULT_VLM_HEALTH_CHECK_INTERVAL
+
+
+def get_vlm_request_timeout() -> float:
+    """VLMリクエスト1件あたりのタイムアウト（秒）を取得"""
+    try:
+        value = float(os.getenv("VLM_REQUEST_TIMEOUT", DEFAULT_VLM_REQUEST_TIMEOUT))
+        return value if value > 0 else DEFAULT_VLM_REQUEST_TIMEOUT
+    except ValueError:
+        return DEFAULT_VLM_REQUEST_TIMEOUT
+
+
+def get_vlm_hedge_enabled() -> bool:
+    """応答がp95レイテンシを超えたときのヘッジリクエストの有効/無効を取得"""
+    value = os.getenv("VLM_HEDGE_ENABLED")
+    if value is None:
+        return DEFAULT_VLM_HEDGE_ENABLED
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_vlm_streaming() -> bool:
+    """VLMの応答をストリーミングで受信し、途中経過を表示するかを取得"""
+    value = os.getenv("VLM_STREAMING")
+    if value is None:
+        return DEFAULT_VLM_STREAMING
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_vlm_cache_enabled() -> bool:
+    """VLM応答キャッシュ（同じ画像・プロンプトならVLM呼び出しを省略）の有効/無効を取得"""
+    value = os.getenv("VLM_CACHE_ENABLED")
+    if value is None:
+        return DEFAULT_VLM_CACHE_ENABLED
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_vlm_cache_max_entries() -> int:
+    """VLM応答キャッシュのメモリ上の最大件数を取得"""
+    try:
+        return max(1, int(os.getenv("VLM_CACHE_MAX_ENTRIES", DEFAULT_VLM_CACHE_MAX_ENTRIES)))
+    except ValueError:
+        return DEFAULT_VLM_CACHE_MAX_ENTRIES
+
+
+def get_vlm_cache_path() -> Optional[Path]:
+    """VLM応答キャッシュのSQLiteファイルのパスを取得（未設定の場合はメモリのみ）"""
+    value = os.getenv("VLM_CACHE_PATH", "").strip()
+    return Path(value) if value else None
+
+
+def get_vlm_cache_max_bytes() -> int:
+    """VLM応答キャッシュのディスク上の最大サイズ（バイト）を取得"""
+    try:
+        return max(0, int(os.getenv("VLM_CACHE_MAX_BYTES", DEFAULT_VLM_CACHE_MAX_BYTES)))
+    except ValueError:
+        return DEFAULT_VLM_CACHE_MAX_BYTES
+
+
+def get_vlm_max_lag() -> float:
+    """分析結果の許容遅延（秒、セグメントの記録終了から表示まで。0で無制限）を取得"""
+    try:
+        return max(0.0, float(os.getenv("VLM_MAX_LAG", DEFAULT_VLM_MAX_LAG)))
+    except ValueError:
+        return DEFAULT_VLM_MAX_LAG
+
+
+def get_vlm_result_reorder_limit() -> int:
+    """先行セグメントの完了を待つ後続の分析結果の上限件数（カメラごと）を取得"""
+    try:
+        return max(1, int(os.getenv("VLM_RESULT_REORDER_LIMIT", DEFAULT_VLM_RESULT_REORDER_LIMIT)))
+    except ValueError:
+        return DEFAULT_VLM_RESULT_REORDER_LIMIT
+
+
+def get_scene_dedup_enabled() -> bool:
+    """シーン重複判定（変化がなければVLM呼び出しを省略）の有効/無効を取得"""
+    value = os.getenv("SCENE_DEDUP_ENABLED")
+    if value is None:
+        return DEFAULT_SCENE_DEDUP_ENABLED
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_scene_dedup_threshold() -> int:
+    """シーン重複とみなすハミング距離のしきい値（0〜64）を取得"""
+    try:
+        return int(os.getenv("SCENE_DEDUP_THRESHOLD", DEFAULT_SCENE_DEDUP_THRESHOLD))
+    except ValueError:
+        return DEFAULT_SCENE_DEDUP_THRESHOLD
+
+
+def get_scene_dedup_hash() -> str:
+    """シーン重複判定に使う知覚ハッシュの種類を取得"""
+    method = os.getenv("SCENE_DEDUP_HASH", DEFAULT_SCENE_DEDUP_HASH).strip().lower()
+    if method in SCENE_DEDUP_HASHES:
+        return method
+    return DEFAULT_SCENE_DEDUP_HASH
+
+
 def get_vlm_image_max_size() -> Tuple[int, int]:
     """VLM画像の最大サイズを取得"""
     size_str = os.getenv("VLM_IMAGE_MAX_SIZE", "")
@@ -84,6 +421,68 @@ def get_vlm_image_max_size() -> Tuple[int, int]:
     return DEFAULT_VLM_IMAGE_MAX_SIZE
 
 
+def get_vlm_image_mode() -> str:
+    """VLMへの画像送信方式（separate: キーフレームごと / mosaic: 1枚のタイル画像）を取得"""
+    mode = os.getenv("VLM_IMAGE_MODE", DEFAULT_VLM_IMAGE_MODE).strip().lower()
+    if mode in VLM_IMAGE_MODES:
+        return mode
+    return DEFAULT_VLM_IMAGE_MODE
+
+
+def get_vlm_mosaic_grid() -> Optional[Tuple[int, int]]:
+    """モザイク画像のグリッド（列数,行数）を取得（未設定の場合は画像数から自動決定）"""
+    grid_str = os.getenv("VLM_MOSAIC_GRID", "")
+    if grid_str:
+        try:
+            cols, rows = map(int, grid_str.split(","))
+            if cols > 0 and rows > 0:
+                return (cols, rows)
+        except (ValueError, TypeError):
+            pass
+    return None
+
+
+def get_vlm_mosaic_tile_size() -> Tuple[int, int]:
+    """モザイク画像のタイルサイズ（幅,高さ）を取得"""
+    size_str = os.getenv("VLM_MOSAIC_TILE_SIZE", "")
+    if size_str:
+        try:
+            width, height = map(int, size_str.split(","))
+            return (width, height)
+        except (ValueError, TypeError):
+            pass
+    return DEFAULT_VLM_MOSAIC_TILE_SIZE
+
+
+def get_vlm_mosaic_prompt() -> str:
+    """モザイク画像送信時にプロンプトへ追加する説明文を取得"""
+    return os.getenv("VLM_MOSAIC_PROMPT", DEFAULT_VLM_MOSAIC_PROMPT)
+
+
+def get_vlm_image_resample() -> str:
+    """VLM画像リサイズ時のリサンプリングフィルタ名を取得"""
+    name = os.getenv("VLM_IMAGE_RESAMPLE", DEFAULT_VLM_IMAGE_RESAMPLE).strip().lower()
+    if name in VLM_IMAGE_RESAMPLE_FILTERS:
+        return name
+    return DEFAULT_VLM_IMAGE_RESAMPLE
+
+
+def get_vlm_image_jpeg_quality() -> int:
+    """VLM画像のJPEG品質（1〜100）を取得"""
+    try:
+        return min(100, max(1, int(os.getenv("VLM_IMAGE_JPEG_QUALITY", DEFAULT_VLM_IMAGE_JPEG_QUALITY))))
+    except ValueError:
+        return DEFAULT_VLM_IMAGE_JPEG_QUALITY
+
+
+def get_vlm_encode_workers() -> int:
+    """キーフレームを並列エンコードするスレッド数を取得"""
+    try:
+        return max(1, int(os.getenv("VLM_ENCODE_WORKERS", DEFAULT_VLM_ENCODE_WORKERS)))
+    except ValueError:
+        return DEFAULT_VLM_ENCODE_WORKERS
+
+
 def get_ffmpeg_keyframe_count() -> int:
     """FFmpegキーフレーム数を取得"""
     try:
@@ -92,8 +491,74 @@ def get_ffmpeg_keyframe_count() -> int:
         return DEFAULT_FFMPEG_KEYFRAME_COUNT
 
 
-def get_ffmpeg_keyframe_args() -> list:
-    """FFmpegキーフレーム抽出引数を取得"""
+def get_ffmpeg_max_concurrency() -> int:
+    """同時に実行するffmpegキーフレーム抽出プロセス数の上限を取得"""
+    try:
+        return max(1, int(os.getenv("FFMPEG_MAX_CONCURRENCY", DEFAULT_FFMPEG_MAX_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_FFMPEG_MAX_CONCURRENCY
+
+
+def get_ffmpeg_timeout() -> float:
+    """ffmpegキーフレーム抽出のタイムアウト（秒）を取得"""
+    try:
+        return float(os.getenv("FFMPEG_TIMEOUT", DEFAULT_FFMPEG_TIMEOUT))
+    except ValueError:
+        return DEFAULT_FFMPEG_TIMEOUT
+
+
+def get_keyframe_output() -> str:
+    """キーフレームの受け渡し方式（file: keyframesディレクトリ経由 / pipe: ffmpegの標準出力から直接）を取得"""
+    output = os.getenv("KEYFRAME_OUTPUT", DEFAULT_KEYFRAME_OUTPUT).strip().lower()
+    if output in KEYFRAME_OUTPUTS:
+        return output
+    return DEFAULT_KEYFRAME_OUTPUT
+
+
+def get_keyframe_selection() -> str:
+    """キーフレーム選択方式（iframe: 先頭からN枚のIフレーム / diverse: 多様性に基づく選択）を取得"""
+    selection = os.getenv("KEYFRAME_SELECTION", DEFAULT_KEYFRAME_SELECTION).strip().lower()
+    if selection in KEYFRAME_SELECTIONS:
+        return selection
+    return DEFAULT_KEYFRAME_SELECTION
+
+
+def get_keyframe_candidate_count() -> int:
+    """diverse選択時にffmpegで抽出する候補フレーム数を取得"""
+    try:
+        return max(1, int(os.getenv("KEYFRAME_CANDIDATE_COUNT", DEFAULT_KEYFRAME_CANDIDATE_COUNT)))
+    except ValueError:
+        return DEFAULT_KEYFRAME_CANDIDATE_COUNT
+
+
+def get_keyframe_min_count() -> int:
+    """diverse選択時の最小キーフレーム数を取得"""
+    try:
+        return max(1, int(os.getenv("KEYFRAME_MIN_COUNT", DEFAULT_KEYFRAME_MIN_COUNT)))
+    except ValueError:
+        return DEFAULT_KEYFRAME_MIN_COUNT
+
+
+def get_keyframe_diversity_threshold() -> float:
+    """diverse選択を打ち切るフレーム間距離のしきい値（0〜1）を取得"""
+    try:
+        return float(os.getenv("KEYFRAME_DIVERSITY_THRESHOLD", DEFAULT_KEYFRAME_DIVERSITY_THRESHOLD))
+    except ValueError:
+        return DEFAULT_KEYFRAME_DIVERSITY_THRESHOLD
+
+
+def get_ffmpeg_keyframe_args(duration: Optional[float] = None) -> list:
+    """FFmpegキーフレーム抽出引数を取得（duration: 抽出対象の長さ（秒）、未指定の場合は CAPTURE_INTERVAL）"""
+    if get_keyframe_selection() == "diverse":
+        # セグメント全体から等間隔に候補フレームを抽出し、選択はPython側で行う
+        candidate_count = get_keyframe_candidate_count()
+        if duration is None or duration <= 0:
+            duration = get_capture_interval()
+        return [
+            '-vf', f'fps={candidate_count}/{duration:g}',
+            '-frames:v', str(candidate_count)  # 候補フレーム数
+        ]
+
     # キーフレーム数を動的に取得
     keyframe_count = str(get_ffmpeg_keyframe_count())
     return [
@@ -108,6 +573,95 @@ def get_vlm_prompt() -> str:
     return os.getenv("VLM_PROMPT", DEFAULT_VLM_PROMPT)
 
 
+def get_history_path() -> Optional[Path]:
+    """分析結果履歴のSQLiteファイルのパスを取得（空文字の場合はメモリ上の直近分のみ）"""
+    value = os.getenv("HISTORY_PATH")
+    if value is None:
+        return DEFAULT_HISTORY_PATH
+    return Path(value.strip()) if value.strip() else None
+
+
+def get_history_memory_size() -> int:
+    """メモリ上に保持する分析結果履歴の件数を取得"""
+    try:
+        return max(1, int(os.getenv("HISTORY_MEMORY_SIZE", DEFAULT_HISTORY_MEMORY_SIZE)))
+    except ValueError:
+        return DEFAULT_HISTORY_MEMORY_SIZE
+
+
+def get_history_page_size() -> int:
+    """画面に表示する履歴の1ページあたりの件数を取得"""
+    try:
+        return max(1, int(os.getenv("HISTORY_PAGE_SIZE", DEFAULT_HISTORY_PAGE_SIZE)))
+    except ValueError:
+        return DEFAULT_HISTORY_PAGE_SIZE
+
+
+def get_preview_max_fps() -> float:
+    """ライブプレビューの最大表示FPSを取得"""
+    try:
+        value = float(os.getenv("PREVIEW_MAX_FPS", DEFAULT_PREVIEW_MAX_FPS))
+        return value if value > 0 else DEFAULT_PREVIEW_MAX_FPS
+    except ValueError:
+        return DEFAULT_PREVIEW_MAX_FPS
+
+
+def get_preview_max_size() -> Tuple[int, int]:
+    """ライブプレビューの最大サイズ（幅,高さ）を取得"""
+    size_str = os.getenv("PREVIEW_MAX_SIZE", "")
+    if size_str:
+        try:
+            width, height = map(int, size_str.split(","))
+            if width > 0 and height > 0:
+                return (width, height)
+        except (ValueError, TypeError):
+            pass
+    return DEFAULT_PREVIEW_MAX_SIZE
+
+
+def get_preview_jpeg_quality() -> int:
+    """ライブプレビューのJPEG品質（1〜100）を取得"""
+    try:
+        return min(100, max(1, int(os.getenv("PREVIEW_JPEG_QUALITY", DEFAULT_PREVIEW_JPEG_QUALITY))))
+    except ValueError:
+        return DEFAULT_PREVIEW_JPEG_QUALITY
+
+
+def get_metrics_host() -> str:
+    """メトリクスサーバーの待ち受けアドレスを取得"""
+    return os.getenv("METRICS_HOST", DEFAULT_METRICS_HOST).strip() or DEFAULT_METRICS_HOST
+
+
+def get_metrics_port() -> int:
+    """メトリクスサーバーのポート番号を取得（0で無効）"""
+    try:
+        return max(0, int(os.getenv("METRICS_PORT", DEFAULT_METRICS_PORT)))
+    except ValueError:
+        return DEFAULT_METRICS_PORT
+
+
+def get_session_record_dir() -> Optional[Path]:
+    """セッションを記録するディレクトリを取得（未設定の場合は記録しない）"""
+    value = os.getenv("SESSION_RECORD_DIR", "").strip()
+    return Path(value) if value else None
+
+
+def get_session_record_jpeg_quality() -> int:
+    """セッション記録のJPEG品質（1〜100）を取得"""
+    try:
+        return min(100, max(1, int(os.getenv("SESSION_RECORD_JPEG_QUALITY", DEFAULT_SESSION_RECORD_JPEG_QUALITY))))
+    except ValueError:
+        return DEFAULT_SESSION_RECORD_JPEG_QUALITY
+
+
+def get_session_record_chunk_frames() -> int:
+    """セッション記録の1チャンクあたりのフレーム数を取得"""
+    try:
+        return max(1, int(os.getenv("SESSION_RECORD_CHUNK_FRAMES", DEFAULT_SESSION_RECORD_CHUNK_FRAMES)))
+    except ValueError:
+        return DEFAULT_SESSION_RECORD_CHUNK_FRAMES
+
+
 def get_output_dir() -> Path:
     """出力ディレクトリを取得"""
     return OUTPUT_DIR
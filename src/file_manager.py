@@ -1,9 +1,10 @@
 """ファイル操作関連の関数"""
-from typing import List
+from typing import List, Dict, Any
 from pathlib import Path
 import logging
 
 import config
+from utils import segment_name
 
 
 class FileManager:
@@ -46,6 +47,21 @@ class FileManager:
         return list(config.get_output_dir().glob("*.mp4"))
 
     @staticmethod
-    def get_keyframe_files(segment_id: int) -> List[Path]:
-        """指定したセグメントIDのキーフレームファイルを取得"""
-        return sorted(config.get_keyframes_dir().glob(f"segment_{segment_id}_keyframe_*.jpg"))
+    def get_keyframe_files(segment_id: int, camera_id: int = 0) -> List[Path]:
+        """指定したカメラ・セグメントIDのキーフレームファイルを取得"""
+        return sorted(config.get_keyframes_dir().glob(f"{segment_name(camera_id, segment_id)}_keyframe_*.jpg"))
+
+    @staticmethod
+    def remove_segment_files(video_info: Dict[str, Any]) -> None:
+        """セグメント情報に含まれるビデオファイルを削除"""
+        logger = logging.getLogger(__name__)
+        for file_path in video_info.get('file_paths', [video_info.get('file_path')]):
+            if not file_path:
+                continue
+            path = Path(file_path)
+            try:
+                if path.exists():
+                    path.unlink()
+                    logger.info(f"削除: {path.name}")
+            except Exception as e:
+                logger.error(f"削除エラー ({path}): {e}")
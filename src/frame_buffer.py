@@ -0,0 +1,67 @@
+"""フレームリングバッファモジュール"""
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    """固定長・事前確保のフレームリングバッファ
+
+    キャプチャスレッドが書き込み、UIなどの読み手は最新フレームのみを取得する。
+    フレーム領域は最初のフレーム（または解像度変更時）に一度だけ確保し、以降は上書きする。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._frames: Optional[np.ndarray] = None
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._frame_count = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self, frame: np.ndarray) -> None:
+        """フレーム形状に合わせてバッファを確保"""
+        self._frames = np.empty((self.capacity, *frame.shape), dtype=frame.dtype)
+
+    def put(self, frame: np.ndarray, timestamp: Optional[float] = None) -> None:
+        """フレームを書き込み（最も古いフレームを上書き）"""
+        with self._lock:
+            if (self._frames is None or self._frames.shape[1:] != frame.shape
+                    or self._frames.dtype != frame.dtype):
+                self._allocate(frame)
+            slot = self._frame_count % self.capacity
+            np.copyto(self._frames[slot], frame)
+            self._timestamps[slot] = timestamp if timestamp is not None else time.time()
+            self._frame_count += 1
+
+    def get_latest(self, out: Optional[np.ndarray] = None) -> Tuple[Optional[np.ndarray], int]:
+        """最新フレームのコピーと通算フレーム番号を取得
+
+        Args:
+            out: コピー先の配列。形状が一致する場合は再利用する
+
+        Returns:
+            tuple: (frame, frame_count) フレームがない場合は (None, 0)
+        """
+        with self._lock:
+            if self._frame_count == 0 or self._frames is None:
+                return None, 0
+            latest = self._frames[(self._frame_count - 1) % self.capacity]
+            if out is not None and out.shape == latest.shape and out.dtype == latest.dtype:
+                np.copyto(out, latest)
+                return out, self._frame_count
+            return latest.copy(), self._frame_count
+
+    def get_latest_timestamp(self) -> Optional[float]:
+        """最新フレームのタイムスタンプを取得"""
+        with self._lock:
+            if self._frame_count == 0:
+                return None
+            return float(self._timestamps[(self._frame_count - 1) % self.capacity])
+
+    @property
+    def frame_count(self) -> int:
+        """これまでに書き込まれたフレーム数"""
+        with self._lock:
+            return self._frame_count
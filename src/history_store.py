@@ -0,0 +1,201 @@
+"""分析結果履歴の保存・検索モジュール"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+import config
+from utils import format_time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HistoryRecord:
+    """1セグメント分の分析結果"""
+    camera_id: int
+    segment_id: int
+    start_offset: float  # キャプチャ開始からの秒数
+    end_offset: float
+    description: str
+    latency: float  # セグメントの処理時間（秒）
+    model: str
+    created_at: float = field(default_factory=time.time)
+    id: Optional[int] = None
+
+    @property
+    def time_range(self) -> str:
+        """時間範囲を「MM:SS〜MM:SS」形式で取得"""
+        return f"{format_time(int(self.start_offset))}〜{format_time(int(round(self.end_offset)))}"
+
+
+class HistoryStore:
+    """分析結果履歴を保持するクラス
+
+    直近 HISTORY_MEMORY_SIZE 件のみをメモリに保持し、すべての結果は HISTORY_PATH の
+    SQLiteファイルに追記する（作成時刻のインデックスで範囲検索・ページングする）。
+    HISTORY_PATH が空の場合はメモリ上の直近分のみを保持する。
+
+    SQLiteへの書き込みは専用スレッドで行い、待機中のレコードをまとめて1回のコミットで書き込む。
+    append は呼び出し元（VLM処理のイベントループ）をディスクI/Oで待たせない。
+    """
+
+    def __init__(self, db_path: Optional[Path] = None, memory_size: Optional[int] = None):
+        self.memory_size = memory_size if memory_size is not None else config.get_history_memory_size()
+        self.recent: deque = deque(maxlen=self.memory_size)
+        self.lock = threading.Lock()
+        # 履歴が追加されるたびに増える版番号（UIは変化した場合のみ再描画する）
+        # SQLite使用時は書き込みのコミット後に増えるため、版番号が変わった時点で検索結果に含まれる
+        self.version = 0
+        self.db: Optional[sqlite3.Connection] = None
+        self.db_lock = threading.Lock()
+        self._write_queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.closed = False
+
+        db_path = db_path or config.get_history_path()
+        if db_path:
+            try:
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                self.db = sqlite3.connect(str(db_path), check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS history ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+                    "camera_id INTEGER NOT NULL, segment_id INTEGER NOT NULL, "
+                    "start_offset REAL NOT NULL, end_offset REAL NOT NULL, "
+                    "description TEXT NOT NULL, latency REAL NOT NULL, model TEXT NOT NULL)"
+                )
+                self.db.execute("CREATE INDEX IF NOT EXISTS history_created_at ON history(created_at)")
+                self.db.execute("CREATE INDEX IF NOT EXISTS history_camera_created_at ON history(camera_id, created_at)")
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"履歴DBを開けませんでした ({db_path}): {e}")
+                self.db = None
+        if self.db is not None:
+            self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+            self._writer.start()
+
+    def append(self, record: HistoryRecord) -> None:
+        """履歴に追加（SQLiteへの書き込みは書き込みスレッドに任せて待たない）"""
+        with self.lock:
+            self.recent.append(record)
+            if self._writer is None:
+                self.version += 1
+        if self._writer is not None:
+            self._write_queue.put(record)
+
+    def _write_loop(self) -> None:
+        """待機中のレコードをまとめてSQLiteに書き込む"""
+        running = True
+        while running:
+            batch = [self._write_queue.get()]
+            while True:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                # 終了要求より前に追加されたレコードは書き込んでから終了する
+                running = False
+            records = [record for record in batch if record is not None]
+            if records:
+                self._write_records(records)
+                with self.lock:
+                    self.version += 1
+            for _ in batch:
+                self._write_queue.task_done()
+
+    def _write_records(self, records: List[HistoryRecord]) -> None:
+        with self.db_lock:
+            if self.db is None:
+                return
+            try:
+                for record in records:
+                    cursor = self.db.execute(
+                        "INSERT INTO history (created_at, camera_id, segment_id, start_offset, end_offset, "
+                        "description, latency, model) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (record.created_at, record.camera_id, record.segment_id, record.start_offset,
+                         record.end_offset, record.description, record.latency, record.model)
+                    )
+                    record.id = cursor.lastrowid
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"履歴DBの書き込みエラー: {e}")
+
+    def flush(self) -> None:
+        """追加済みのレコードがSQLiteに書き込まれるまで待機"""
+        if self._writer is not None:
+            self._write_queue.join()
+
+    @staticmethod
+    def _where(since: Optional[float], until: Optional[float], camera_id: Optional[int]) -> tuple:
+        """検索条件のWHERE句とパラメータを作成"""
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if camera_id is not None:
+            conditions.append("camera_id = ?")
+            params.append(camera_id)
+        return (f" WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def _filter_recent(self, since: Optional[float], until: Optional[float],
+                       camera_id: Optional[int]) -> List[HistoryRecord]:
+        """メモリ上の直近分を条件で絞り込む（新しい順、ロック内で呼ぶ）"""
+        return [
+            record for record in reversed(self.recent)
+            if (since is None or record.created_at >= since)
+            and (until is None or record.created_at < until)
+            and (camera_id is None or record.camera_id == camera_id)
+        ]
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              camera_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[HistoryRecord]:
+        """作成時刻の範囲（since以上until未満のUNIX時刻）・カメラで絞り込み、新しい順に取得"""
+        with self.db_lock:
+            if self.db is not None:
+                where, params = self._where(since, until, camera_id)
+                try:
+                    rows = self.db.execute(
+                        "SELECT camera_id, segment_id, start_offset, end_offset, description, latency, model, "
+                        f"created_at, id FROM history{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                        (*params, limit, offset)
+                    ).fetchall()
+                    return [HistoryRecord(*row) for row in rows]
+                except sqlite3.Error as e:
+                    logger.error(f"履歴DBの読み込みエラー: {e}")
+        with self.lock:
+            return self._filter_recent(since, until, camera_id)[offset:offset + limit]
+
+    def count(self, since: Optional[float] = None, until: Optional[float] = None,
+              camera_id: Optional[int] = None) -> int:
+        """条件に一致する履歴の件数を取得"""
+        with self.db_lock:
+            if self.db is not None:
+                where, params = self._where(since, until, camera_id)
+                try:
+                    return self.db.execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+                except sqlite3.Error as e:
+                    logger.error(f"履歴DBの読み込みエラー: {e}")
+        with self.lock:
+            return len(self._filter_recent(since, until, camera_id))
+
+    def close(self) -> None:
+        """書き込み待ちのレコードを書き込んでから履歴DBを閉じる"""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+        self.closed = True
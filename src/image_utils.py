@@ -0,0 +1,79 @@
+"""画像の読み込み・縮小に関するユーティリティ関数"""
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class JpegFrame(bytes):
+    """ffmpegのパイプ出力から切り出したJPEGデータ（出力順の連番付き、1始まり）"""
+
+    def __new__(cls, data: bytes, number: int):
+        frame = super().__new__(cls, data)
+        frame.number = number
+        return frame
+
+    def __reduce__(self):
+        return (JpegFrame, (bytes(self), self.number))
+
+
+# 分析対象の画像（キーフレームファイルのパス、BGR形式のフレーム配列、またはJPEGデータ）
+ImageSource = Union[Path, np.ndarray, bytes]
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+def split_jpeg_stream(data: bytes) -> List[JpegFrame]:
+    """連結されたJPEGストリーム（image2pipe/MJPEG）を1枚ずつに分割"""
+    frames: List[JpegFrame] = []
+    position = 0
+    while True:
+        start = data.find(JPEG_SOI, position)
+        if start < 0:
+            break
+        end = data.find(JPEG_EOI, start + 2)
+        if end < 0:
+            break
+        frames.append(JpegFrame(data[start:end + 2], len(frames) + 1))
+        position = end + 2
+    return frames
+
+
+def fit_size(width: int, height: int, max_size: Tuple[int, int]) -> Tuple[int, int]:
+    """アスペクト比を保って最大サイズに収まる大きさを計算（拡大はしない）"""
+    scale = min(1.0, max_size[0] / width, max_size[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def load_bgr(image: ImageSource, reduce: int = 1) -> Optional[np.ndarray]:
+    """画像をBGR配列として取得
+
+    Args:
+        image: 画像ファイルのパス、BGR形式のフレーム配列、またはJPEGデータ
+        reduce: JPEGデコード時の縮小率（1, 2, 4, 8）。縮小デコードにより読み込みを高速化する
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    flags = {
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }.get(reduce, cv2.IMREAD_COLOR)
+    if isinstance(image, bytes):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+    return cv2.imread(str(image), flags)
+
+
+def make_thumbnail(image: ImageSource, size: Tuple[int, int] = (64, 36)) -> Optional[np.ndarray]:
+    """特徴量計算用の縮小画像（BGR, uint8）を作成"""
+    frame = load_bgr(image, reduce=1 if isinstance(image, np.ndarray) else 8)
+    if frame is None:
+        return None
+    height, width = frame.shape[:2]
+    # 先に間引いてからエリア補間することで大きなフレームでも計算量を抑える
+    step = max(1, min(height // (size[1] * 4), width // (size[0] * 4)))
+    if step > 1:
+        frame = frame[::step, ::step]
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
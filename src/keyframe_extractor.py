@@ -1,10 +1,16 @@
 """キーフレーム抽出関連の関数"""
+import asyncio
 import subprocess
-from typing import List
+import time
+from typing import List, Optional
 from pathlib import Path
 import logging
 
 import config
+import metrics
+from image_utils import ImageSource, split_jpeg_stream
+from keyframe_selector import DiversityKeyframeSelector
+from utils import segment_name, select_evenly
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
@@ -14,62 +20,226 @@ logger = logging.getLogger(__name__)
 class KeyframeExtractor:
     """キーフレーム抽出クラス"""
 
-    def __init__(self, ffmpeg_path: str = 'ffmpeg'):
+    def __init__(self, ffmpeg_path: str = 'ffmpeg', output: Optional[str] = None):
         self.ffmpeg_path = ffmpeg_path
+        # キーフレームの受け取り方（"file" または "pipe"、未指定の場合は KEYFRAME_OUTPUT）
+        self.output = output or config.get_keyframe_output()
+        # 同時に起動するffmpegプロセス数を制限するセマフォ（イベントループごとに生成）
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
 
-    def extract_from_video(self, video_path: Path, segment_id: int) -> List[Path]:
-        """ビデオからキーフレームを抽出"""
+    @staticmethod
+    def select_keyframes(images: list) -> list:
+        """候補フレーム（パスまたはフレーム配列）から分析用フレームを選択"""
+        if config.get_keyframe_selection() == "diverse":
+            return DiversityKeyframeSelector().select(images)
+        return select_evenly(images, config.get_ffmpeg_keyframe_count())
+
+    def _build_command(self, video_path: Path, segment_id: int, camera_id: int = 0,
+                       start: Optional[float] = None, duration: Optional[float] = None,
+                       segment_duration: Optional[float] = None) -> Optional[List[str]]:
+        """入力を検証し、ffmpegのコマンドラインを構築（不正な場合はNone）
+
+        start・duration（秒）を指定した場合は入力側のシークでその区間だけを読み込む（再エンコードしない）。
+        segment_duration（秒）は区間を指定しない場合の入力の長さで、候補フレームの抽出間隔に使う。
+        """
         # ファイルの存在確認
         if not video_path.exists():
             logger.error(f"ビデオファイルが見つかりません: {video_path}")
-            return []
+            return None
 
         # ファイルが有効か確認
         if not video_path.is_file():
             logger.error(f"指定されたパスはファイルではありません: {video_path}")
-            return []
+            return None
 
         # 出力ディレクトリの存在確認と作成
         try:
-            config.get_keyframes_dir().mkdir(parents=True, exist_ok=True)
+            if self.output == "file":
+                config.get_keyframes_dir().mkdir(parents=True, exist_ok=True)
         except Exception as e:
             logger.error(f"キーフレーム出力ディレクトリ作成エラー: {e}")
-            return []
+            return None
+
+        if self.output == "pipe":
+            # JPEGを標準出力に連続して書き出し、ファイルを介さずに受け取る
+            output_args = ['-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', '2', 'pipe:1']
+        else:
+            output_args = [str(config.get_keyframes_dir() / f"{segment_name(camera_id, segment_id)}_keyframe_%04d.jpg")]
 
-        output_pattern = str(config.get_keyframes_dir() / f"segment_{segment_id}_keyframe_%04d.jpg")
+        input_args = ['-i', str(video_path)]
+        if duration is not None:
+            input_args = ['-t', f"{duration:g}", *input_args]
+        if start is not None:
+            input_args = ['-ss', f"{start:g}", *input_args]
 
-        ffmpeg_cmd = [
+        return [
             self.ffmpeg_path,
-            '-i', str(video_path),
-            *config.get_ffmpeg_keyframe_args(),
-            output_pattern
+            *input_args,
+            *config.get_ffmpeg_keyframe_args(duration if duration is not None else segment_duration),
+            *output_args
         ]
 
+    @staticmethod
+    def _list_keyframe_files(segment_id: int, camera_id: int = 0) -> List[Path]:
+        """指定したカメラ・セグメントIDの抽出済みキーフレームファイルを取得"""
+        return sorted(config.get_keyframes_dir().glob(f"{segment_name(camera_id, segment_id)}_keyframe_*.jpg"))
+
+    def _collect_keyframes(self, segment_id: int, stdout: Optional[bytes] = None,
+                           camera_id: int = 0) -> List[ImageSource]:
+        """抽出されたキーフレームを取得し、必要に応じて選択する
+
+        pipe出力の場合は標準出力のJPEGストリームを分割してメモリ上のJPEGデータとして返す。
+        """
+        if stdout is not None:
+            keyframes = split_jpeg_stream(stdout)
+            if config.get_keyframe_selection() == "diverse":
+                keyframes = self.select_keyframes(keyframes)
+        else:
+            keyframes = self._list_keyframe_files(segment_id, camera_id)
+            if config.get_keyframe_selection() == "diverse":
+                keyframes = self._select_and_cleanup(keyframes)
+        logger.info(f"キーフレーム数: {len(keyframes)}")
+        return keyframes
+
+    def _remove_partial_output(self, segment_id: int, camera_id: int = 0) -> None:
+        """中断された抽出の出力ファイルを削除"""
+        if self.output == "pipe":
+            return
+        for keyframe in self._list_keyframe_files(segment_id, camera_id):
+            try:
+                keyframe.unlink()
+            except Exception as e:
+                logger.error(f"キーフレーム削除エラー ({keyframe}): {e}")
+
+    def extract_from_video(self, video_path: Path, segment_id: int, camera_id: int = 0,
+                           start: Optional[float] = None, duration: Optional[float] = None) -> List[ImageSource]:
+        """ビデオからキーフレームを抽出（file出力はパス、pipe出力はJPEGデータのリスト）
+
+        start・duration（秒）を指定した場合は、その区間だけを対象にする。
+        """
+        ffmpeg_cmd = self._build_command(video_path, segment_id, camera_id, start, duration)
+        name = segment_name(camera_id, segment_id)
+        if ffmpeg_cmd is None:
+            return []
+
         try:
-            logger.info(f"キーフレーム抽出を開始: segment_{segment_id}")
+            logger.info(f"キーフレーム抽出を開始: {name}")
+            extraction_start = time.perf_counter()
             result = subprocess.run(
                 ffmpeg_cmd,
                 check=True,
                 capture_output=True,
-                text=True
+                timeout=config.get_ffmpeg_timeout()
             )
-            logger.info(f"キーフレーム抽出成功: segment_{segment_id}")
+            metrics.KEYFRAME_EXTRACTION_SECONDS.observe(time.perf_counter() - extraction_start)
+            logger.info(f"キーフレーム抽出成功: {name}")
 
-            # 抽出されたキーフレームファイルのリストを返す
-            keyframe_files = sorted(
-                config.get_keyframes_dir().glob(f"segment_{segment_id}_keyframe_*.jpg")
-            )
-            logger.info(f"キーフレーム数: {len(keyframe_files)}")
-            return keyframe_files
+            # 抽出されたキーフレームのリストを返す
+            pipe_output = result.stdout if self.output == "pipe" else None
+            return self._collect_keyframes(segment_id, pipe_output, camera_id)
 
         except subprocess.CalledProcessError as e:
-            logger.error(f"キーフレーム抽出エラー (segment {segment_id}):")
-            logger.error(f"STDOUT: {e.stdout}")
-            logger.error(f"STDERR: {e.stderr}")
+            logger.error(f"キーフレーム抽出エラー ({name}):")
+            if self.output == "file":
+                logger.error(f"STDOUT: {e.stdout.decode(errors='replace')}")
+            logger.error(f"STDERR: {e.stderr.decode(errors='replace')}")
+            return []
+        except subprocess.TimeoutExpired:
+            logger.error(f"キーフレーム抽出がタイムアウトしました ({name})")
+            self._remove_partial_output(segment_id, camera_id)
             return []
         except FileNotFoundError:
             logger.error(f"ffmpegが見つかりません。パスを確認してください: {self.ffmpeg_path}")
             return []
         except Exception as e:
             logger.error(f"キーフレーム抽出処理中の予期しないエラー: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """実行中のイベントループ用のセマフォを取得"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(config.get_ffmpeg_max_concurrency())
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    async def _terminate(process: asyncio.subprocess.Process) -> None:
+        """ffmpegプロセスを強制終了して回収"""
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def aextract_from_video(self, video_path: Path, segment_id: int, camera_id: int = 0,
+                                 duration: Optional[float] = None) -> List[ImageSource]:
+        """ビデオからキーフレームを非同期に抽出
+
+        asyncioのサブプロセスでffmpegを実行するため、抽出中もイベントループは他の処理
+        （前のセグメントのVLMリクエストなど）を進められる。同時実行数は FFMPEG_MAX_CONCURRENCY、
+        実行時間は FFMPEG_TIMEOUT で制限し、タイムアウト・キャンセル時はプロセスを終了して
+        途中まで出力されたファイルを削除する。duration（秒）には候補フレームを等間隔に抽出するための
+        セグメントの実際の長さを指定する（未指定の場合は CAPTURE_INTERVAL）。
+        """
+        ffmpeg_cmd = self._build_command(video_path, segment_id, camera_id, segment_duration=duration)
+        name = segment_name(camera_id, segment_id)
+        if ffmpeg_cmd is None:
+            return []
+
+        async with self._get_semaphore():
+            logger.info(f"キーフレーム抽出を開始: {name}")
+            extraction_start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *ffmpeg_cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except FileNotFoundError:
+                logger.error(f"ffmpegが見つかりません。パスを確認してください: {self.ffmpeg_path}")
+                return []
+
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=config.get_ffmpeg_timeout())
+            except asyncio.TimeoutError:
+                await self._terminate(process)
+                logger.error(f"キーフレーム抽出がタイムアウトしました ({name})")
+                self._remove_partial_output(segment_id, camera_id)
+                return []
+            except asyncio.CancelledError:
+                await asyncio.shield(self._terminate(process))
+                self._remove_partial_output(segment_id, camera_id)
+                raise
+
+        if process.returncode != 0:
+            logger.error(f"キーフレーム抽出エラー ({name}):")
+            if self.output == "file":
+                logger.error(f"STDOUT: {stdout.decode(errors='replace')}")
+            logger.error(f"STDERR: {stderr.decode(errors='replace')}")
+            self._remove_partial_output(segment_id, camera_id)
+            return []
+
+        metrics.KEYFRAME_EXTRACTION_SECONDS.observe(time.perf_counter() - extraction_start)
+        logger.info(f"キーフレーム抽出成功: {name}")
+        try:
+            # 候補フレームの選択は画像のデコードを伴うためワーカースレッドで行う
+            pipe_output = stdout if self.output == "pipe" else None
+            return await asyncio.to_thread(self._collect_keyframes, segment_id, pipe_output, camera_id)
+        except Exception as e:
+            logger.error(f"キーフレーム抽出処理中の予期しないエラー: {e}")
+            return []
+
+    def _select_and_cleanup(self, candidate_files: List[Path]) -> List[Path]:
+        """候補フレームから多様性に基づいて選択し、選ばれなかったファイルを削除"""
+        selected = self.select_keyframes(candidate_files)
+        for candidate in candidate_files:
+            if candidate in selected:
+                continue
+            try:
+                candidate.unlink()
+            except Exception as e:
+                logger.error(f"候補フレーム削除エラー ({candidate}): {e}")
+        return selected
@@ -0,0 +1,100 @@
+"""多様性を考慮したキーフレーム選択モジュール"""
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import config
+from image_utils import ImageSource, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+class DiversityKeyframeSelector:
+    """候補フレームから互いに最も異なるフレームを選択するクラス
+
+    縮小画像から色ヒストグラムとフレーム差分エネルギーをNumPyで計算し、
+    最遠点サンプリングで選択する。新たに選ぶフレームの最小距離がしきい値を下回った時点で
+    打ち切るため、静的なシーンほど少ない枚数になる（最小枚数〜最大枚数の範囲で適応）。
+    """
+
+    HISTOGRAM_BINS = 4  # チャンネルあたりのビン数（4^3 = 64ビンの色ヒストグラム）
+
+    def __init__(self, max_count: Optional[int] = None, min_count: Optional[int] = None,
+                 threshold: Optional[float] = None, histogram_weight: float = 0.5):
+        self.max_count = max_count or config.get_ffmpeg_keyframe_count()
+        self.min_count = min(min_count or config.get_keyframe_min_count(), self.max_count)
+        self.threshold = threshold if threshold is not None else config.get_keyframe_diversity_threshold()
+        self.histogram_weight = histogram_weight
+
+    @classmethod
+    def compute_histograms(cls, thumbnails: np.ndarray) -> np.ndarray:
+        """縮小画像群 (N, H, W, 3) から正規化済みの色ヒストグラム (N, 64) を計算"""
+        bins = cls.HISTOGRAM_BINS
+        quantized = (thumbnails.astype(np.uint16) * bins) >> 8
+        codes = (quantized[..., 0] * bins + quantized[..., 1]) * bins + quantized[..., 2]
+        count = thumbnails.shape[0]
+        offsets = (np.arange(count) * bins ** 3)[:, None]
+        flat = (codes.reshape(count, -1) + offsets).ravel()
+        histograms = np.bincount(flat, minlength=count * bins ** 3).reshape(count, -1)
+        return histograms / histograms.sum(axis=1, keepdims=True)
+
+    @staticmethod
+    def compute_difference_energy(gray: np.ndarray) -> np.ndarray:
+        """連続するフレーム間の差分エネルギー（平均絶対差, 0〜1）を計算"""
+        energy = np.zeros(gray.shape[0], dtype=np.float64)
+        if gray.shape[0] > 1:
+            energy[1:] = np.abs(np.diff(gray, axis=0)).mean(axis=(1, 2))
+        return energy
+
+    def compute_distances(self, thumbnails: np.ndarray) -> np.ndarray:
+        """候補フレーム間の距離行列 (N, N) を計算"""
+        histograms = self.compute_histograms(thumbnails)
+        gray = thumbnails.astype(np.float32).mean(axis=3).reshape(thumbnails.shape[0], -1) / 255.0
+        count = thumbnails.shape[0]
+        distances = np.zeros((count, count), dtype=np.float64)
+        # 候補数が多い場合もメモリ使用量が (N, 画素数) に収まるよう行ごとに計算する
+        for i in range(count):
+            # ヒストグラムのL1距離（0〜2）を0〜1に正規化
+            histogram_distance = np.abs(histograms - histograms[i]).sum(axis=1) / 2.0
+            pixel_distance = np.abs(gray - gray[i]).mean(axis=1)
+            distances[i] = (self.histogram_weight * histogram_distance +
+                            (1.0 - self.histogram_weight) * pixel_distance)
+        return distances
+
+    def select_indices(self, images: Sequence[ImageSource]) -> List[int]:
+        """選択したフレームのインデックスを時系列順で返す"""
+        thumbnails = []
+        valid_indices = []
+        for index, image in enumerate(images):
+            thumbnail = make_thumbnail(image)
+            if thumbnail is not None:
+                thumbnails.append(thumbnail)
+                valid_indices.append(index)
+
+        if len(valid_indices) <= self.min_count:
+            return valid_indices
+
+        stack = np.stack(thumbnails)
+        distances = self.compute_distances(stack)
+        gray = stack.astype(np.float32).mean(axis=3) / 255.0
+        energy = self.compute_difference_energy(gray)
+
+        # 最も動きの大きいフレームから開始し、既選択フレームから最も遠いフレームを順に追加する
+        selected = [int(np.argmax(energy))]
+        min_distance = distances[selected[0]].copy()
+        min_distance[selected] = -1.0
+        while len(selected) < min(self.max_count, len(valid_indices)):
+            candidate = int(np.argmax(min_distance))
+            if len(selected) >= self.min_count and min_distance[candidate] < self.threshold:
+                break
+            selected.append(candidate)
+            min_distance = np.minimum(min_distance, distances[candidate])
+            min_distance[selected] = -1.0
+
+        logger.info(f"キーフレーム選択: 候補 {len(valid_indices)} 枚から {len(selected)} 枚を選択")
+        return [valid_indices[i] for i in sorted(selected)]
+
+    def select(self, images: Sequence[ImageSource]) -> list:
+        """選択したフレームを時系列順で返す"""
+        return [images[i] for i in self.select_indices(images)]
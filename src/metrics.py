@@ -0,0 +1,288 @@
+"""パイプラインの計測値（カウンタ・ゲージ・ヒストグラム）を集計するモジュール
+
+各処理段の所要時間などをプロセス内のヒストグラム（固定バケット）に記録し、
+Prometheusのテキスト形式とJSONスナップショットで公開する。記録はバケット探索と
+ロック1回のみで、処理段の速度にほとんど影響しない。
+"""
+import bisect
+import json
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "vlm_analyzer_"
+
+# 所要時間（秒）用のバケット
+SECONDS_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# サイズ（バイト）用のバケット
+BYTES_BUCKETS: Tuple[float, ...] = (1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7)
+
+
+def _format_value(value: float) -> str:
+    """Prometheusのテキスト形式で数値を表記"""
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value: Any) -> str:
+    """ラベル値をエスケープ"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """ラベルを {name="value",...} 形式で表記"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metric:
+    """ラベルごとの値を持つ計測値の基底クラス"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = METRIC_PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _items(self) -> List[Tuple[Dict[str, str], Any]]:
+        """ラベルと値の組を取得"""
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), self._copy(value)) for key, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [{"labels": labels, "value": value} for labels, value in self._items()]
+
+    def to_prometheus(self) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in self._items()]
+
+
+class Counter(Metric):
+    """単調増加するカウンタ"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """現在値を表すゲージ"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """固定バケットのヒストグラム（分位点はバケット内の線形補間で推定）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = SECONDS_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [バケットごとの件数（最後は+Inf）, 合計, 件数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return [list(value[0]), value[1], value[2]]
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> float:
+        """バケットの件数から分位点を推定"""
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index >= len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        snapshots = []
+        for labels, (counts, total_sum, total) in self._items():
+            snapshots.append({
+                "labels": labels,
+                "count": total,
+                "sum": total_sum,
+                "mean": total_sum / total if total else 0.0,
+                "p50": self._quantile(counts, total, 0.5),
+                "p95": self._quantile(counts, total, 0.95),
+                "p99": self._quantile(counts, total, 0.99),
+                "buckets": dict(zip([*map(_format_value, self.buckets), "+Inf"], counts)),
+            })
+        return snapshots
+
+    def to_prometheus(self) -> List[str]:
+        lines = []
+        for labels, (counts, total_sum, total) in self._items():
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                bucket_labels = {**labels, "le": _format_value(float(bound))}
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(total_sum))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """計測値の登録と公開形式への変換を行うクラス"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """すべての計測値をJSONに変換可能な辞書で取得"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {"type": metric.type_name, "help": metric.help_text, "values": metric.snapshot()}
+            for metric in metrics
+        }
+
+    def to_prometheus(self) -> str:
+        """すべての計測値をPrometheusのテキスト形式で取得"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.to_prometheus())
+        return "\n".join(lines) + "\n"
+
+
+# アプリケーション全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+# 各処理段の計測値
+CAPTURE_FRAMES = REGISTRY.counter("capture_frames_total", "カメラから読み込んだフレーム数", ("camera",))
+CAPTURE_DROPPED_FRAMES = REGISTRY.counter("capture_dropped_frames_total", "読み込みに失敗したフレーム数", ("camera",))
+CAPTURE_FPS = REGISTRY.gauge("capture_fps", "直近1秒間のキャプチャFPS", ("camera",))
+SEGMENT_WRITE_SECONDS = REGISTRY.histogram("segment_write_seconds", "セグメントへの1フレームの書き込み時間（秒）", ("camera",))
+SEGMENT_SWITCH_SECONDS = REGISTRY.histogram("segment_switch_seconds", "セグメントの区切り（ライターの切り替え）にかかった時間（秒）", ("camera",))
+KEYFRAME_EXTRACTION_SECONDS = REGISTRY.histogram("keyframe_extraction_seconds", "ffmpegによるキーフレーム抽出時間（秒）")
+IMAGE_ENCODE_SECONDS = REGISTRY.histogram("image_encode_seconds", "1リクエスト分の画像のリサイズ・エンコード時間（秒）")
+REQUEST_PAYLOAD_BYTES = REGISTRY.histogram("request_payload_bytes", "1リクエスト分のエンコード済み画像のサイズ（バイト）",
+                                           buckets=BYTES_BUCKETS)
+VLM_REQUEST_SECONDS = REGISTRY.histogram("vlm_request_seconds", "VLMリクエストのレイテンシ（秒）", ("endpoint",))
+VLM_TTFT_SECONDS = REGISTRY.histogram("vlm_ttft_seconds", "ストリーミング時の最初のトークンまでの時間（秒）", ("endpoint",))
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "待機中のセグメント数", ("camera",))
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("queue_wait_seconds", "セグメントのキュー待ち時間（秒）")
+CAPTURE_TO_DESCRIPTION_SECONDS = REGISTRY.histogram("capture_to_description_seconds",
+                                                    "セグメントの記録終了から説明文の公開までの時間（秒）")
+QUEUE_DROPS = REGISTRY.counter("queue_drops_total",
+                               "キュー満杯時に破棄・統合したセグメント数と、統合で間引いたフレーム・ファイル数",
+                               ("camera", "reason"))
+SCENE_DEDUP_LOOKUPS = REGISTRY.counter("scene_dedup_lookups_total", "シーン重複判定の結果（hit: VLM呼び出しを省略）",
+                                       ("result",))
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter("response_cache_lookups_total", "VLM応答キャッシュの参照結果", ("result",))
+VLM_REQUEST_EVENTS = REGISTRY.counter("vlm_request_events_total", "VLMリクエストのタイムアウト・ヘッジ件数", ("event",))
+VLM_ENDPOINT_EJECTIONS = REGISTRY.counter("vlm_endpoint_ejections_total", "VLMエンドポイントを切り離した回数",
+                                          ("endpoint",))
+SLO_RESULTS = REGISTRY.counter("slo_results_total", "遅延SLOの判定結果（met: 期限内 / missed: 期限超過 / dropped_stale: 破棄）",
+                               ("camera", "result"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """/metrics（Prometheusテキスト形式）と /metrics.json（JSONスナップショット）を返すハンドラ"""
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = REGISTRY.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(REGISTRY.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # アクセスログは出力しない（スクレイプのたびに記録されるため）
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """計測値を公開するHTTPサーバーをデーモンスレッドで起動（起動済みの場合はそのまま、失敗時はNone）"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = _create_server(host, port)
+        return _server
+
+
+def _create_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"メトリクスサーバーを起動できませんでした ({host}:{port}): {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"メトリクスサーバーを開始: http://{host}:{port}/metrics")
+    return server
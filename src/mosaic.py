@@ -0,0 +1,79 @@
+"""キーフレームのモザイク（タイル）画像生成モジュール"""
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import config
+from image_utils import ImageSource, load_bgr
+from utils import select_evenly
+
+
+def resolve_grid(count: int, grid: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+    """画像数からグリッド（列数, 行数）を決定"""
+    if grid:
+        return grid
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    return cols, rows
+
+
+def _fit_to_tile(frame: np.ndarray, tile_size: Tuple[int, int]) -> np.ndarray:
+    """アスペクト比を保ったままタイルに収め、余白を黒で埋める"""
+    tile_width, tile_height = tile_size
+    height, width = frame.shape[:2]
+    scale = min(tile_width / width, tile_height / height)
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    resized = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+    tile = np.zeros((tile_height, tile_width, 3), dtype=np.uint8)
+    x = (tile_width - new_size[0]) // 2
+    y = (tile_height - new_size[1]) // 2
+    tile[y:y + new_size[1], x:x + new_size[0]] = resized
+    return tile
+
+
+def _draw_label(tile: np.ndarray, label: str) -> None:
+    """タイルの左上にラベル（時刻）を描画"""
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = max(0.4, tile.shape[0] / 400)
+    thickness = 1 if font_scale < 0.8 else 2
+    text_size = cv2.getTextSize(label, font, font_scale, thickness)[0]
+    position = (6, 6 + text_size[1])
+    # テキストの背景を黒に設定（視認性向上）
+    cv2.rectangle(tile, (position[0] - 4, position[1] - text_size[1] - 4),
+                  (position[0] + text_size[0] + 4, position[1] + 4), (0, 0, 0), -1)
+    cv2.putText(tile, label, position, font, font_scale, (255, 255, 255), thickness)
+
+
+def build_mosaic(images: Sequence[ImageSource], labels: Optional[Sequence[str]] = None,
+                 grid: Optional[Tuple[int, int]] = None,
+                 tile_size: Optional[Tuple[int, int]] = None) -> Optional[np.ndarray]:
+    """キーフレームを時系列順に左上から右下へ並べたモザイク画像（BGR）を生成
+
+    グリッドのセル数より画像が多い場合は均等に間引く。
+    """
+    grid = grid or config.get_vlm_mosaic_grid()
+    tile_size = tile_size or config.get_vlm_mosaic_tile_size()
+    labels = list(labels) if labels is not None else [f"#{i + 1}" for i in range(len(images))]
+
+    frames: List[Tuple[np.ndarray, str]] = []
+    for image, label in zip(images, labels):
+        frame = load_bgr(image)
+        if frame is not None:
+            frames.append((frame, label))
+    if not frames:
+        return None
+
+    cols, rows = resolve_grid(len(frames), grid)
+    frames = select_evenly(frames, cols * rows)
+    rows = math.ceil(len(frames) / cols)
+
+    tile_width, tile_height = tile_size
+    mosaic = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+    for index, (frame, label) in enumerate(frames):
+        tile = _fit_to_tile(frame, tile_size)
+        _draw_label(tile, label)
+        row, col = divmod(index, cols)
+        mosaic[row * tile_height:(row + 1) * tile_height, col * tile_width:(col + 1) * tile_width] = tile
+    return mosaic
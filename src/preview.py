@@ -0,0 +1,83 @@
+"""ライブプレビューの縮小・エンコードモジュール"""
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+from image_utils import fit_size
+
+
+class PreviewEncoder:
+    """UIに送るプレビュー画像を作成するクラス
+
+    表示間隔は PREVIEW_MAX_FPS で制限し、表示時には最新フレームのみを使うため、
+    UIの描画が追いつかない間のフレームは読み飛ばす。表示するフレームは
+    PREVIEW_MAX_SIZE に縮小してからオーバーレイを描画し、JPEGに1回だけエンコードする。
+    送信量と処理コストはカメラの解像度や分析処理によらず一定になる。
+    """
+
+    def __init__(self, max_fps: Optional[float] = None, max_size: Optional[Tuple[int, int]] = None,
+                 jpeg_quality: Optional[int] = None):
+        self.interval = 1.0 / (max_fps if max_fps is not None else config.get_preview_max_fps())
+        self.max_size = max_size or config.get_preview_max_size()
+        self.jpeg_quality = jpeg_quality if jpeg_quality is not None else config.get_preview_jpeg_quality()
+        self._next_time = 0.0
+        self._last_frame_count = 0
+        # 最新フレームのコピー先（毎回の確保を避けるため再利用する）
+        self.frame_buffer: Optional[np.ndarray] = None
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
+    def is_due(self, now: Optional[float] = None, frame_count: Optional[int] = None) -> bool:
+        """次のプレビューを表示する時刻になったか判定（frame_count が前回表示したフレームと同じ場合は表示しない）"""
+        if frame_count is not None and frame_count == self._last_frame_count:
+            return False
+        return (now if now is not None else time.time()) >= self._next_time
+
+    def render(self, frame: np.ndarray, frame_count: int, text: str = "") -> Optional[bytes]:
+        """フレームを縮小・エンコードしたJPEGデータを取得（前回と同じフレームの場合はNone）"""
+        if frame_count == self._last_frame_count:
+            return None
+        now = time.time()
+        # 表示が遅れた場合も遅れを取り戻そうとせず、現在時刻から次の表示時刻を決める
+        self._next_time = now + self.interval
+        if self._last_frame_count:
+            self.frames_skipped += max(0, frame_count - self._last_frame_count - 1)
+        self._last_frame_count = frame_count
+        self.frames_shown += 1
+
+        preview = self._resize(frame)
+        if text:
+            self._draw_text(preview, text)
+        ok, encoded = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return encoded.tobytes() if ok else None
+
+    def _resize(self, frame: np.ndarray) -> np.ndarray:
+        """プレビューサイズに縮小（拡大はしない）"""
+        height, width = frame.shape[:2]
+        size = fit_size(width, height, self.max_size)
+        if size == (width, height):
+            # リングバッファから取得したコピーのため、そのままオーバーレイを描画してよい
+            return frame
+        # 先に間引いてからエリア補間することで高解像度のカメラでも計算量を抑える
+        step = max(1, min(width // (size[0] * 2), height // (size[1] * 2)))
+        if step > 1:
+            frame = frame[::step, ::step]
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _draw_text(image: np.ndarray, text: str) -> None:
+        """左上に背景付きのテキストを描画"""
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        position = (10, 30)
+        font_scale = 0.8
+        color = (255, 255, 255)  # 白色
+        thickness = 2
+
+        # テキストの背景を黒に設定（視認性向上）
+        text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
+        cv2.rectangle(image, (position[0] - 5, position[1] - text_size[1] - 5),
+                      (position[0] + text_size[0] + 5, position[1] + 5), (0, 0, 0), -1)
+        cv2.putText(image, text, position, font, font_scale, color, thickness)
@@ -1,46 +1,194 @@
 """キューとイベント管理モジュール"""
 import queue
 import threading
-from typing import Dict, Any
+import time
+from collections import deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import logging
 
+import config
+import metrics
+from file_manager import FileManager
+from utils import select_evenly
+
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class QueueManager:
-    """キューとスレッド管理クラス"""
+    """キューとスレッド管理クラス
+
+    セグメントキューは上限付きで、満杯時の挙動は以下のポリシーから選択する。
+      - drop_oldest: 最も古い待機セグメントを破棄して新しいセグメントを追加
+      - drop_newest: 新しいセグメントを破棄
+      - latest_wins: 常に最新のセグメントのみを保持
+      - coalesce: 新しいセグメントを末尾の待機セグメントに統合し、1回の分析にまとめる
+        （統合後のフレーム数・ファイル数は上限まで均等に間引き、メモリ・ディスク・遅延が増え続けないようにする）
+    破棄されたセグメントは on_drop コールバック（デフォルトはファイル削除）で即座に後始末する。
+
+    キューはカメラ（video_info の camera_id）ごとに分かれており、上限とポリシーはカメラ単位で
+    適用される。取り出しは重み付きラウンドロビン（重みがすべて1なら単純なラウンドロビン）で行い、
+    1台のカメラのセグメントがVLMの処理枠を占有しないようにする。
+    """
 
-    def __init__(self, max_workers: int = 1):
-        self.video_queue: queue.Queue = queue.Queue()
+    def __init__(self, max_workers: int = 1, max_size: Optional[int] = None,
+                 policy: Optional[str] = None,
+                 on_drop: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 weights: Optional[List[int]] = None):
+        self.max_size = max_size if max_size is not None else config.get_segment_queue_max_size()
+        self.policy = policy or config.get_segment_queue_policy()
+        self.on_drop = on_drop or FileManager.remove_segment_files
+        # coalesceで統合したセグメントが保持する候補フレーム数（memoryモード）・ファイル数（fileモード）の上限
+        self.coalesce_max_frames = config.get_memory_segment_candidate_count()
+        self.coalesce_max_files = config.get_segment_queue_coalesce_max_files()
+        self.weights: Dict[int, int] = dict(enumerate(weights if weights is not None else config.get_camera_weights()))
+        self.video_queues: Dict[int, deque] = {}
+        # 重み付きラウンドロビン（smooth weighted round-robin）の現在値
+        self._current_weights: Dict[int, int] = {}
         self.stop_event = threading.Event()
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.drop_counts: Dict[str, int] = {
+            "dropped_oldest": 0,
+            "dropped_newest": 0,
+            "replaced": 0,
+            "coalesced": 0,
+            "coalesce_dropped_frames": 0,
+            "coalesce_dropped_files": 0,
+        }
 
     def put_video_info(self, video_info: Dict[str, Any]) -> bool:
-        """ビデオ情報をキューに追加"""
+        """ビデオ情報をキューに追加
+
+        満杯時はポリシーに従って処理する。ポリシーによる破棄・統合も正常処理としてTrueを返す。
+        """
+        dropped: List[Dict[str, Any]] = []
         try:
             with self.lock:
                 if not isinstance(video_info, dict):
                     logger.error(f"無効なデータ形式です: {type(video_info)}")
                     return False
-                self.video_queue.put_nowait(video_info)
-                return True
-        except queue.Full:
-            logger.error("キューが満杯です")
-            return False
+
+                camera_id = video_info.get('camera_id', 0)
+                video_queue = self.video_queues.setdefault(camera_id, deque())
+                # キュー待ち時間の計測用（統合時は新しいセグメントの追加時刻になる）
+                video_info['enqueued_at'] = time.time()
+                if self.policy == "latest_wins":
+                    while video_queue:
+                        dropped.append(video_queue.popleft())
+                        self.drop_counts["replaced"] += 1
+                        metrics.QUEUE_DROPS.inc(reason="replaced", camera=camera_id)
+                    video_queue.append(video_info)
+                elif len(video_queue) < self.max_size:
+                    video_queue.append(video_info)
+                elif self.policy == "drop_newest":
+                    dropped.append(video_info)
+                    self.drop_counts["dropped_newest"] += 1
+                    metrics.QUEUE_DROPS.inc(reason="dropped_newest", camera=camera_id)
+                elif self.policy == "coalesce":
+                    merged, dropped_frames, dropped_paths = self._coalesce(
+                        video_queue.pop(), video_info, self.coalesce_max_frames, self.coalesce_max_files
+                    )
+                    video_queue.append(merged)
+                    self.drop_counts["coalesced"] += 1
+                    metrics.QUEUE_DROPS.inc(reason="coalesced", camera=camera_id)
+                    self.drop_counts["coalesce_dropped_frames"] += dropped_frames
+                    self.drop_counts["coalesce_dropped_files"] += len(dropped_paths)
+                    metrics.QUEUE_DROPS.inc(dropped_frames, reason="coalesce_dropped_frames", camera=camera_id)
+                    metrics.QUEUE_DROPS.inc(len(dropped_paths), reason="coalesce_dropped_files", camera=camera_id)
+                    if dropped_paths:
+                        # 間引いたファイルは破棄したセグメントと同様に後始末する
+                        dropped.append({'camera_id': camera_id, 'segment_id': merged['segment_id'],
+                                        'file_paths': dropped_paths})
+                else:
+                    dropped.append(video_queue.popleft())
+                    video_queue.append(video_info)
+                    self.drop_counts["dropped_oldest"] += 1
+                    metrics.QUEUE_DROPS.inc(reason="dropped_oldest", camera=camera_id)
+
+                metrics.QUEUE_DEPTH.set(len(video_queue), camera=camera_id)
+                self.not_empty.notify()
         except Exception as e:
             logger.error(f"キューへの追加エラー: {e}")
             return False
 
+        for info in dropped:
+            logger.warning(f"キューが満杯のためセグメントを破棄しました (policy: {self.policy}, "
+                           f"camera: {info.get('camera_id', 0)}, segment: {info.get('segment_id')})")
+            self._drop(info)
+        return True
+
+    @staticmethod
+    def _coalesce(pending: Dict[str, Any], video_info: Dict[str, Any],
+                  max_frames: int, max_files: int) -> Tuple[Dict[str, Any], int, List[str]]:
+        """待機中のセグメントと新しいセグメントを1つの分析単位に統合
+
+        フレーム・ファイルは先頭と末尾を含めて均等に上限数まで間引き、
+        統合後のセグメント情報・間引いたフレーム数・間引いたファイルのパスを返す。
+        """
+        merged = dict(video_info)
+        dropped_frames = 0
+        dropped_paths: List[str] = []
+        if 'frames' in video_info:
+            frames = pending['frames'] + video_info['frames']
+            timestamps = pending['frame_timestamps'] + video_info['frame_timestamps']
+            indices = select_evenly(range(len(frames)), max_frames)
+            merged['frames'] = [frames[i] for i in indices]
+            merged['frame_timestamps'] = [timestamps[i] for i in indices]
+            dropped_frames = len(frames) - len(indices)
+        else:
+            paths = (pending.get('file_paths', [pending['file_path']]) +
+                     video_info.get('file_paths', [video_info['file_path']]))
+            merged['file_paths'] = select_evenly(paths, max_files)
+            dropped_paths = [path for path in paths if path not in merged['file_paths']]
+        merged['first_segment_id'] = pending.get('first_segment_id', pending['segment_id'])
+        if 'start_offset' in pending:
+            merged['start_offset'] = pending['start_offset']
+        return merged, dropped_frames, dropped_paths
+
+    def _drop(self, video_info: Dict[str, Any]) -> None:
+        """破棄したセグメントの後始末"""
+        try:
+            self.on_drop(video_info)
+        except Exception as e:
+            logger.error(f"破棄セグメントの後始末エラー: {e}")
+
+    def _next_camera(self) -> Optional[int]:
+        """待機セグメントのあるカメラから次に処理するカメラを重み付きラウンドロビンで選択"""
+        candidates = [camera_id for camera_id, video_queue in self.video_queues.items() if video_queue]
+        if not candidates:
+            return None
+        total = 0
+        for camera_id in candidates:
+            weight = self.weights.get(camera_id, 1)
+            self._current_weights[camera_id] = self._current_weights.get(camera_id, 0) + weight
+            total += weight
+        selected = max(candidates, key=lambda camera_id: self._current_weights[camera_id])
+        self._current_weights[selected] -= total
+        return selected
+
     def get_video_info(self, timeout: float = 1.0) -> Dict[str, Any]:
         """キューからビデオ情報を取得（タイムアウト付き）"""
         try:
-            return self.video_queue.get(timeout=timeout)
+            deadline = time.monotonic() + timeout
+            with self.not_empty:
+                camera_id = self._next_camera()
+                while camera_id is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty("キューが空です")
+                    self.not_empty.wait(remaining)
+                    camera_id = self._next_camera()
+                video_info = self.video_queues[camera_id].popleft()
+                metrics.QUEUE_DEPTH.set(len(self.video_queues[camera_id]), camera=camera_id)
+            if 'enqueued_at' in video_info:
+                metrics.QUEUE_WAIT_SECONDS.observe(time.time() - video_info['enqueued_at'])
+            return video_info
         except queue.Empty:
-            raise queue.Empty("キューが空です")
+            raise
         except Exception as e:
             logger.error(f"キューからの取得エラー: {e}")
             raise
@@ -48,11 +196,29 @@ class QueueManager:
     def is_empty(self) -> bool:
         """キューが空かどうかを確認"""
         try:
-            return self.video_queue.empty()
+            with self.lock:
+                return not any(self.video_queues.values())
         except Exception as e:
             logger.error(f"キュー空判定エラー: {e}")
             return True
 
+    def get_stats(self) -> Dict[str, Any]:
+        """キューの状態と破棄件数を取得"""
+        with self.lock:
+            sizes = {camera_id: len(video_queue) for camera_id, video_queue in self.video_queues.items()}
+            stats: Dict[str, Any] = {
+                "policy": self.policy,
+                "max_size": self.max_size,
+                "size": sum(sizes.values()),
+                "camera_sizes": sizes,
+                **self.drop_counts,
+            }
+        # 破棄したセグメント数に、coalesceの統合で間引いたフレーム・ファイル数を加えた件数
+        stats["dropped_total"] = (stats["dropped_oldest"] + stats["dropped_newest"] +
+                                  stats["replaced"] + stats["coalesce_dropped_frames"] +
+                                  stats["coalesce_dropped_files"])
+        return stats
+
     def stop(self) -> None:
         """停止イベントをセット"""
         self.stop_event.set()
@@ -86,4 +252,4 @@ class QueueManager:
         try:
             self.executor.shutdown(wait=True)
         except Exception as e:
-            logger.error(f"タスク完了待機エラー: {e}")
\ No newline at end of file
+            logger.error(f"タスク完了待機エラー: {e}")
@@ -0,0 +1,160 @@
+"""VLM応答のキャッシュモジュール"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """送信内容（エンコード済み画像・プロンプト）とモデル・画像設定をキーにしたVLM応答のキャッシュ
+
+    メモリ上のLRU（VLM_CACHE_MAX_ENTRIES件）と、VLM_CACHE_PATH 指定時はSQLiteのディスク層の2段構成。
+    ディスク層は応答の合計サイズが VLM_CACHE_MAX_BYTES を超えると最終参照が古いものから削除する。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, db_path: Optional[Path] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else config.get_vlm_cache_max_entries()
+        self.max_bytes = max_bytes if max_bytes is not None else config.get_vlm_cache_max_bytes()
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.db: Optional[sqlite3.Connection] = None
+
+        db_path = db_path or config.get_vlm_cache_path()
+        if db_path:
+            try:
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                self.db = sqlite3.connect(str(db_path), check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "last_access REAL NOT NULL)"
+                )
+                self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"キャッシュDBを開けませんでした ({db_path}): {e}")
+                self.db = None
+
+    @staticmethod
+    def make_key(message_content: list, model: str) -> str:
+        """送信内容・モデル名・画像設定からキャッシュキー（SHA-256）を作成
+
+        message_content にはプロンプトとエンコード済み画像（データURL）が含まれる。
+        """
+        digest = hashlib.sha256()
+        settings = {
+            "model": model,
+            "image_max_size": config.get_vlm_image_max_size(),
+            "image_mode": config.get_vlm_image_mode(),
+            "jpeg_quality": config.get_vlm_image_jpeg_quality(),
+            "resample": config.get_vlm_image_resample(),
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        for part in message_content:
+            if part.get("type") == "text":
+                digest.update(b"text:" + part["text"].encode("utf-8"))
+            elif part.get("type") == "image_url":
+                digest.update(b"image:" + part["image_url"]["url"].encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュから応答を取得（なければNone）"""
+        with self.lock:
+            response = self.memory.get(key)
+            if response is not None:
+                self.memory.move_to_end(key)
+                self.counts["memory_hits"] += 1
+                metrics.RESPONSE_CACHE_LOOKUPS.inc(result="memory_hit")
+                return response
+
+            if self.db is not None:
+                try:
+                    row = self.db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                        self.db.commit()
+                        self.counts["disk_hits"] += 1
+                        metrics.RESPONSE_CACHE_LOOKUPS.inc(result="disk_hit")
+                        self._put_memory(key, row[0])
+                        return row[0]
+                except sqlite3.Error as e:
+                    logger.error(f"キャッシュDBの読み込みエラー: {e}")
+
+            self.counts["misses"] += 1
+            metrics.RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+    def put(self, key: str, response: str) -> None:
+        """応答をキャッシュに保存"""
+        with self.lock:
+            self._put_memory(key, response)
+            if self.db is None:
+                return
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, response, len(response.encode("utf-8")), time.time())
+                )
+                self._evict_disk()
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"キャッシュDBの書き込みエラー: {e}")
+
+    def _put_memory(self, key: str, response: str) -> None:
+        """メモリ層に追加し、上限を超えた分を古い順に削除（ロック内で呼ぶ）"""
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """ディスク層の合計サイズが上限を超えた分を最終参照が古い順に削除（ロック内で呼ぶ）"""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        logger.info(f"キャッシュDBから {removed} 件の応答を削除しました")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """ヒット数・ミス数・ヒット率と保存件数を取得"""
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.counts)
+            stats["memory_entries"] = len(self.memory)
+            if self.db is not None:
+                try:
+                    count, size = self.db.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()
+                    stats["disk_entries"] = count
+                    stats["disk_bytes"] = size
+                except sqlite3.Error as e:
+                    logger.error(f"キャッシュDBの読み込みエラー: {e}")
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def close(self) -> None:
+        """キャッシュDBを閉じる"""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
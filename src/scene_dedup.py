@@ -0,0 +1,114 @@
+"""知覚ハッシュによるシーン重複判定モジュール"""
+import logging
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+import config
+import metrics
+from image_utils import ImageSource, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+class SceneDeduplicator:
+    """直前に分析したセグメントとキーフレームの知覚ハッシュを比較するクラス
+
+    選択されたキーフレームのaHash/dHash（64bit）を計算し、直前にVLMで分析した
+    セグメントのハッシュ群とのハミング距離（双方向の最近傍距離の最大値）がしきい値以内であれば
+    シーンに変化がないと判定する。判定に使う基準は実際にVLMで分析したセグメントのみ更新する。
+    基準の説明文には、分析中のセグメントの結果を待つためのFutureも登録できる。
+    """
+
+    HASH_SIZE = 8
+
+    def __init__(self, threshold: Optional[int] = None, method: Optional[str] = None):
+        self.threshold = threshold if threshold is not None else config.get_scene_dedup_threshold()
+        self.method = method or config.get_scene_dedup_hash()
+        self._reference_hashes: Optional[np.ndarray] = None
+        self._reference_description: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def average_hash(cls, gray: np.ndarray) -> np.uint64:
+        """8x8のグレースケール画像からaHashを計算"""
+        bits = (gray > gray.mean()).ravel()
+        return np.packbits(bits).view('>u8')[0]
+
+    @classmethod
+    def difference_hash(cls, gray: np.ndarray) -> np.uint64:
+        """9x8のグレースケール画像からdHash（水平方向の輝度勾配）を計算"""
+        bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+        return np.packbits(bits).view('>u8')[0]
+
+    def compute_hashes(self, images: Sequence[ImageSource]) -> np.ndarray:
+        """画像群の知覚ハッシュを計算"""
+        width = self.HASH_SIZE + 1 if self.method == "dhash" else self.HASH_SIZE
+        hashes = []
+        for image in images:
+            thumbnail = make_thumbnail(image, size=(width, self.HASH_SIZE))
+            if thumbnail is None:
+                continue
+            gray = thumbnail.astype(np.float32).mean(axis=2)
+            if self.method == "dhash":
+                hashes.append(self.difference_hash(gray))
+            else:
+                hashes.append(self.average_hash(gray))
+        return np.array(hashes, dtype=np.uint64)
+
+    @staticmethod
+    def hamming_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """ハッシュ群同士のハミング距離行列 (len(a), len(b)) を計算"""
+        xor = np.bitwise_xor(a[:, None], b[None, :])
+        return np.unpackbits(xor.view(np.uint8).reshape(len(a), len(b), 8), axis=2).sum(axis=2)
+
+    def find_match(self, hashes: np.ndarray, count: bool = True) -> Any:
+        """直前の分析セグメントと同一シーンであれば、登録された説明文（またはFuture）を返す
+
+        count=False の場合はヒット・ミスを計上せず、呼び出し側が結果の確定後に record_lookup で計上する。
+        """
+        if self._reference_hashes is None or len(hashes) == 0 or len(self._reference_hashes) == 0:
+            if count:
+                self.record_lookup(False)
+            return None
+
+        distances = self.hamming_distances(hashes, self._reference_hashes)
+        distance = max(int(distances.min(axis=1).max()), int(distances.min(axis=0).max()))
+        if distance <= self.threshold:
+            if count:
+                self.record_lookup(True)
+                logger.info(f"シーン変化なし (ハミング距離: {distance})、VLM呼び出しをスキップします")
+            return self._reference_description
+
+        if count:
+            self.record_lookup(False)
+        return None
+
+    def record_lookup(self, hit: bool) -> None:
+        """判定結果（hit: VLM呼び出しを省略した）を計上"""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.SCENE_DEDUP_LOOKUPS.inc(result="hit" if hit else "miss")
+
+    def update(self, hashes: np.ndarray, description: Any) -> None:
+        """VLMで分析するセグメントのハッシュと説明文（またはFuture）を基準として登録"""
+        self._reference_hashes = hashes
+        self._reference_description = description
+
+    def clear(self, description: Any) -> None:
+        """基準が指定した説明文（またはFuture）のままであれば取り消す（分析に失敗した場合）"""
+        if self._reference_description is description:
+            self._reference_hashes = None
+            self._reference_description = None
+
+    def get_stats(self) -> Dict[str, float]:
+        """ヒット数・ミス数・ヒット率を取得"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,38 @@
+"""インメモリセグメント用の候補フレームバッファモジュール"""
+from typing import List
+
+import numpy as np
+
+
+class SegmentFrameSampler:
+    """セグメント内の候補フレームを一定間隔でサンプリングして保持するクラス
+
+    セグメント長を候補フレーム数で割った間隔でフレームを保持し、
+    mp4へのエンコードを介さずにキーフレーム選択へ渡す。
+    """
+
+    def __init__(self, segment_seconds: float, candidate_count: int):
+        self.candidate_count = max(1, candidate_count)
+        self.sample_interval = segment_seconds / self.candidate_count
+        self.frames: List[np.ndarray] = []
+        self.timestamps: List[float] = []
+        self._next_sample_time = 0.0
+
+    def reset(self, start_time: float) -> None:
+        """新しいセグメント用にバッファを切り替え"""
+        # 前セグメントのリストはキューに渡されているため、クリアせずに新しいリストを割り当てる
+        self.frames = []
+        self.timestamps = []
+        self._next_sample_time = start_time
+
+    def offer(self, frame: np.ndarray, timestamp: float) -> bool:
+        """サンプリング時刻に達していればフレームを保持する"""
+        if len(self.frames) >= self.candidate_count or timestamp < self._next_sample_time:
+            return False
+        self.frames.append(frame.copy())
+        self.timestamps.append(timestamp)
+        self._next_sample_time += self.sample_interval
+        # 処理が遅れた場合に連続して保持しないよう、次回時刻を現在時刻以降に揃える
+        if self._next_sample_time < timestamp:
+            self._next_sample_time = timestamp + self.sample_interval
+        return True
@@ -0,0 +1,164 @@
+"""常駐ffmpegプロセスによるセグメント書き出しモジュール"""
+import logging
+import subprocess
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegSegmentWriter:
+    """1つのffmpegプロセスに生フレームを標準入力で送り続け、segmentマルチプレクサで分割するクラス
+
+    セグメントごとにライターを作り直さないため、区切りのたびにキャプチャスレッドで
+    初期化コストが発生しない。キーフレームはセグメントの先頭と、1セグメントあたり
+    FFMPEG_KEYFRAME_COUNT 枚となる固定間隔で挿入する（Iフレーム抽出と位置が揃う）。
+    書き終わったセグメントのファイル名は -segment_list の出力（標準出力）から受け取る。
+    """
+
+    def __init__(self, output_dir: Path, fps: float, frame_size: Tuple[int, int],
+                 segment_seconds: float, start_number: int = 1,
+                 name_prefix: str = "segment_", ffmpeg_path: str = 'ffmpeg') -> None:
+        self.output_dir = output_dir
+        self.fps = fps
+        self.frame_size = frame_size
+        self.segment_seconds = segment_seconds
+        self.name_prefix = name_prefix
+        self.ffmpeg_path = ffmpeg_path
+        self.frames_written = 0
+        self._start_number = start_number
+        self._frames_per_segment = max(1.0, segment_seconds * fps)
+        self._completed: List[Path] = []
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+        self._threads: List[threading.Thread] = []
+
+    def _build_command(self) -> List[str]:
+        """ffmpegのコマンドラインを構築"""
+        width, height = self.frame_size
+        keyframe_interval = max(1, int(self._frames_per_segment // config.get_ffmpeg_keyframe_count()))
+        encoder_size = config.get_segment_encoder_size()
+        if encoder_size:
+            scale = f"scale={encoder_size[0]}:{encoder_size[1]}"
+        else:
+            # yuv420pは幅・高さが偶数である必要がある
+            scale = "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+
+        command = [
+            self.ffmpeg_path,
+            '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f"{width}x{height}", '-framerate', f"{self.fps:g}",
+            '-i', 'pipe:0',
+            '-vf', scale,
+            '-c:v', config.get_segment_encoder_codec(),
+        ]
+        preset = config.get_segment_encoder_preset()
+        if preset:
+            command += ['-preset', preset]
+        command += [
+            '-pix_fmt', 'yuv420p',
+            '-g', str(keyframe_interval), '-keyint_min', str(keyframe_interval), '-sc_threshold', '0',
+            '-force_key_frames', f"expr:gte(t,n_forced*{self.segment_seconds:g})",
+            '-f', 'segment',
+            '-segment_time', f"{self.segment_seconds:g}",
+            '-segment_format', 'mp4',
+            '-segment_start_number', str(self._start_number),
+            '-reset_timestamps', '1',
+            '-segment_list', 'pipe:1', '-segment_list_type', 'flat',
+            str(self.output_dir / f"{self.name_prefix}%d.mp4"),
+        ]
+        return command
+
+    def start(self) -> None:
+        """ffmpegプロセスを起動"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        command = self._build_command()
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.frames_written = 0
+        self._threads = [
+            threading.Thread(target=self._read_segment_list, args=(self._process.stdout,), daemon=True),
+            threading.Thread(target=self._read_errors, args=(self._process.stderr,), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"ffmpegセグメントライターを開始: {self.name_prefix}{self._start_number}〜 ({self.frame_size[0]}x{self.frame_size[1]})")
+
+    def _read_segment_list(self, stream) -> None:
+        """書き終わったセグメントのファイル名を標準出力から受け取る"""
+        for line in iter(stream.readline, b''):
+            name = line.decode(errors='replace').strip()
+            if not name:
+                continue
+            path = self.output_dir / Path(name).name
+            logger.info(f"セグメントを保存: {path.name}")
+            with self._lock:
+                self._completed.append(path)
+
+    @staticmethod
+    def _read_errors(stream) -> None:
+        """ffmpegのエラー出力をログに転送"""
+        for line in iter(stream.readline, b''):
+            message = line.decode(errors='replace').strip()
+            if message:
+                logger.error(f"ffmpegセグメントライター: {message}")
+
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def segment_number_for(self, frame_index: int) -> int:
+        """フレーム番号（プロセス起動からの連番）が属するセグメント番号を取得"""
+        return self._start_number + int(frame_index // self._frames_per_segment)
+
+    def write(self, frame: np.ndarray) -> Optional[int]:
+        """フレームを送信し、そのフレームが属するセグメント番号を返す（失敗時はNone）"""
+        if not self.is_running:
+            return None
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            logger.error(f"フレームサイズが変わったため書き込みをスキップします: {frame.shape[1]}x{frame.shape[0]}")
+            return None
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError) as e:
+            logger.error(f"ffmpegセグメントライターへの書き込みエラー: {e}")
+            self.close()
+            return None
+        number = self.segment_number_for(self.frames_written)
+        self.frames_written += 1
+        return number
+
+    def pop_completed(self) -> List[Path]:
+        """書き終わったセグメントのファイルパスを取り出す"""
+        with self._lock:
+            completed, self._completed = self._completed, []
+        return completed
+
+    def close(self, timeout: float = 10.0) -> None:
+        """標準入力を閉じ、書き込み中のセグメントを確定させてからプロセスを終了"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error("ffmpegセグメントライターの終了がタイムアウトしました")
+            process.kill()
+            process.wait()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
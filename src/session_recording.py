@@ -0,0 +1,235 @@
+"""セッションの記録と再生モジュール
+
+キャプチャしたフレームを元のタイムスタンプ付きでチャンク単位のファイルに記録し、
+同じフレーム列をカメラと同じインターフェース（cv2.VideoCapture互換）で再生する。
+現場で起きた性能問題を、同一の入力でセグメント化・キーフレーム抽出・VLM呼び出しまで再現できる。
+
+ファイル形式（.vlmrec）:
+    MAGIC | メタデータ | チャンク | チャンク | ...
+    メタデータ・チャンクのヘッダーは 4バイト長（ビッグエンディアン）+ JSON。
+    チャンクのヘッダーは {"timestamps": [...], "sizes": [...]} で、直後に各フレームのJPEGデータが続く。
+"""
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import cv2
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"VLMREC1\n"
+REPLAY_PREFIX = "replay://"
+_LENGTH = struct.Struct(">I")
+
+
+def is_replay_source(source) -> bool:
+    """記録したセッションを再生するソースのURLかどうかを判定"""
+    return isinstance(source, str) and source.startswith(REPLAY_PREFIX)
+
+
+def _write_block(file: BinaryIO, header: dict, payload: bytes = b"") -> None:
+    data = json.dumps(header).encode("utf-8")
+    file.write(_LENGTH.pack(len(data)))
+    file.write(data)
+    file.write(payload)
+
+
+def _read_header(file: BinaryIO) -> Optional[dict]:
+    length_bytes = file.read(_LENGTH.size)
+    if len(length_bytes) < _LENGTH.size:
+        return None
+    (length,) = _LENGTH.unpack(length_bytes)
+    data = file.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data)
+
+
+class SessionRecorder:
+    """フレームをタイムスタンプ付きでチャンク単位に記録するクラス
+
+    JPEGエンコードと書き込みは専用スレッドで行い、キャプチャスレッドは待たせない。
+    書き込みが追いつかずキューが満杯の場合はフレームを記録せずに破棄する（dropped に計上）。
+    """
+
+    def __init__(self, path: Path, fps: float, source: str = "",
+                 jpeg_quality: Optional[int] = None, chunk_frames: Optional[int] = None):
+        self.path = path
+        self.fps = fps
+        self.source = source
+        self.jpeg_quality = jpeg_quality if jpeg_quality is not None else config.get_session_record_jpeg_quality()
+        self.chunk_frames = chunk_frames if chunk_frames is not None else config.get_session_record_chunk_frames()
+        self.frames_written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(fps * 2)))
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """記録ファイルを作成し、書き込みスレッドを開始"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, name="session-recorder", daemon=True)
+        self._thread.start()
+        logger.info(f"セッションの記録を開始: {self.path}")
+
+    def write(self, frame: np.ndarray, timestamp: Optional[float] = None) -> None:
+        """フレームを記録キューに追加（満杯の場合は破棄）"""
+        try:
+            self._queue.put_nowait((frame, timestamp if timestamp is not None else time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self) -> None:
+        try:
+            self._write_frames()
+        except Exception as e:
+            logger.error(f"セッションの記録エラー ({self.path}): {e}")
+
+    def _write_frames(self) -> None:
+        timestamps: List[float] = []
+        encoded: List[bytes] = []
+        with open(self.path, "wb") as file:
+            file.write(MAGIC)
+            _write_block(file, {"version": 1, "fps": self.fps, "source": self.source,
+                                "jpeg_quality": self.jpeg_quality, "created_at": time.time()})
+            while True:
+                item = self._queue.get()
+                if item is not None:
+                    frame, timestamp = item
+                    ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                    if ok:
+                        timestamps.append(timestamp)
+                        encoded.append(data.tobytes())
+                if encoded and (item is None or len(encoded) >= self.chunk_frames):
+                    _write_block(file, {"timestamps": timestamps, "sizes": [len(data) for data in encoded]},
+                                 b"".join(encoded))
+                    file.flush()
+                    self.frames_written += len(encoded)
+                    timestamps, encoded = [], []
+                if item is None:
+                    break
+
+    def close(self, timeout: float = 5.0) -> None:
+        """残りのフレームを書き出して記録を終了（書き込みスレッドが停止している場合は待たない）"""
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning(f"セッションの記録を終了できません（書き込みが停止しています）: {self.path}")
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        logger.info(f"セッションの記録を終了: {self.path} ({self.frames_written} フレーム, 破棄 {self.dropped} フレーム)")
+
+
+class SessionReader:
+    """記録ファイルを開き、メタデータと (タイムスタンプ, JPEGデータ) を順に読み込むクラス"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f"セッション記録ファイルではありません: {path}")
+        metadata = _read_header(self._file)
+        if metadata is None:
+            self._file.close()
+            raise ValueError(f"セッション記録ファイルが壊れています: {path}")
+        self.metadata: dict = metadata
+
+    def frames(self) -> Iterator[Tuple[float, bytes]]:
+        """(タイムスタンプ, JPEGデータ) を記録順に返す（チャンク単位で読み込み、ファイル全体をメモリに載せない）"""
+        while True:
+            header = _read_header(self._file)
+            if header is None:
+                return
+            payload = self._file.read(sum(header["sizes"]))
+            position = 0
+            for timestamp, size in zip(header["timestamps"], header["sizes"]):
+                yield timestamp, payload[position:position + size]
+                position += size
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ReplayCapture:
+    """記録したセッションを再生するキャプチャ（cv2.VideoCapture互換）
+
+    speed=1 は記録時と同じ間隔、speed=N はN倍速、speed=0 は待たずに可能な限り速く返す。
+    clock() は記録時の時間軸を再生開始時刻に重ねた時刻を返し、VideoCaptureManager は
+    これを使ってセグメントを区切るため、再生速度によらず同じフレームが同じセグメントに入る。
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = max(0.0, speed)
+        self._reader = SessionReader(Path(path))
+        self._frames = self._reader.frames()
+        self.metadata = self._reader.metadata
+        self.fps = float(self.metadata.get("fps") or config.get_target_fps())
+        self._opened = True
+        # 記録の末尾まで再生したか（カメラの読み込み失敗と区別して、キャプチャを終了させる）
+        self.ended = False
+        self._first_timestamp: Optional[float] = None
+        self._current_timestamp: Optional[float] = None
+        self._wall_start: Optional[float] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "ReplayCapture":
+        """replay://ファイルパス?speed=N（N=max で最速）形式のURLから作成"""
+        parsed = urlparse(url)
+        path = unquote(parsed.netloc + parsed.path)
+        speed_str = parse_qs(parsed.query).get("speed", ["1"])[0]
+        return cls(path, 0.0 if speed_str == "max" else float(speed_str))
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def clock(self) -> float:
+        """記録時の時間軸での現在時刻（再生開始時刻を起点とする）"""
+        if self._wall_start is None:
+            return time.time()
+        return self._wall_start + (self._current_timestamp - self._first_timestamp)
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        try:
+            timestamp, data = next(self._frames)
+        except StopIteration:
+            self._opened = False
+            self.ended = True
+            logger.info(f"記録したセッションの再生が終了しました: {self.path}")
+            return False, None
+
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+            self._wall_start = time.time()
+        elif self.speed > 0:
+            due = self._wall_start + (timestamp - self._first_timestamp) / self.speed
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        self._current_timestamp = timestamp
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return frame is not None, frame
+
+    def release(self) -> None:
+        self._opened = False
+        self._frames.close()
+        self._reader.close()
@@ -0,0 +1,142 @@
+"""ベンチマーク・動作確認用の合成映像ソース
+
+cv2.VideoCapture と同じインターフェース（read / get / isOpened / release）を持ち、
+VideoCaptureManager のカメラソースとして使用できる。フレームは指定したFPSに合わせて
+実時間で返すため、カメラと同じタイミングでパイプラインを動かせる。
+
+  - synthetic://1280x720@30 : 移動する図形とノイズを描画した手続き的なフレーム
+  - loop:///path/to/video.mp4 : 動画ファイルを末尾で先頭に戻して繰り返し再生
+"""
+import re
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+SYNTHETIC_PREFIX = "synthetic://"
+LOOP_PREFIX = "loop://"
+
+
+def is_synthetic_source(source) -> bool:
+    """合成映像ソースのURLかどうかを判定"""
+    return isinstance(source, str) and source.startswith((SYNTHETIC_PREFIX, LOOP_PREFIX))
+
+
+def open_synthetic_source(source: str):
+    """URLから合成映像ソースを作成"""
+    if source.startswith(LOOP_PREFIX):
+        return LoopingFileCapture(source[len(LOOP_PREFIX):])
+    return SyntheticCapture.from_url(source)
+
+
+class _PacedCapture:
+    """フレームをFPSに合わせて実時間で返す基底クラス"""
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self._next_time: Optional[float] = None
+
+    def _wait_for_next_frame(self) -> None:
+        now = time.monotonic()
+        if self._next_time is None:
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        else:
+            # 読み手が遅れた場合は遅れを取り戻そうとせず、現在時刻を基準にする
+            self._next_time = now
+        self._next_time += 1.0 / self.fps
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+
+class SyntheticCapture(_PacedCapture):
+    """移動する図形とノイズからなる合成フレームを生成するキャプチャ
+
+    シーンは数秒ごとに切り替わるため、キーフレーム選択やシーン重複判定も通常の映像と同様に動く。
+    乱数のシードを固定しているため、同じ設定では常に同じフレーム列になる。
+    """
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 30.0,
+                 scene_seconds: float = 4.0, seed: int = 0):
+        super().__init__(fps)
+        self.width = width
+        self.height = height
+        self.scene_frames = max(1, int(scene_seconds * fps))
+        self.frame_index = 0
+        self._rng = np.random.default_rng(seed)
+        self._opened = True
+        # 背景とノイズはあらかじめ生成し、フレームごとの生成コストを抑える
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        self._background = np.broadcast_to(gradient, (height, width, 3)).astype(np.uint8)
+        self._noise = [self._rng.integers(0, 16, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        self._scene_colors = [tuple(int(c) for c in self._rng.integers(0, 256, 3)) for _ in range(8)]
+
+    @classmethod
+    def from_url(cls, url: str) -> "SyntheticCapture":
+        """synthetic://幅x高さ@FPS 形式のURLから作成（省略時は1280x720@30）"""
+        match = re.match(r'^synthetic://(?:(\d+)x(\d+))?(?:@([\d.]+))?$', url)
+        if not match:
+            raise ValueError(f"合成映像ソースの形式が不正です: {url}")
+        width, height, fps = match.groups()
+        return cls(int(width or 1280), int(height or 720), float(fps or 30.0))
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def _render(self) -> np.ndarray:
+        scene = self.frame_index // self.scene_frames
+        frame = self._background.copy()
+        # シーンごとに背景の色味を変える
+        frame[:, :, scene % 3] //= 2
+        progress = (self.frame_index % self.scene_frames) / self.scene_frames
+        size = max(8, min(self.width, self.height) // 6)
+        x = int(progress * (self.width - size))
+        y = int((0.5 + 0.4 * np.sin(2 * np.pi * progress)) * (self.height - size))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), self._scene_colors[scene % len(self._scene_colors)], -1)
+        cv2.circle(frame, (self.width - x - size // 2, self.height // 2), size // 2,
+                   self._scene_colors[(scene + 3) % len(self._scene_colors)], -1)
+        cv2.putText(frame, f"scene {scene} frame {self.frame_index}", (20, self.height - 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        cv2.add(frame, self._noise[self.frame_index % len(self._noise)], dst=frame)
+        return frame
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        self._wait_for_next_frame()
+        frame = self._render()
+        self.frame_index += 1
+        return True, frame
+
+    def release(self) -> None:
+        self._opened = False
+
+
+class LoopingFileCapture(_PacedCapture):
+    """動画ファイルを繰り返し再生するキャプチャ（ファイルのFPSで実時間再生）"""
+
+    def __init__(self, path: str, fps: Optional[float] = None):
+        self.cap = cv2.VideoCapture(path)
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        super().__init__(fps or (file_fps if file_fps > 0 else 30.0))
+        self.path = path
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        self._wait_for_next_frame()
+        ret, frame = self.cap.read()
+        if not ret:
+            # 末尾に達したら先頭に戻る
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self) -> None:
+        self.cap.release()
@@ -5,6 +5,9 @@
 """
 
 from datetime import datetime
+from typing import List, Sequence, TypeVar
+
+T = TypeVar("T")
 
 
 def format_time(seconds: int) -> str:
@@ -33,6 +36,23 @@ def get_segment_start_time(start_time: datetime) -> str:
     return format_time(current_segment_start)
 
 
+def segment_name(camera_id: int, segment_id) -> str:
+    """カメラごとに名前空間を分けたセグメント名（ファイル名の接頭辞）を取得"""
+    return f"cam{camera_id}_segment_{segment_id}"
+
+
+def select_evenly(items: Sequence[T], count: int) -> List[T]:
+    """シーケンスから先頭と末尾を含めて均等な間隔でcount個の要素を選択"""
+    if count <= 0:
+        return []
+    if len(items) <= count:
+        return list(items)
+    if count == 1:
+        return [items[len(items) // 2]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
 def setup_directories(cleanup: bool = True) -> None:
     """必要なディレクトリを作成
 
@@ -2,22 +2,43 @@
 import cv2
 import time
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import logging
 import re
 
+import numpy as np
+
 import config
+from image_utils import fit_size, make_thumbnail
+from segment_buffer import SegmentFrameSampler
+from segment_writer import FFmpegSegmentWriter
+from session_recording import ReplayCapture, is_replay_source
+from synthetic_source import is_synthetic_source, open_synthetic_source
+from utils import segment_name
+
+# 動き検知で画素が変化したとみなす輝度差（0〜255、これ以下はセンサーノイズとして無視する）
+MOTION_PIXEL_THRESHOLD = 25
 
 
 class VideoCaptureManager:
     """ビデオキャプチャの管理クラス"""
 
-    def __init__(self, camera_source: int | str = config.get_camera_source()) -> None:
+    def __init__(self, camera_source: int | str = config.get_camera_source(), camera_id: int = 0) -> None:
         self.logger = logging.getLogger(__name__)
+        # 複数カメラでセグメント名が衝突しないよう、ファイル名はカメラIDで名前空間を分ける
+        self.camera_id = camera_id
 
         # URL形式かどうかを判定
-        if isinstance(camera_source, str) and re.match(r'^https?://', camera_source):
+        if is_replay_source(camera_source):
+            # 記録したセッションの再生
+            self.cap = ReplayCapture.from_url(camera_source)
+            self.logger.info(f"記録したセッションを再生: {camera_source}")
+        elif is_synthetic_source(camera_source):
+            # ベンチマーク・動作確認用の合成映像
+            self.cap = open_synthetic_source(camera_source)
+            self.logger.info(f"合成映像ソースを開始: {camera_source}")
+        elif isinstance(camera_source, str) and re.match(r'^https?://', camera_source):
             # HTTP/RTSPストリームの場合
             self.cap = cv2.VideoCapture(camera_source)
             self.logger.info(f"HTTP/RTSPストリームを開始: {camera_source}")
@@ -28,12 +49,45 @@ class VideoCaptureManager:
                 raise RuntimeError(f"カメラを開けませんでした (index: {camera_source})")
             self.logger.info(f"カメラを開始: {camera_source}")
 
+        # セグメントの区切りはソースの時間軸で判定する（再生ソースでは記録時の時刻、それ以外は現在時刻）
+        self.clock = getattr(self.cap, 'clock', time.time)
         self._fps = self._determine_fps()
         self.video_writer: Optional[cv2.VideoWriter] = None
         self.segment_count: int = 0
-        self.start_time: float = time.time()
+        self.start_time: float = self.clock()
+        self.capture_start_time: float = self.start_time
         self.current_output_path: Optional[Path] = None
 
+        # motionモードでは動きのないセグメントを省略し、動きの開始でセグメントを早めに区切る
+        self.trigger_mode = config.get_segment_trigger()
+        self.motion_level: float = 0.0
+        self.motion_active: bool = False
+        self.segment_has_motion: bool = False
+        self._previous_motion_thumbnail: Optional[np.ndarray] = None
+        self._last_emit_time: float = self.start_time
+
+        # memoryモードではmp4を書き出さず、候補フレームをメモリ上に保持する
+        self.segment_mode = config.get_segment_mode()
+        self.segment_sampler: Optional[SegmentFrameSampler] = None
+        if self.segment_mode == "memory":
+            self.segment_sampler = SegmentFrameSampler(
+                config.get_capture_interval(),
+                config.get_memory_segment_candidate_count()
+            )
+
+        # 記録用フレームは分析用解像度に縮小し、プレビューのみフル解像度のまま扱う
+        self.analysis_resolution = config.get_segment_analysis_resolution()
+        self._record_size: Optional[Tuple[int, int]] = None
+        self._record_source_size: Optional[Tuple[int, int]] = None
+
+        # ffmpegバックエンドでは常駐プロセスのsegmentマルチプレクサがCAPTURE_INTERVALごとに区切る
+        self.writer_backend = config.get_segment_writer_backend() if self.segment_mode == "file" else None
+        self.segment_writer: Optional[FFmpegSegmentWriter] = None
+        self._writer_segments: Dict[int, dict] = {}
+        self._completed_segment_paths: List[Path] = []
+        if self.writer_backend == "ffmpeg" and self.trigger_mode == "motion":
+            self.logger.info("ffmpegバックエンドでは動きの開始による早期の区切りは行わず、省略判定のみ行います")
+
     def _determine_fps(self) -> float:
         """適切なFPSを決定"""
         fps_setting = self.cap.get(cv2.CAP_PROP_FPS)
@@ -44,15 +98,51 @@ class VideoCaptureManager:
             self.logger.info(f"デフォルトFPSを使用: {config.get_target_fps()}")
             return config.get_target_fps()
 
+    def _get_record_size(self, frame) -> Tuple[int, int]:
+        """記録用フレームの大きさ（幅,高さ）を取得"""
+        height, width = frame.shape[:2]
+        if not self.analysis_resolution:
+            return width, height
+        if self._record_source_size != (width, height):
+            record_width, record_height = fit_size(width, height, config.get_vlm_image_max_size())
+            # yuv420pでのエンコードに備えて偶数に揃える
+            record_width = max(2, record_width - record_width % 2)
+            record_height = max(2, record_height - record_height % 2)
+            self._record_size = (record_width, record_height)
+            self._record_source_size = (width, height)
+            if (record_width, record_height) != (width, height):
+                self.logger.info(f"セグメントを分析用解像度で記録: {width}x{height} → {record_width}x{record_height}")
+        return self._record_size
+
+    def to_record_frame(self, frame):
+        """フレームを記録用の解像度に縮小（縮小不要ならそのまま返す）"""
+        record_size = self._get_record_size(frame)
+        if record_size == (frame.shape[1], frame.shape[0]):
+            return frame
+        return cv2.resize(frame, record_size, interpolation=cv2.INTER_AREA)
+
     def start_new_segment(self, frame) -> None:
         """新しいビデオセグメントを開始"""
+        if self.writer_backend == "ffmpeg":
+            self._start_segment_writer(frame)
+            return
+
         self._release_writer()  # 既存のライターを解放
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.segment_count += 1
-        self.current_output_path = config.get_output_dir() / f"segment_{self.segment_count}.mp4"
 
-        height, width = frame.shape[:2]
+        self.segment_has_motion = False
+
+        if self.segment_sampler is not None:
+            self.segment_sampler.reset(self.clock())
+            self.logger.info(f"新しいインメモリセグメントを開始: {segment_name(self.camera_id, self.segment_count)}")
+            self.start_time = self.clock()
+            return
+
+        self.current_output_path = config.get_output_dir() / f"{segment_name(self.camera_id, self.segment_count)}.mp4"
+
+        width, height = self._get_record_size(frame)
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         self.video_writer = cv2.VideoWriter(
             str(self.current_output_path),
@@ -62,25 +152,217 @@ class VideoCaptureManager:
         )
 
         self.logger.info(f"新しいビデオセグメントを開始: {self.current_output_path.name}")
-        self.start_time = time.time()
+        self.start_time = self.clock()
+
+    def _start_segment_writer(self, frame) -> None:
+        """常駐ffmpegプロセスを起動（異常終了後は続きのセグメント番号から再起動）"""
+        if self.segment_writer is not None:
+            # 終了したプロセスが書き終えていたセグメントは引き継ぎ、書きかけのセグメントは破棄する
+            self.segment_writer.close()
+            self._completed_segment_paths.extend(self.segment_writer.pop_completed())
+            completed_names = {path.name for path in self._completed_segment_paths}
+            for number in list(self._writer_segments):
+                path = config.get_output_dir() / f"{segment_name(self.camera_id, number)}.mp4"
+                if path.name not in completed_names:
+                    del self._writer_segments[number]
+                    path.unlink(missing_ok=True)
+
+        width, height = self._get_record_size(frame)
+        self.segment_writer = FFmpegSegmentWriter(
+            config.get_output_dir(),
+            self.fps,
+            (width, height),
+            config.get_capture_interval(),
+            start_number=self.segment_count + 1,
+            name_prefix=segment_name(self.camera_id, "")
+        )
+        try:
+            self.segment_writer.start()
+        except FileNotFoundError:
+            self.logger.error("ffmpegが見つかりません。SEGMENT_WRITER_BACKEND=opencv を使用してください")
+            raise
+        self.start_time = self.clock()
+
+    def _write_to_segment_writer(self, frame) -> None:
+        """ffmpegプロセスにフレームを送り、セグメントごとの情報を更新"""
+        number = self.segment_writer.write(frame)
+        if number is None:
+            return
+        now = self.clock()
+        segment = self._writer_segments.get(number)
+        if segment is None:
+            self.segment_count = number
+            self.start_time = now
+            segment = {
+                'camera_id': self.camera_id,
+                'segment_id': number,
+                'timestamp': datetime.now().isoformat(),
+                'start_offset': now - self.capture_start_time,
+                'has_motion': False,
+            }
+            self._writer_segments[number] = segment
+        segment['end_offset'] = now - self.capture_start_time
+        segment['captured_at'] = time.time()
+        segment['has_motion'] = segment['has_motion'] or self.motion_active
+
+    def pop_completed_segments(self) -> List[dict]:
+        """ffmpegバックエンドで書き終わったセグメントのうち、分析対象のセグメント情報を取り出す
+
+        opencvバックエンド・memoryモードでは区切りの時点で finish_segment が返すため常に空。
+        """
+        if self.segment_writer is None:
+            return []
+
+        paths = self._completed_segment_paths + self.segment_writer.pop_completed()
+        self._completed_segment_paths = []
+        completed = []
+        for path in paths:
+            match = re.search(r'_segment_(\d+)\.mp4$', path.name)
+            number = int(match.group(1)) if match else None
+            info = self._writer_segments.pop(number, None)
+            if info is None:
+                continue
+            if not self.should_emit_segment(info['has_motion']):
+                self.logger.info(f"動きがないためセグメントを省略: {segment_name(self.camera_id, number)}")
+                try:
+                    path.unlink(missing_ok=True)
+                except Exception as e:
+                    self.logger.error(f"セグメント削除エラー ({path}): {e}")
+                continue
+            self._last_emit_time = self.clock()
+            info['file_path'] = str(path)
+            completed.append(info)
+        return completed
 
     def write_frame(self, frame) -> None:
-        """フレームを書き込み"""
-        if self.video_writer is not None:
+        """フレームを書き込み（SEGMENT_ANALYSIS_RESOLUTION 有効時は縮小してから記録）"""
+        if self.motion_active:
+            self.segment_has_motion = True
+        if self.analysis_resolution:
+            frame = self.to_record_frame(frame)
+        if self.segment_writer is not None:
+            self._write_to_segment_writer(frame)
+        elif self.segment_sampler is not None:
+            self.segment_sampler.offer(frame, self.clock())
+        elif self.video_writer is not None:
             self.video_writer.write(frame)
 
+    def update_motion(self, frame) -> float:
+        """縮小グレースケール画像のフレーム間差分から動き量（0〜1）を計算
+
+        動き量は輝度差が MOTION_PIXEL_THRESHOLD を超えた画素の割合とし、
+        画面の一部で起きた動きが静止した背景で薄まらないようにする。
+        """
+        if self.trigger_mode != "motion":
+            return 0.0
+        thumbnail = make_thumbnail(frame, size=(64, 36)).astype(np.float32).mean(axis=2)
+        previous = self._previous_motion_thumbnail
+        self._previous_motion_thumbnail = thumbnail
+        if previous is None:
+            self.motion_level = 0.0
+        else:
+            self.motion_level = float((np.abs(thumbnail - previous) > MOTION_PIXEL_THRESHOLD).mean())
+        self.motion_active = self.motion_level >= config.get_motion_threshold()
+        return self.motion_level
+
     def should_start_new_segment(self) -> bool:
         """新しいセグメントを開始するタイミングか判定"""
-        return (self.video_writer is None or
-                time.time() - self.start_time >= config.get_capture_interval())
+        if self.writer_backend == "ffmpeg":
+            # 区切りはffmpegが行うため、プロセスが動いていない場合のみ（再）起動する
+            return self.segment_writer is None or not self.segment_writer.is_running
+        elapsed = self.clock() - self.start_time
+        if self.segment_sampler is not None:
+            if self.segment_count == 0:
+                return True
+        elif self.video_writer is None:
+            return True
+        if elapsed >= config.get_capture_interval():
+            return True
+        # 動きのなかったセグメントで動きが始まったら、動きの開始位置で区切る
+        return (self.trigger_mode == "motion" and self.motion_active and not self.segment_has_motion
+                and elapsed >= config.get_motion_min_segment_seconds())
+
+    def has_current_segment(self) -> bool:
+        """キューに渡せる記録中のセグメントがあるか判定"""
+        if self.segment_count == 0 or self.writer_backend == "ffmpeg":
+            return False
+        return self.segment_sampler is not None or self.current_output_path is not None
+
+    def should_emit_segment(self, has_motion: Optional[bool] = None) -> bool:
+        """記録中（または指定した動きの有無）のセグメントを分析対象とするか判定
+
+        motionモードでは動きのあったセグメントのみを対象とし、動きのないセグメントは
+        ハートビート間隔ごとに1つだけ対象とする（間隔が0の場合は常に省略）。
+        """
+        if has_motion is None:
+            has_motion = self.segment_has_motion
+        if self.trigger_mode != "motion" or has_motion:
+            return True
+        heartbeat_interval = config.get_motion_heartbeat_interval()
+        return heartbeat_interval > 0 and self.clock() - self._last_emit_time >= heartbeat_interval
+
+    def finish_segment(self) -> Optional[dict]:
+        """記録中のセグメントを締め、分析対象であればセグメント情報を返す
+
+        分析対象外のセグメントはその場で破棄する。
+        """
+        if not self.has_current_segment():
+            return None
+        if not self.should_emit_segment():
+            self.discard_current_segment()
+            return None
+        self._last_emit_time = self.clock()
+        return self.get_current_segment_info()
+
+    def discard_current_segment(self) -> None:
+        """記録中のセグメントを破棄"""
+        self.logger.info(f"動きがないためセグメントを省略: {segment_name(self.camera_id, self.segment_count)}")
+        self._release_writer()
+        if self.segment_sampler is not None:
+            self.segment_sampler.reset(self.clock())
+        elif self.current_output_path is not None:
+            try:
+                self.current_output_path.unlink(missing_ok=True)
+            except Exception as e:
+                self.logger.error(f"セグメント削除エラー ({self.current_output_path}): {e}")
+            self.current_output_path = None
 
     def get_current_segment_info(self) -> dict:
         """現在のセグメント情報を取得"""
-        return {
+        info = {
+            'camera_id': self.camera_id,
             'segment_id': self.segment_count,
             'file_path': str(self.current_output_path),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            # キャプチャ開始からの経過秒数で表したセグメントの開始・終了位置
+            'start_offset': self.start_time - self.capture_start_time,
+            'end_offset': self.clock() - self.capture_start_time,
+            # 記録終了時刻（分析結果の遅延・期限の基準）
+            'captured_at': time.time(),
+            'has_motion': self.segment_has_motion,
         }
+        if self.segment_sampler is not None:
+            info.update({
+                'file_path': None,
+                'frames': self.segment_sampler.frames,
+                'frame_timestamps': self.segment_sampler.timestamps,
+            })
+        return info
+
+    @property
+    def stream_ended(self) -> bool:
+        """ソースが終端に達したか（記録したセッションの再生が終わった場合など）"""
+        return getattr(self.cap, 'ended', False)
+
+    def finish_stream(self) -> List[dict]:
+        """ソースの終端で記録中のセグメントを締め、分析対象のセグメント情報を返す"""
+        if self.segment_writer is not None:
+            # ffmpegを終了させて書き込み中のセグメントを確定させる
+            self.segment_writer.close()
+            return self.pop_completed_segments()
+        video_info = self.finish_segment()
+        self._release_writer()
+        return [video_info] if video_info else []
 
     def _release_writer(self) -> None:
         """ビデオライターを解放"""
@@ -93,6 +375,9 @@ class VideoCaptureManager:
     def release(self) -> None:
         """リソースを解放"""
         self._release_writer()
+        if self.segment_writer is not None:
+            self.segment_writer.close()
+            self.segment_writer = None
         if self.cap is not None:
             self.cap.release()
 
@@ -1,18 +1,28 @@
 """ビデオ処理関連クラス"""
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 import asyncio
 import threading
 import queue
 import logging
+import re
+import time
+from collections import deque
 from datetime import datetime
+import numpy as np
 import config
+import metrics
 
 from video_capture import VideoCaptureManager
+from frame_buffer import FrameRingBuffer
 from keyframe_extractor import KeyframeExtractor
 from vlm_client import VLMClient
 from file_manager import FileManager
+from history_store import HistoryRecord, HistoryStore
 from queue_manager import QueueManager
+from scene_dedup import SceneDeduplicator
+from session_recording import SessionRecorder
+from utils import format_time, segment_name
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
@@ -20,34 +30,84 @@ logger = logging.getLogger(__name__)
 
 
 class VideoProcessor:
-    """ビデオ処理クラス"""
+    """ビデオ処理クラス
+
+    CAMERA_SOURCES の各カメラをそれぞれのキャプチャスレッドで読み込み、全カメラのセグメントを
+    共有のキュー（カメラごとの上限と重み付きラウンドロビン）から1つのVLMクライアントで分析する。
+    """
 
     def __init__(self):
+        self.camera_sources = config.get_camera_sources()
         self.queue_manager = QueueManager()
         self.vlm_client = VLMClient()
         self.keyframe_extractor = KeyframeExtractor()
-        self.capture_manager: Optional[VideoCaptureManager] = None
+        # シーンに変化がないセグメントのVLM呼び出しを省略する（カメラごとに直前の分析と比較、無効時は空）
+        self.scene_deduplicators: Dict[int, SceneDeduplicator] = {}
+        if config.get_scene_dedup_enabled():
+            self.scene_deduplicators = {camera_id: SceneDeduplicator() for camera_id in range(len(self.camera_sources))}
+        self.capture_managers: List[VideoCaptureManager] = []
         self.vlm_thread: Optional[threading.Thread] = None
+        self.capture_threads: List[threading.Thread] = []
+        self.frame_buffers = [FrameRingBuffer(config.get_frame_buffer_size()) for _ in self.camera_sources]
         self.is_running = False
-        self.current_description = "\n\n分析準備中..."
+        self.current_descriptions: Dict[int, str] = {
+            camera_id: "\n\n分析準備中..." for camera_id in range(len(self.camera_sources))
+        }
+        # 説明文が更新されるたびに増えるカメラごとの版番号（UIは変化した場合のみ再描画する）
+        self.description_versions: Dict[int, int] = {camera_id: 0 for camera_id in range(len(self.camera_sources))}
+        # 最後に公開した（途中経過でない）説明文。途中経過を表示したセグメントが失敗した場合に表示を戻す
+        self._published_descriptions: Dict[int, str] = dict(self.current_descriptions)
         self.description_lock = threading.Lock()
         self.start_time = None
         # セグメントの開始時間（秒単位）を保持する辞書
         self.segment_start_times = {}
-        # 分析結果履歴
-        self.analysis_history = []
-        # 履歴更新用コールバック
-        self.history_callback = None
+        # 分析結果履歴（メモリには直近分のみ保持し、すべての結果はSQLiteに追記）
+        self.history_store = HistoryStore()
+        # 履歴追加時のコールバック（HistoryRecordを受け取る）
+        self.history_callback: Optional[Callable[[HistoryRecord], None]] = None
+        # セグメントの記録終了から結果表示までの許容遅延（0は無制限）とSLOの集計
+        self.max_lag = config.get_vlm_max_lag()
+        self.result_reorder_limit = config.get_vlm_result_reorder_limit()
+        self.slo_counts: Dict[str, int] = {"completed": 0, "met": 0, "missed": 0, "dropped_stale": 0}
+        self._result_lags: deque = deque(maxlen=100)
+        # 並行処理した結果をカメラごとに順序どおりに公開するためのバッファ
+        self._pending_results: Dict[Tuple[int, int], Tuple[Optional[str], dict]] = {}
+        self._next_publish_sequences: Dict[int, int] = {}
+        # 途中経過を表示したセグメント（カメラID, 順番）
+        self._partial_sequences: set = set()
+        # シーン重複判定の基準をカメラごとにセグメントの取り出し順に参照・更新するための順番管理
+        self._dedup_condition: Optional[asyncio.Condition] = None
+        self._dedup_next_sequences: Dict[int, int] = {}
+        self._dedup_finished: set = set()
+        # キャプチャFPS計測用（カメラごとの計測開始時刻とフレーム数）
+        self._fps_windows: Dict[int, Tuple[float, int]] = {}
+        # SESSION_RECORD_DIR 指定時にカメラごとのフレームを記録するレコーダー（再生ソースで再現に使う）
+        self.session_recorders: Dict[int, SessionRecorder] = {}
+
+    @property
+    def camera_count(self) -> int:
+        return len(self.camera_sources)
+
+    @property
+    def capture_manager(self) -> Optional[VideoCaptureManager]:
+        """先頭カメラのキャプチャマネージャー"""
+        return self.capture_managers[0] if self.capture_managers else None
 
-    def set_description(self, description: str):
+    def set_description(self, description: str, camera_id: int = 0):
         """説明文を設定"""
         with self.description_lock:
-            self.current_description = description
+            self.current_descriptions[camera_id] = description
+            self.description_versions[camera_id] = self.description_versions.get(camera_id, 0) + 1
 
-    def get_description(self) -> str:
+    def get_description(self, camera_id: int = 0) -> str:
         """説明文を取得"""
         with self.description_lock:
-            return self.current_description
+            return self.current_descriptions.get(camera_id, "")
+
+    def get_description_version(self, camera_id: int = 0) -> int:
+        """説明文の版番号を取得（説明文が更新されるたびに増える）"""
+        with self.description_lock:
+            return self.description_versions.get(camera_id, 0)
 
     def _vlm_loop_wrapper(self):
         """asyncioループを別スレッドで実行するためのラッパー"""
@@ -61,87 +121,460 @@ class VideoProcessor:
             loop.close()
 
     async def vlm_processing_loop(self):
-        """VLM処理ループ"""
+        """VLM処理ループ
+
+        キューから取り出したセグメントを（全カメラ合わせて）最大 VLM_MAX_CONCURRENCY 件まで
+        並行に処理し、分析結果はカメラごとにセグメントの取り出し順に公開する。
+        """
         logger.info("VLM処理ループを開始しました...")
-        while self.is_running:
-            try:
-                # タイムアウト付きでキューから取得
-                video_info = self.queue_manager.get_video_info(timeout=0.5)
-                if video_info:
-                    await self.process_video_segment(video_info['segment_id'], video_info['file_path'])
-            except queue.Empty:
-                await asyncio.sleep(0.1)
-                continue
-            except Exception as e:
-                logger.error(f"VLM処理ループエラー: {e}")
-                await asyncio.sleep(1.0)
+        semaphore = asyncio.Semaphore(config.get_vlm_max_concurrency())
+        tasks = set()
+        sequences: Dict[int, int] = {}
+        self._pending_results = {}
+        self._next_publish_sequences = {}
+        self._partial_sequences = set()
+        self._dedup_condition = asyncio.Condition()
+        self._dedup_next_sequences = {}
+        self._dedup_finished = set()
+        try:
+            while self.is_running:
+                await semaphore.acquire()
+                try:
+                    # タイムアウト付きでキューから取得（ループをブロックしないよう別スレッドで待機）
+                    video_info = await asyncio.to_thread(self.queue_manager.get_video_info, 0.5)
+                except queue.Empty:
+                    semaphore.release()
+                    continue
+                except Exception as e:
+                    semaphore.release()
+                    logger.error(f"VLM処理ループエラー: {e}")
+                    await asyncio.sleep(1.0)
+                    continue
 
-    async def process_video_segment(self, segment_id: int, video_path: str):
-        """ビデオセグメントを処理"""
-        import time
-        start_time = time.time()
+                camera_id = video_info.get('camera_id', 0)
+                sequence = sequences.get(camera_id, 0)
+                sequences[camera_id] = sequence + 1
+                task = asyncio.create_task(self._process_and_publish(camera_id, sequence, video_info, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.vlm_client.aclose()
+
+    async def _process_and_publish(self, camera_id: int, sequence: int, video_info: dict,
+                                   semaphore: asyncio.Semaphore):
+        """セグメントを処理し、結果をカメラごとに順序どおりに公開する"""
+        def show_partial(text: str) -> None:
+            # 順番待ちの結果を追い越さないよう、次に公開するセグメントの途中経過のみ表示する
+            if self._next_publish_sequences.get(camera_id, 0) == sequence:
+                self._partial_sequences.add((camera_id, sequence))
+                self.set_description(f"{text}…", camera_id)
+
+        description = None
         try:
-            # パスの存在確認
-            video_file = Path(video_path)
-            if not video_file.exists():
-                logger.error(f"ビデオファイルが見つかりません: {video_path}")
+            description = await self.process_video_segment(video_info, show_partial, sequence)
+        finally:
+            # 重複判定まで進まなかったセグメントも順番を譲る
+            await self._finish_dedup_turn(camera_id, sequence)
+            semaphore.release()
+            if sequence < self._next_publish_sequences.get(camera_id, 0):
+                # 待ちきれずに後続の結果を先に公開したセグメントは、履歴にのみ追加する
+                self._publish_result(camera_id, sequence, description, video_info, late=True)
+            else:
+                self._pending_results[(camera_id, sequence)] = (description, video_info)
+                self._flush_results(camera_id)
+
+    def _flush_results(self, camera_id: int = 0):
+        """公開可能になった分析結果をセグメント順に公開
+
+        先行セグメントの完了を待つ結果が VLM_RESULT_REORDER_LIMIT 件を超えた場合は、
+        先行セグメントを待たずに待機中の結果を公開する（保持するセグメント情報が増え続けないようにする）。
+        """
+        while True:
+            while (camera_id, self._next_publish_sequences.get(camera_id, 0)) in self._pending_results:
+                sequence = self._next_publish_sequences.get(camera_id, 0)
+                description, video_info = self._pending_results.pop((camera_id, sequence))
+                self._next_publish_sequences[camera_id] = sequence + 1
+                self._publish_result(camera_id, sequence, description, video_info)
+
+            waiting = [sequence for pending_camera_id, sequence in self._pending_results
+                       if pending_camera_id == camera_id]
+            if len(waiting) <= self.result_reorder_limit:
                 return
+            next_sequence = min(waiting)
+            skipped = range(self._next_publish_sequences.get(camera_id, 0), next_sequence)
+            logger.warning(f"先行セグメントの分析が終わらないため、後続の {len(waiting)} 件の結果を先に公開します "
+                           f"(カメラ{camera_id + 1}, 待機を打ち切ったセグメント: {len(skipped)} 件)")
+            for sequence in skipped:
+                if (camera_id, sequence) in self._partial_sequences:
+                    self._partial_sequences.discard((camera_id, sequence))
+                    self.set_description(self._published_descriptions.get(camera_id, ""), camera_id)
+            self._next_publish_sequences[camera_id] = next_sequence
 
-            keyframes = self.keyframe_extractor.extract_from_video(video_file, segment_id)
-            if keyframes:
-                description = self.vlm_client.analyze_images(keyframes)
-                if description:
-                    # セグメントIDに基づいた正確な開始・終了時間を計算
-                    start_total_seconds = (segment_id - 1) * config.get_capture_interval()
-                    end_total_seconds = segment_id  * config.get_capture_interval()
+    def _publish_result(self, camera_id: int, sequence: int, description: Optional[str], video_info: dict,
+                        late: bool = False) -> None:
+        """分析結果を最新の説明文として表示し、履歴に追加（late: 後続の結果を公開済みの場合は履歴のみ）"""
+        showed_partial = (camera_id, sequence) in self._partial_sequences
+        self._partial_sequences.discard((camera_id, sequence))
+        published = False
+        if description:
+            now = time.time()
+            deadline = self._segment_deadline(video_info)
+            self.slo_counts["completed"] += 1
+            if 'captured_at' in video_info:
+                self._result_lags.append(now - video_info['captured_at'])
+                metrics.CAPTURE_TO_DESCRIPTION_SECONDS.observe(now - video_info['captured_at'])
+            if deadline is not None and now > deadline:
+                # 許容遅延を超えた結果は履歴にのみ追加し、最新の説明文は上書きしない
+                self.slo_counts["missed"] += 1
+                metrics.SLO_RESULTS.inc(camera=camera_id, result="missed")
+                logger.warning(f"分析結果が許容遅延 ({self.max_lag:g} 秒) を超えたため最新の説明文を更新しません")
+            else:
+                self.slo_counts["met"] += 1
+                metrics.SLO_RESULTS.inc(camera=camera_id, result="met")
+                if not late:
+                    self.set_description(description, camera_id)
+                    self._published_descriptions[camera_id] = description
+                    published = True
+            # 履歴に追加
+            record = self._make_history_record(video_info)
+            self.history_store.append(record)
+            if self.history_callback:
+                self.history_callback(record)
+        if showed_partial and not published:
+            # 失敗・タイムアウト・期限超過で途中経過のみが表示されている場合は直前の説明文に戻す
+            self.set_description(self._published_descriptions.get(camera_id, ""), camera_id)
 
-                    start_min, start_sec = divmod(start_total_seconds, 60)
-                    end_min, end_sec = divmod(end_total_seconds, 60)
+    async def process_video_segment(self, video_info: dict,
+                                    on_partial: Optional[Callable[[str], None]] = None,
+                                    sequence: Optional[int] = None) -> Optional[str]:
+        """ビデオセグメントを処理し、時間範囲付きの分析結果を返す
+
+        coalesceポリシーで統合されたセグメントは、各ファイルからキーフレームを抽出し、
+        全体から改めて選択して1回の分析にまとめる。VLM_STREAMING 有効時は
+        受信途中の時間範囲付きテキストで on_partial を呼ぶ。
+        sequence はカメラごとの取り出し順で、シーン重複判定の基準をこの順に参照・更新する。
+        """
+        start_time = time.time()
+        segment_id = video_info['segment_id']
+        camera_id = video_info.get('camera_id', 0)
+        deadline = self._segment_deadline(video_info)
+        result = None
+        try:
+            if not self._can_finish_in_time(deadline):
+                self._count_stale(video_info)
+                return None
 
-                    formatted_time_range = f"{start_min:02d}:{start_sec:02d}〜{end_min:02d}:{end_sec:02d}"
-                    description_with_time = f"（{formatted_time_range}）\n\n{description}"
-                    self.set_description(description_with_time)
+            if 'frames' in video_info:
+                # memoryモード: 候補フレームからプロセス内で選択し、配列のままVLMに渡す
+                # （選択はイベントループを止めないよう別スレッドで行う）
+                keyframes = await asyncio.to_thread(self.keyframe_extractor.select_keyframes, video_info['frames'])
+            else:
+                keyframes = await self._extract_keyframes(video_info)
 
-                    # 履歴に追加
-                    if self.history_callback:
-                        self.history_callback(description_with_time)
+            if keyframes and not self._can_finish_in_time(deadline):
+                # キーフレーム抽出中に期限内に完了できなくなった
+                self._count_stale(video_info)
+            elif keyframes:
+                timeout = config.get_vlm_request_timeout()
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.time())
+                header = self._format_result_header(video_info)
+                partial_callback = None
+                if on_partial is not None:
+                    def partial_callback(text: str) -> None:
+                        on_partial(f"{header}\n\n{text}")
+                description = await self._describe_keyframes(
+                    keyframes, self._keyframe_labels(video_info, keyframes), camera_id, timeout,
+                    partial_callback, sequence
+                )
+                if description:
+                    video_info['description'] = description
+                    result = f"{header}\n\n{description}"
                 else:
-                    self.set_description(description)
-                    # 履歴に追加
-                    if self.history_callback:
-                        self.history_callback(description)
+                    result = description
 
+            if keyframes:
                 # キーフレームを使用した後、削除する
-                for keyframe in keyframes:
-                    try:
-                        if keyframe.exists():
-                            keyframe.unlink()
-                            logger.info(f"キーフレーム削除: {keyframe.name}")
-                        else:
-                            logger.warning(f"キーフレームがすでに削除されています: {keyframe}")
-                    except Exception as e:
-                        logger.error(f"キーフレーム削除エラー ({keyframe}): {e}")
-            # ビデオファイルも不要になったら削除する
-            try:
-                if video_file.exists():
-                    video_file.unlink()
-                    logger.info(f"ビデオファイル削除: {video_file.name}")
-                else:
-                    logger.warning(f"ビデオファイルがすでに削除されています: {video_file}")
-            except Exception as e:
-                logger.error(f"ビデオファイル削除エラー ({video_file}): {e}")
+                self._remove_keyframes(keyframes)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"セグメント処理エラー: {e}")
         finally:
+            # ビデオファイルも不要になったら削除する
+            FileManager.remove_segment_files(video_info)
             end_time = time.time()
             elapsed_time = end_time - start_time
-            logger.info(f"セグメント {segment_id} の処理時間: {elapsed_time:.2f} 秒")
+            video_info['latency'] = elapsed_time
+            logger.info(f"セグメント {segment_name(camera_id, segment_id)} の処理時間: {elapsed_time:.2f} 秒")
+        return result
+
+    def _segment_deadline(self, video_info: dict) -> Optional[float]:
+        """セグメントの結果を表示すべき期限（記録終了時刻 + VLM_MAX_LAG、無制限の場合はNone）"""
+        if self.max_lag <= 0 or 'captured_at' not in video_info:
+            return None
+        return video_info['captured_at'] + self.max_lag
+
+    def _can_finish_in_time(self, deadline: Optional[float]) -> bool:
+        """直近の中央値レイテンシで期限内にVLM分析を完了できるか判定"""
+        if deadline is None:
+            return True
+        expected_latency = self.vlm_client.backend_pool.latency_quantile(0.5) or 0.0
+        return time.time() + expected_latency < deadline
+
+    def _count_stale(self, video_info: dict) -> None:
+        """期限内に完了できないセグメントの破棄を記録"""
+        self.slo_counts["dropped_stale"] += 1
+        metrics.SLO_RESULTS.inc(camera=video_info.get('camera_id', 0), result="dropped_stale")
+        logger.warning(f"期限内に分析を完了できないためセグメントを破棄: "
+                       f"{segment_name(video_info.get('camera_id', 0), video_info['segment_id'])}")
+
+    def get_slo_stats(self) -> dict:
+        """遅延SLOの集計（期限内・超過・破棄の件数、結果表示までの遅延、タイムアウト・ヘッジ件数）を取得"""
+        lags = sorted(self._result_lags)
+        stats = {
+            "max_lag": self.max_lag,
+            **self.slo_counts,
+            "lag_p50": lags[len(lags) // 2] if lags else 0.0,
+            "lag_p95": lags[min(len(lags) - 1, int(0.95 * len(lags)))] if lags else 0.0,
+        }
+        stats.update(self.vlm_client.backend_pool.get_request_stats())
+        return stats
+
+    def _format_result_header(self, video_info: dict) -> str:
+        """分析結果の先頭に付ける「（カメラ 時間範囲）」を作成"""
+        time_range = self._format_time_range(video_info)
+        if self.camera_count > 1:
+            time_range = f"カメラ{video_info.get('camera_id', 0) + 1} {time_range}"
+        return f"（{time_range}）"
+
+    @staticmethod
+    def _time_range_seconds(video_info: dict) -> Tuple[float, float]:
+        """セグメントのキャプチャ開始からの開始・終了時間（秒）を取得"""
+        if 'start_offset' in video_info:
+            return video_info['start_offset'], video_info['end_offset']
+        # セグメントIDに基づいた開始・終了時間を計算
+        segment_id = video_info['segment_id']
+        first_segment_id = video_info.get('first_segment_id', segment_id)
+        return (first_segment_id - 1) * config.get_capture_interval(), segment_id * config.get_capture_interval()
+
+    def _format_time_range(self, video_info: dict) -> str:
+        """セグメントの時間範囲を「MM:SS〜MM:SS」形式で取得"""
+        start_seconds, end_seconds = self._time_range_seconds(video_info)
+        return f"{format_time(int(start_seconds))}〜{format_time(int(round(end_seconds)))}"
+
+    def _make_history_record(self, video_info: dict) -> HistoryRecord:
+        """セグメントの分析結果から履歴レコードを作成"""
+        start_seconds, end_seconds = self._time_range_seconds(video_info)
+        return HistoryRecord(
+            camera_id=video_info.get('camera_id', 0),
+            segment_id=video_info['segment_id'],
+            start_offset=start_seconds,
+            end_offset=end_seconds,
+            description=video_info.get('description', ''),
+            latency=video_info.get('latency', 0.0),
+            model=self.vlm_client.model_config["model"],
+        )
+
+    @staticmethod
+    def _keyframe_labels(video_info: dict, keyframes: list) -> List[str]:
+        """キーフレームの撮影時刻ラベル（キャプチャ開始からのMM:SS）を作成
+
+        時刻が分からないキーフレーム（iframe選択など）は「#番号」とする。
+        """
+        labels = [f"#{n + 1}" for n in range(len(keyframes))]
+        start_offset = video_info.get('start_offset')
+        if start_offset is None:
+            return labels
+
+        if 'frames' in video_info:
+            timestamps = video_info['frame_timestamps']
+            index_by_id = {id(frame): i for i, frame in enumerate(video_info['frames'])}
+            for n, keyframe in enumerate(keyframes):
+                index = index_by_id.get(id(keyframe))
+                if index is not None:
+                    labels[n] = format_time(int(start_offset + timestamps[index] - timestamps[0]))
+        elif 'file_paths' not in video_info and config.get_keyframe_selection() == "diverse":
+            # 候補フレームは fps フィルタでセグメントの長さに等間隔に抽出されているため、連番から時刻を求める
+            duration = VideoProcessor._segment_duration(video_info) or config.get_capture_interval()
+            interval = duration / config.get_keyframe_candidate_count()
+            for n, keyframe in enumerate(keyframes):
+                # パイプ出力のJPEGデータは出力順の連番を保持している
+                number = getattr(keyframe, 'number', None)
+                if number is None and isinstance(keyframe, Path):
+                    match = re.search(r'_keyframe_(\d+)$', keyframe.stem)
+                    number = int(match.group(1)) if match else None
+                if number is not None:
+                    labels[n] = format_time(int(start_offset + (number - 1) * interval))
+        return labels
+
+    @staticmethod
+    def _segment_duration(video_info: dict) -> Optional[float]:
+        """セグメントの実際の長さ（秒）を取得（不明な場合はNone）"""
+        if 'start_offset' not in video_info or 'end_offset' not in video_info:
+            return None
+        duration = video_info['end_offset'] - video_info['start_offset']
+        return duration if duration > 0 else None
+
+    async def _describe_keyframes(self, keyframes: list, labels: Optional[List[str]] = None,
+                                  camera_id: int = 0, timeout: Optional[float] = None,
+                                  on_partial: Optional[Callable[[str], None]] = None,
+                                  sequence: Optional[int] = None) -> Optional[str]:
+        """キーフレームの説明文を取得（同じカメラの直前の分析と同一シーンならVLM呼び出しを省略）
+
+        重複判定の基準はカメラごとに取り出し順に参照・更新し、VLM呼び出しの前に登録する。
+        並行処理中でも直前のセグメントと比較し、一致した場合はその分析結果を待って再利用する。
+        """
+        reference = None
+        scene_deduplicator = self.scene_deduplicators.get(camera_id)
+        if scene_deduplicator is not None:
+            hashes = await asyncio.to_thread(scene_deduplicator.compute_hashes, keyframes)
+            if sequence is not None:
+                await self._wait_dedup_turn(camera_id, sequence)
+            previous = scene_deduplicator.find_match(hashes, count=False)
+            if isinstance(previous, asyncio.Future) and previous.done() and not previous.result():
+                # 分析に失敗した基準とは比較せず、このセグメントを新しい基準にする
+                previous = None
+            if previous is None:
+                scene_deduplicator.record_lookup(False)
+                reference = asyncio.get_running_loop().create_future()
+                scene_deduplicator.update(hashes, reference)
+            if sequence is not None:
+                await self._finish_dedup_turn(camera_id, sequence)
+            if previous is not None:
+                previous_description = await asyncio.shield(previous)
+                # ヒット・ミスは基準の分析結果が確定してから計上する（失敗時は自身でVLMを呼び出すためミス）
+                scene_deduplicator.record_lookup(bool(previous_description))
+                if previous_description:
+                    logger.info("シーン変化なし、VLM呼び出しをスキップします")
+                    return f"【変化なし】{previous_description}"
+
+        description = None
+        try:
+            description = await self.vlm_client.aanalyze_images(keyframes, labels=labels, timeout=timeout,
+                                                                on_partial=on_partial)
+        finally:
+            # 失敗時はNoneを通知し、待っているセグメントは自身でVLMを呼び出す
+            if reference is not None:
+                reference.set_result(description)
+                if not description:
+                    # 失敗した分析は基準から外し、次に一致するセグメントを新しい基準にする
+                    scene_deduplicator.clear(reference)
+        return description
+
+    async def _wait_dedup_turn(self, camera_id: int, sequence: int) -> None:
+        """同じカメラの先行セグメントが重複判定を終えるまで待機"""
+        async with self._dedup_condition:
+            await self._dedup_condition.wait_for(
+                lambda: self._dedup_next_sequences.get(camera_id, 0) >= sequence
+            )
+
+    async def _finish_dedup_turn(self, camera_id: int, sequence: int) -> None:
+        """重複判定の順番を終え、後続のセグメントに譲る（複数回呼んでもよい）"""
+        if self._dedup_condition is None or not self.scene_deduplicators:
+            return
+        async with self._dedup_condition:
+            next_sequence = self._dedup_next_sequences.get(camera_id, 0)
+            if sequence < next_sequence:
+                return
+            self._dedup_finished.add((camera_id, sequence))
+            while (camera_id, next_sequence) in self._dedup_finished:
+                self._dedup_finished.discard((camera_id, next_sequence))
+                next_sequence += 1
+            self._dedup_next_sequences[camera_id] = next_sequence
+            self._dedup_condition.notify_all()
+
+    async def _extract_keyframes(self, video_info: dict) -> List[Path]:
+        """セグメントのビデオファイルからキーフレームを抽出"""
+        segment_id = video_info['segment_id']
+        camera_id = video_info.get('camera_id', 0)
+        video_paths = video_info.get('file_paths', [video_info['file_path']])
+        extractions = []
+        for index, video_path in enumerate(video_paths):
+            # パスの存在確認
+            video_file = Path(video_path)
+            if not video_file.exists():
+                logger.error(f"ビデオファイルが見つかりません: {video_path}")
+                continue
+            extract_id = segment_id if len(video_paths) == 1 else f"{segment_id}_{index}"
+            # 統合セグメントは各ファイルの長さが分からないため、CAPTURE_INTERVAL を基準にする
+            duration = self._segment_duration(video_info) if len(video_paths) == 1 else None
+            extractions.append(self.keyframe_extractor.aextract_from_video(video_file, extract_id, camera_id,
+                                                                           duration))
+
+        # 統合セグメントの各ファイルは並行に抽出する（同時実行数は抽出側のセマフォで制限）
+        keyframes = [keyframe for result in await asyncio.gather(*extractions) for keyframe in result]
+
+        if len(video_paths) > 1 and keyframes:
+            selected = await asyncio.to_thread(self.keyframe_extractor.select_keyframes, keyframes)
+            self._remove_keyframes([keyframe for keyframe in keyframes if keyframe not in selected])
+            keyframes = selected
+        return keyframes
+
+    @staticmethod
+    def _remove_keyframes(keyframes: list) -> None:
+        """キーフレームファイルを削除（メモリ上のフレームは対象外）"""
+        for keyframe in keyframes:
+            if not isinstance(keyframe, Path):
+                continue
+            try:
+                if keyframe.exists():
+                    keyframe.unlink()
+                    logger.info(f"キーフレーム削除: {keyframe.name}")
+                else:
+                    logger.warning(f"キーフレームがすでに削除されています: {keyframe}")
+            except Exception as e:
+                logger.error(f"キーフレーム削除エラー ({keyframe}): {e}")
+
+    def get_queue_stats(self) -> dict:
+        """セグメントキューの状態と破棄件数を取得"""
+        return self.queue_manager.get_stats()
+
+    def get_backend_stats(self) -> List[dict]:
+        """VLMエンドポイントごとの統計（レイテンシ、ストリーミング時のTTFT・トークン/秒を含む）を取得"""
+        return self.vlm_client.get_backend_stats()
+
+    def get_cache_stats(self) -> Optional[dict]:
+        """VLM応答キャッシュのヒット数・ミス数・ヒット率を取得（無効の場合はNone）"""
+        return self.vlm_client.get_cache_stats()
+
+    @staticmethod
+    def get_metrics() -> dict:
+        """各処理段の計測値（ヒストグラムの件数・分位点など）のスナップショットを取得"""
+        return metrics.REGISTRY.snapshot()
+
+    def get_dedup_stats(self) -> dict:
+        """シーン重複判定のヒット数・ミス数を取得（全カメラの合計）"""
+        hits = sum(deduplicator.hits for deduplicator in self.scene_deduplicators.values())
+        misses = sum(deduplicator.misses for deduplicator in self.scene_deduplicators.values())
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
 
     def start(self):
         """処理の開始"""
         self.is_running = True
         self.start_time = datetime.now()
-        self.capture_manager = VideoCaptureManager()
+        if self.history_store.closed:
+            self.history_store = HistoryStore()
+        if config.get_metrics_port() > 0:
+            metrics.start_metrics_server(config.get_metrics_host(), config.get_metrics_port())
+        self.capture_managers = [
+            VideoCaptureManager(camera_source, camera_id)
+            for camera_id, camera_source in enumerate(self.camera_sources)
+        ]
+        self.frame_buffers = [FrameRingBuffer(config.get_frame_buffer_size()) for _ in self.camera_sources]
+        self._start_session_recorders()
+
+        # カメラごとにキャプチャスレッド開始（UIの描画速度に依存せずカメラのFPSで読み込む）
+        self.capture_threads = [
+            threading.Thread(target=self._capture_loop, args=(camera_id,), daemon=True)
+            for camera_id in range(self.camera_count)
+        ]
+        for capture_thread in self.capture_threads:
+            capture_thread.start()
 
         # VLMスレッド開始
         self.vlm_thread = threading.Thread(target=self._vlm_loop_wrapper, daemon=True)
@@ -151,30 +584,111 @@ class VideoProcessor:
         """処理の停止"""
         self.is_running = False
         self.queue_manager.stop()
-        if self.capture_manager:
-            self.capture_manager.release()
+        for capture_thread in self.capture_threads:
+            capture_thread.join(timeout=2.0)
+        for capture_manager in self.capture_managers:
+            capture_manager.release()
+        for recorder in self.session_recorders.values():
+            recorder.close()
+        self.session_recorders = {}
         if self.vlm_thread:
             self.vlm_thread.join(timeout=2.0)
+        # 書き込み待ちの履歴を書き込んで履歴DBを閉じる（再開時は start で開き直す）
+        self.history_store.close()
         FileManager.cleanup_all_files()
 
-    def update_frame(self):
-        """フレームを読み込み、必要に応じてセグメント化する"""
-        if not self.capture_manager:
+    def _start_session_recorders(self) -> None:
+        """SESSION_RECORD_DIR が設定されていれば、カメラごとにセッションの記録を開始"""
+        record_dir = config.get_session_record_dir()
+        if record_dir is None:
+            return
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for capture_manager in self.capture_managers:
+            recorder = SessionRecorder(
+                record_dir / f"cam{capture_manager.camera_id}_{timestamp}.vlmrec",
+                capture_manager.fps,
+                str(self.camera_sources[capture_manager.camera_id])
+            )
+            recorder.start()
+            self.session_recorders[capture_manager.camera_id] = recorder
+
+    def _capture_loop(self, camera_id: int = 0):
+        """キャプチャスレッドのメインループ"""
+        logger.info(f"キャプチャループを開始しました (カメラ{camera_id + 1})...")
+        while self.is_running:
+            try:
+                if self.update_frame(camera_id) is None:
+                    if self.capture_managers[camera_id].stream_ended:
+                        break
+                    time.sleep(0.1)
+            except Exception as e:
+                logger.error(f"キャプチャループエラー: {e}")
+                time.sleep(1.0)
+        logger.info("キャプチャループを終了しました")
+
+    def get_latest_frame(self, camera_id: int = 0,
+                         out: Optional[np.ndarray] = None) -> Tuple[Optional[np.ndarray], int]:
+        """カメラのリングバッファから最新フレームと通算フレーム番号を取得（outは再利用するコピー先）"""
+        return self.frame_buffers[camera_id].get_latest(out)
+
+    def get_frame_count(self, camera_id: int = 0) -> int:
+        """カメラのリングバッファに書き込まれた通算フレーム数を取得"""
+        if camera_id >= len(self.frame_buffers):
+            return 0
+        return self.frame_buffers[camera_id].frame_count
+
+    def _count_captured_frame(self, camera_id: int) -> None:
+        """読み込んだフレームを計上し、1秒ごとにキャプチャFPSを更新"""
+        metrics.CAPTURE_FRAMES.inc(camera=camera_id)
+        now = time.time()
+        window_start, frames = self._fps_windows.get(camera_id, (now, 0))
+        frames += 1
+        if now - window_start >= 1.0:
+            metrics.CAPTURE_FPS.set(frames / (now - window_start), camera=camera_id)
+            window_start, frames = now, 0
+        self._fps_windows[camera_id] = (window_start, frames)
+
+    def update_frame(self, camera_id: int = 0):
+        """カメラのフレームを読み込み、必要に応じてセグメント化する"""
+        if camera_id >= len(self.capture_managers):
             return None
+        capture_manager = self.capture_managers[camera_id]
 
-        ret, frame = self.capture_manager.cap.read()
+        ret, frame = capture_manager.cap.read()
+        if not ret and capture_manager.stream_ended:
+            # 再生の終端では最後のセグメントを分析に回し、キャプチャループを終了させる
+            for video_info in capture_manager.finish_stream():
+                if not self.queue_manager.put_video_info(video_info):
+                    logger.error("キューへの追加に失敗しました")
+            return None
         if not ret:
+            metrics.CAPTURE_DROPPED_FRAMES.inc(camera=camera_id)
             logger.warning("フレームの読み込みに失敗しました")
             return None
+        self._count_captured_frame(camera_id)
+        recorder = self.session_recorders.get(camera_id)
+        if recorder is not None:
+            recorder.write(frame, capture_manager.clock())
 
-        # セグメント処理（オリジナルのロジックを維持）
-        if self.capture_manager.should_start_new_segment():
-            if self.capture_manager.current_output_path and self.capture_manager.segment_count > 0:
-                video_info = self.capture_manager.get_current_segment_info()
+        # セグメント処理（motionモードでは動きのないセグメントは省略される）
+        capture_manager.update_motion(frame)
+        if capture_manager.should_start_new_segment():
+            switch_start = time.perf_counter()
+            video_info = capture_manager.finish_segment()
+            # 書き込み中のファイルがキューに入らないよう、ライターを切り替えてから追加する
+            capture_manager.start_new_segment(frame)
+            metrics.SEGMENT_SWITCH_SECONDS.observe(time.perf_counter() - switch_start, camera=camera_id)
+            if video_info:
                 success = self.queue_manager.put_video_info(video_info)
                 if not success:
                     logger.error("キューへの追加に失敗しました")
-            self.capture_manager.start_new_segment(frame)
 
-        self.capture_manager.write_frame(frame)
-        return frame
\ No newline at end of file
+        write_start = time.perf_counter()
+        capture_manager.write_frame(frame)
+        metrics.SEGMENT_WRITE_SECONDS.observe(time.perf_counter() - write_start, camera=camera_id)
+        # ffmpegバックエンドでは書き終わったセグメントをffmpegからの通知で受け取る
+        for video_info in capture_manager.pop_completed_segments():
+            if not self.queue_manager.put_video_info(video_info):
+                logger.error("キューへの追加に失敗しました")
+        self.frame_buffers[camera_id].put(frame)
+        return frame
@@ -0,0 +1,462 @@
+"""複数のVLMエンドポイントへの負荷分散モジュール"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class VLMEndpoint:
+    """1つのOpenAI互換エンドポイントの接続と状態を保持するクラス"""
+
+    LATENCY_WINDOW = 100  # レイテンシ統計に使う直近のリクエスト数
+
+    def __init__(self, base_url: Optional[str], model_config: Dict[str, Any]):
+        self.base_url = base_url
+        self.model_config = dict(model_config)
+        if base_url:
+            self.model_config["base_url"] = base_url
+        # 応答しないリクエストでVLMループが止まらないよう、HTTPクライアント側にも上限を設定する
+        self.model_config.setdefault("timeout", config.get_vlm_request_timeout())
+        self.name = base_url or "default"
+        self.client = ChatOpenAI(**self.model_config)
+        self.async_client: Optional[ChatOpenAI] = None
+        self.http_async_client: Optional[httpx.AsyncClient] = None
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.latencies: deque = deque(maxlen=self.LATENCY_WINDOW)
+        # ストリーミング時の最初のトークンまでの時間と生成速度（トークン/秒）
+        self.ttfts: deque = deque(maxlen=self.LATENCY_WINDOW)
+        self.tokens_per_second: deque = deque(maxlen=self.LATENCY_WINDOW)
+
+    def is_available(self) -> bool:
+        """リクエストを割り当て可能か判定（切り離し中でない）"""
+        return self.ejected_until is None
+
+    def mean_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """リクエスト数・失敗数・レイテンシ（平均, p50, p95）などを取得"""
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+
+        def percentile(p: float, values: Optional[list] = None) -> float:
+            values = latencies if values is None else values
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(p * len(values)))]
+
+        return {
+            "endpoint": self.name,
+            "healthy": self.ejected_until is None,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_mean": self.mean_latency(),
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "ttft_p50": percentile(0.5, ttfts),
+            "ttft_p95": percentile(0.95, ttfts),
+            "tokens_per_second": (sum(self.tokens_per_second) / len(self.tokens_per_second)
+                                  if self.tokens_per_second else 0.0),
+        }
+
+
+class VLMBackendPool:
+    """VLMエンドポイントのプール
+
+    未完了リクエスト数が最も少ないエンドポイント（同数なら平均レイテンシが短い方）に割り当てる。
+    連続して VLM_EJECT_FAILURES 回失敗したエンドポイントは VLM_EJECT_COOLOFF 秒間切り離し、
+    その後はヘルスチェック（OpenAI互換の /models）に成功した時点で復帰させる
+    （ヘルスチェック無効時はクールオフ経過で復帰）。失敗したリクエストは別のエンドポイントで再試行する。
+
+    非同期リクエストはタイムアウト付きで送信し、VLM_HEDGE_ENABLED 有効時は応答が直近のp95レイテンシを
+    超えた時点で別のエンドポイントに同じリクエストを送り（ヘッジ）、先に返った応答を採用する。
+    """
+
+    def __init__(self, model_config: Dict[str, Any], base_urls: Optional[List[Optional[str]]] = None):
+        base_urls = base_urls or config.get_vlm_base_urls()
+        self.endpoints = [VLMEndpoint(base_url, model_config) for base_url in base_urls]
+        self.api_key = model_config.get("api_key", "")
+        self.eject_failures = config.get_vlm_eject_failures()
+        self.eject_cooloff = config.get_vlm_eject_cooloff()
+        self.health_check_interval = config.get_vlm_health_check_interval()
+        self.hedge_enabled = config.get_vlm_hedge_enabled()
+        self.lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {"timeouts": 0, "hedged": 0, "hedge_wins": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health_task: Optional[asyncio.Task] = None
+        # 以前のイベントループのクライアントを閉じるタスク（完了まで参照を保持する）
+        self._closing_tasks: set = set()
+
+    def _select(self, exclude: Optional[set] = None) -> Optional[VLMEndpoint]:
+        """割り当て先のエンドポイントを選択し、未完了リクエスト数を加算"""
+        now = time.time()
+        with self.lock:
+            self._readmit_cooled_off(now)
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint.is_available() and (not exclude or endpoint not in exclude)]
+            if not candidates:
+                if exclude:
+                    return None
+                # 全エンドポイントが切り離し中の場合は、最も早く復帰予定のエンドポイントに送る
+                candidates = [min(self.endpoints, key=lambda endpoint: endpoint.ejected_until or 0.0)]
+            endpoint = min(candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.mean_latency()))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _readmit_cooled_off(self, now: float) -> None:
+        """ヘルスチェック無効時、クールオフを過ぎたエンドポイントを復帰させる（ロック内で呼ぶ）"""
+        if self.health_check_interval > 0:
+            return
+        for endpoint in self.endpoints:
+            if endpoint.ejected_until is not None and now >= endpoint.ejected_until:
+                self._readmit(endpoint)
+
+    @staticmethod
+    def _readmit(endpoint: VLMEndpoint) -> None:
+        endpoint.ejected_until = None
+        endpoint.consecutive_failures = 0
+        logger.info(f"VLMエンドポイントを復帰: {endpoint.name}")
+
+    def _eject(self, endpoint: VLMEndpoint) -> None:
+        """エンドポイントをクールオフ期間だけ切り離す（ロック内で呼ぶ）"""
+        if endpoint.ejected_until is None:
+            logger.warning(f"VLMエンドポイントを切り離します ({self.eject_cooloff:g} 秒): {endpoint.name}")
+            metrics.VLM_ENDPOINT_EJECTIONS.inc(endpoint=endpoint.name)
+        endpoint.ejected_until = time.time() + self.eject_cooloff
+
+    def _record_success(self, endpoint: VLMEndpoint, latency: float) -> None:
+        """成功したリクエストのレイテンシを記録"""
+        with self.lock:
+            endpoint.requests += 1
+            endpoint.consecutive_failures = 0
+            endpoint.latencies.append(latency)
+        metrics.VLM_REQUEST_SECONDS.observe(latency, endpoint=endpoint.name)
+
+    def _record_failure(self, endpoint: VLMEndpoint) -> None:
+        """失敗（タイムアウトを含む）を記録し、連続失敗が続けばエンドポイントを切り離す"""
+        with self.lock:
+            endpoint.requests += 1
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_failures:
+                self._eject(endpoint)
+
+    def _release(self, endpoint: VLMEndpoint) -> None:
+        """完了・キャンセルしたリクエストの未完了数を戻す"""
+        with self.lock:
+            endpoint.outstanding -= 1
+
+    def latency_quantile(self, q: float, min_samples: int = 10) -> Optional[float]:
+        """全エンドポイントの直近レイテンシの分位点を取得（サンプル不足時はNone）"""
+        with self.lock:
+            latencies = sorted(latency for endpoint in self.endpoints for latency in endpoint.latencies)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def invoke(self, messages: list):
+        """同期でリクエストを送信（失敗時は別のエンドポイントで再試行）"""
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._select(tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint)
+            start_time = time.time()
+            try:
+                response = endpoint.client.invoke(messages)
+            except Exception as e:
+                self._record_failure(endpoint)
+                logger.error(f"VLMリクエストエラー ({endpoint.name}): {e}")
+                last_error = e
+                continue
+            finally:
+                self._release(endpoint)
+            self._record_success(endpoint, time.time() - start_time)
+            return response
+
+    def _ensure_async_clients(self) -> None:
+        """実行中のイベントループ用の非同期クライアントとヘルスチェックタスクを用意"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            self._discard_async_clients(loop)
+        max_connections = config.get_vlm_max_concurrency()
+        for endpoint in self.endpoints:
+            endpoint.http_async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            )
+            endpoint.async_client = ChatOpenAI(**endpoint.model_config,
+                                               http_async_client=endpoint.http_async_client)
+        self._loop = loop
+        if self.health_check_interval > 0:
+            self._health_task = loop.create_task(self._health_check_loop())
+
+    def _discard_async_clients(self, loop: asyncio.AbstractEventLoop) -> None:
+        """以前のイベントループ用のクライアントを閉じ、ヘルスチェックタスクを停止"""
+        old_loop = self._loop
+        health_task = self._health_task
+        http_clients = [endpoint.http_async_client for endpoint in self.endpoints
+                        if endpoint.http_async_client is not None]
+        self._health_task = None
+        for endpoint in self.endpoints:
+            endpoint.http_async_client = None
+            endpoint.async_client = None
+
+        if old_loop.is_running() and not old_loop.is_closed():
+            # 以前のループが別スレッドで動作中であれば、そのループ上で閉じる
+            asyncio.run_coroutine_threadsafe(self._close_async_clients(health_task, http_clients), old_loop)
+            return
+        if health_task is not None and not old_loop.is_closed():
+            health_task.cancel()
+        task = loop.create_task(self._close_async_clients(None, http_clients))
+        self._closing_tasks.add(task)
+        task.add_done_callback(self._closing_tasks.discard)
+
+    @staticmethod
+    async def _close_async_clients(health_task: Optional[asyncio.Task], http_clients: list) -> None:
+        """ヘルスチェックタスクを停止し、HTTPクライアントを閉じる"""
+        if health_task is not None:
+            health_task.cancel()
+            await asyncio.gather(health_task, return_exceptions=True)
+        for http_client in http_clients:
+            try:
+                await http_client.aclose()
+            except Exception as e:
+                logger.error(f"HTTPクライアントのクローズエラー: {e}")
+
+    async def _request(self, endpoint: VLMEndpoint, messages: list):
+        """1つのエンドポイントにリクエストを送信し、結果を記録"""
+        start_time = time.time()
+        try:
+            response = await endpoint.async_client.ainvoke(messages)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record_failure(endpoint)
+            raise
+        finally:
+            self._release(endpoint)
+        self._record_success(endpoint, time.time() - start_time)
+        return response
+
+    async def ainvoke(self, messages: list, timeout: Optional[float] = None,
+                      hedge: Optional[bool] = None):
+        """非同期でリクエストを送信
+
+        失敗時は別のエンドポイントで再試行し、timeout（秒）以内に応答がなければ
+        asyncio.TimeoutError を送出する。ヘッジ有効時は応答がp95レイテンシを超えた時点で
+        別のエンドポイントにも同じリクエストを送る。
+        """
+        self._ensure_async_clients()
+        hedge = self.hedge_enabled if hedge is None else hedge
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        tried = set()
+        tasks: Dict[asyncio.Task, VLMEndpoint] = {}
+        hedge_tasks = set()
+        last_error: Optional[Exception] = None
+        try:
+            while True:
+                if not tasks:
+                    endpoint = self._select(tried)
+                    if endpoint is None:
+                        raise last_error
+                    tried.add(endpoint)
+                    tasks[asyncio.ensure_future(self._request(endpoint, messages))] = endpoint
+
+                wait_timeout = None
+                if deadline is not None:
+                    wait_timeout = max(0.0, deadline - time.monotonic())
+                hedge_delay = self.latency_quantile(0.95) if hedge and len(tasks) == 1 else None
+                if hedge_delay is not None:
+                    wait_timeout = hedge_delay if wait_timeout is None else min(wait_timeout, hedge_delay)
+
+                done, _ = await asyncio.wait(tasks, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        with self.lock:
+                            self.request_counts["timeouts"] += 1
+                            metrics.VLM_REQUEST_EVENTS.inc(event="timeout")
+                        for endpoint in tasks.values():
+                            self._record_failure(endpoint)
+                        raise asyncio.TimeoutError(f"VLMリクエストが {timeout:.1f} 秒以内に完了しませんでした")
+                    # p95レイテンシを超えたため、別のエンドポイントにヘッジリクエストを送る
+                    endpoint = self._select(tried)
+                    hedge = False
+                    if endpoint is not None:
+                        tried.add(endpoint)
+                        hedge_task = asyncio.ensure_future(self._request(endpoint, messages))
+                        tasks[hedge_task] = endpoint
+                        hedge_tasks.add(hedge_task)
+                        with self.lock:
+                            self.request_counts["hedged"] += 1
+                            metrics.VLM_REQUEST_EVENTS.inc(event="hedged")
+                        logger.info(f"VLM応答が遅いためヘッジリクエストを送信: {endpoint.name}")
+                    continue
+
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        logger.error(f"VLMリクエストエラー ({endpoint.name}): {e}")
+                        last_error = e
+                        continue
+                    if task in hedge_tasks:
+                        with self.lock:
+                            self.request_counts["hedge_wins"] += 1
+                            metrics.VLM_REQUEST_EVENTS.inc(event="hedge_win")
+                    return response
+        finally:
+            # 採用されなかったリクエスト（ヘッジの負け・タイムアウト）は取り消す
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def astream(self, messages: list, on_chunk: Callable[[str], None],
+                      timeout: Optional[float] = None) -> str:
+        """ストリーミングでリクエストを送信し、受信したテキスト全体を返す
+
+        受信のたびにそれまでの累積テキストで on_chunk を呼ぶ。最初のトークンまでの時間（TTFT）と
+        生成速度（トークン/秒）をエンドポイントごとに記録する。最初のトークンを受信する前に失敗した
+        場合のみ別のエンドポイントで再試行し、ヘッジは行わない。
+        """
+        self._ensure_async_clients()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._select(tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint)
+            state = {"received": False}
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return await asyncio.wait_for(self._stream(endpoint, messages, on_chunk, state), remaining)
+            except asyncio.TimeoutError:
+                with self.lock:
+                    self.request_counts["timeouts"] += 1
+                    metrics.VLM_REQUEST_EVENTS.inc(event="timeout")
+                self._record_failure(endpoint)
+                raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"VLMリクエストエラー ({endpoint.name}): {e}")
+                if state["received"]:
+                    raise
+                last_error = e
+
+    async def _stream(self, endpoint: VLMEndpoint, messages: list,
+                      on_chunk: Callable[[str], None], state: dict) -> str:
+        """1つのエンドポイントからストリーミングで受信し、TTFTと生成速度を記録"""
+        start_time = time.time()
+        first_token_time: Optional[float] = None
+        text = ""
+        chunk_count = 0
+        output_tokens: Optional[int] = None
+        try:
+            async for chunk in endpoint.async_client.astream(messages):
+                usage = getattr(chunk, "usage_metadata", None)
+                if usage and usage.get("output_tokens"):
+                    output_tokens = usage["output_tokens"]
+                if not chunk.content:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    state["received"] = True
+                text += chunk.content
+                chunk_count += 1
+                on_chunk(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record_failure(endpoint)
+            raise
+        finally:
+            self._release(endpoint)
+
+        end_time = time.time()
+        self._record_success(endpoint, end_time - start_time)
+        if first_token_time is not None:
+            # 使用量が返らないサーバーではチャンク数をトークン数とみなす
+            tokens = output_tokens or chunk_count
+            ttft = first_token_time - start_time
+            generation_time = end_time - first_token_time
+            tokens_per_second = tokens / generation_time if generation_time > 0 else 0.0
+            with self.lock:
+                endpoint.ttfts.append(ttft)
+                endpoint.tokens_per_second.append(tokens_per_second)
+            metrics.VLM_TTFT_SECONDS.observe(ttft, endpoint=endpoint.name)
+            logger.info(f"VLMストリーミング ({endpoint.name}): TTFT {ttft:.2f} 秒, "
+                        f"{tokens} トークン, {tokens_per_second:.1f} トークン/秒")
+        return text
+
+    async def _check_health(self, endpoint: VLMEndpoint) -> bool:
+        """エンドポイントの /models に問い合わせて稼働を確認（2xx応答のみ正常とみなす）"""
+        base_url = (endpoint.base_url or "https://api.openai.com/v1").rstrip("/")
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        try:
+            response = await endpoint.http_async_client.get(f"{base_url}/models", headers=headers, timeout=5.0)
+            return response.is_success
+        except Exception as e:
+            logger.debug(f"ヘルスチェック失敗 ({endpoint.name}): {e}")
+            return False
+
+    async def _health_check_loop(self) -> None:
+        """定期的に全エンドポイントのヘルスチェックを行い、切り離し・復帰を判定"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            results = await asyncio.gather(*(self._check_health(endpoint) for endpoint in self.endpoints))
+            now = time.time()
+            with self.lock:
+                for endpoint, healthy in zip(self.endpoints, results):
+                    if not healthy:
+                        self._eject(endpoint)
+                    elif endpoint.ejected_until is not None and now >= endpoint.ejected_until:
+                        self._readmit(endpoint)
+
+    async def aclose(self) -> None:
+        """ヘルスチェックを停止し、コネクションプールを閉じる"""
+        http_clients = [endpoint.http_async_client for endpoint in self.endpoints
+                        if endpoint.http_async_client is not None]
+        await self._close_async_clients(self._health_task, http_clients)
+        self._health_task = None
+        for endpoint in self.endpoints:
+            endpoint.http_async_client = None
+            endpoint.async_client = None
+        if self._closing_tasks:
+            await asyncio.gather(*self._closing_tasks, return_exceptions=True)
+        self._loop = None
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """エンドポイントごとの統計を取得"""
+        with self.lock:
+            return [endpoint.get_stats() for endpoint in self.endpoints]
+
+    def get_request_stats(self) -> Dict[str, int]:
+        """タイムアウト・ヘッジの件数を取得"""
+        with self.lock:
+            return dict(self.request_counts)
@@ -1,15 +1,33 @@
 """VLM（Vision Language Model）クライアントモジュール"""
+import asyncio
 import base64
-from typing import List, Optional
+from typing import Callable, List, Optional, Sequence, Tuple
 from pathlib import Path
+import numpy as np
 from PIL import Image
 from io import BytesIO
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+import cv2
 import logging
 import time
 
 import config
+import metrics
+from image_utils import ImageSource, fit_size
+from mosaic import build_mosaic
+from response_cache import ResponseCache
+from vlm_backend_pool import VLMBackendPool
+
+# リサンプリングフィルタ名と PIL / OpenCV の補間方式の対応
+# （OpenCVの補間は縮小時にアンチエイリアスされないため、縮小ではnearest以外をINTER_AREAに揃える）
+RESAMPLE_FILTERS = {
+    "lanczos": (Image.Resampling.LANCZOS, cv2.INTER_AREA),
+    "bicubic": (Image.Resampling.BICUBIC, cv2.INTER_AREA),
+    "bilinear": (Image.Resampling.BILINEAR, cv2.INTER_AREA),
+    "area": (Image.Resampling.BOX, cv2.INTER_AREA),
+    "nearest": (Image.Resampling.NEAREST, cv2.INTER_NEAREST),
+}
 
 
 class VLMClient:
@@ -19,39 +37,183 @@ class VLMClient:
         self.logger = logging.getLogger(__name__)
         self.model_config = config.get_vlm_config()
         self.logger.info(self.model_config)
-        self.client = ChatOpenAI(**self.model_config)
+        # VLM_BASE_URLS の各エンドポイントに負荷分散する（非同期クライアントはイベントループごとに生成）
+        self.backend_pool = VLMBackendPool(self.model_config)
+        # 同じ画像・プロンプトの再分析（録画の再処理など）でVLMを呼び出さないための応答キャッシュ
+        self.response_cache: Optional[ResponseCache] = ResponseCache() if config.get_vlm_cache_enabled() else None
+        # キーフレームの並列エンコード用スレッドプール（ワーカー数1以下の場合は逐次処理）
+        encode_workers = config.get_vlm_encode_workers()
+        self.encode_executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="vlm-encode")
+            if encode_workers > 1 else None
+        )
+
+    async def aclose(self) -> None:
+        """非同期クライアントのコネクションプールを閉じる"""
+        await self.backend_pool.aclose()
+
+    def get_cache_stats(self) -> Optional[dict]:
+        """応答キャッシュのヒット率などを取得（無効の場合はNone）"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get_stats()
+
+    def _get_cached(self, message_content: list) -> Tuple[Optional[str], Optional[str]]:
+        """応答キャッシュを参照し、キャッシュキーとキャッシュ済みの応答を返す（無効の場合は共にNone）"""
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.make_key(message_content, self.model_config["model"])
+        return key, self.response_cache.get(key)
+
+    def _put_cached(self, key: Optional[str], content: Optional[str]) -> None:
+        """応答をキャッシュに保存"""
+        if self.response_cache is not None and key is not None and content:
+            self.response_cache.put(key, content)
+
+    def get_backend_stats(self) -> List[dict]:
+        """エンドポイントごとのリクエスト数・失敗数・レイテンシを取得"""
+        return self.backend_pool.get_stats()
 
     @staticmethod
-    def resize_and_encode_image(image_path: Path) -> tuple:
+    def _to_base64(data: bytes, mime_type: str) -> tuple:
+        """エンコード済み画像をBase64文字列とデータURLに変換"""
+        img_str = base64.b64encode(data).decode('utf-8')
+        data_url = f"data:{mime_type};base64,{img_str}"
+        return img_str, data_url, mime_type
+
+    @staticmethod
+    def resize_and_encode_image(image: ImageSource) -> tuple:
         """
         画像をリサイズしてBase64エンコード
 
+        JPEGはドラフトモードで縮小デコードし、必要な解像度だけを復号する。
+
+        Args:
+            image: 画像ファイルのパス、エンコード済みの画像データ、またはBGR形式のフレーム配列
+
         Returns:
             tuple: (base64_string, data_url, mime_type)
         """
+        if isinstance(image, np.ndarray):
+            return VLMClient.encode_frame(image)
+        if isinstance(image, bytes):
+            image = BytesIO(image)
+
         # configからmax_sizeを取得
         max_size = config.get_vlm_image_max_size()
 
-        img = Image.open(image_path)
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        img = Image.open(image)
+        if img.format == "JPEG":
+            # 目標サイズ以上を保つ範囲で 1/2, 1/4, 1/8 スケールでデコードする
+            img.draft("RGB", fit_size(img.width, img.height, max_size))
+        img.thumbnail(max_size, RESAMPLE_FILTERS[config.get_vlm_image_resample()][0])
+
+        # パレット・透過画像もRGBに変換してJPEGで送信する（PNGよりエンコードが速くサイズも小さい）
+        # 透過部分は黒にならないよう白背景に合成する
+        if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
 
         buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=config.get_vlm_image_jpeg_quality())
+        return VLMClient._to_base64(buffered.getvalue(), "image/jpeg")
+
+    @staticmethod
+    def encode_frame(frame: np.ndarray, max_size: Optional[Tuple[int, int]] = None) -> tuple:
+        """
+        BGR形式のフレーム配列をリサイズしてBase64エンコード
 
-        # 画像フォーマットに応じて保存
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img.save(buffered, format="PNG", quality=95)
-            mime_type = "image/png"
+        PILを介さずにOpenCVで直接リサイズ・JPEGエンコードする（BGRのまま扱えるため色変換も不要）。
+
+        Args:
+            frame: BGR形式のフレーム配列
+            max_size: 最大サイズ（幅,高さ）。未指定の場合は VLM_IMAGE_MAX_SIZE
+
+        Returns:
+            tuple: (base64_string, data_url, mime_type)
+        """
+        max_size = max_size or config.get_vlm_image_max_size()
+
+        height, width = frame.shape[:2]
+        target_size = fit_size(width, height, max_size)
+        if target_size != (width, height):
+            frame = cv2.resize(frame, target_size,
+                               interpolation=RESAMPLE_FILTERS[config.get_vlm_image_resample()][1])
+
+        success, encoded = cv2.imencode(
+            ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, config.get_vlm_image_jpeg_quality()]
+        )
+        if not success:
+            raise ValueError("フレームのJPEGエンコードに失敗しました")
+        return VLMClient._to_base64(encoded.tobytes(), "image/jpeg")
+
+    def _encode_image(self, image: ImageSource) -> Optional[str]:
+        """画像をデータURLにエンコード（見つからない場合はNone）"""
+        if isinstance(image, Path) and not image.exists():
+            logging.getLogger(__name__).warning(f"警告: 画像が見つかりません {image}")
+            return None
+        return self.resize_and_encode_image(image)[1]
+
+    def encode_images(self, images: Sequence[ImageSource]) -> List[str]:
+        """セグメントの全キーフレームをスレッドプールで並列にエンコード"""
+        if len(images) <= 1 or self.encode_executor is None:
+            data_urls = [self._encode_image(image) for image in images]
         else:
-            img.save(buffered, format="JPEG", quality=95)
-            mime_type = "image/jpeg"
+            data_urls = list(self.encode_executor.map(self._encode_image, images))
+        return [data_url for data_url in data_urls if data_url]
 
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        data_url = f"data:{mime_type};base64,{img_str}"
+    def _build_message_content(self, image_paths: List[ImageSource], prompt: str,
+                               labels: Optional[Sequence[str]] = None) -> list:
+        """プロンプトと画像からメッセージ内容を構築し、エンコード時間と画像サイズを記録"""
+        encode_start = time.perf_counter()
+        message_content = self._compose_message_content(image_paths, prompt, labels)
+        metrics.IMAGE_ENCODE_SECONDS.observe(time.perf_counter() - encode_start)
+        metrics.REQUEST_PAYLOAD_BYTES.observe(sum(
+            len(part["image_url"]["url"]) for part in message_content if part["type"] == "image_url"
+        ))
+        return message_content
 
-        return img_str, data_url, mime_type
+    def _compose_message_content(self, image_paths: List[ImageSource], prompt: str,
+                                 labels: Optional[Sequence[str]] = None) -> list:
+        """プロンプトと画像からメッセージ内容を構築
+
+        mosaicモードでは複数のキーフレームを時刻ラベル付きのタイル画像1枚にまとめて送信する。
+        """
+        logger = logging.getLogger(__name__)
+
+        if config.get_vlm_image_mode() == "mosaic" and len(image_paths) > 1:
+            mosaic = build_mosaic(image_paths, labels)
+            if mosaic is not None:
+                # タイルサイズで大きさが決まっているため、VLM_IMAGE_MAX_SIZEでの縮小は行わない
+                _, data_url, _ = self.encode_frame(mosaic, max_size=(mosaic.shape[1], mosaic.shape[0]))
+                return [
+                    {"type": "text", "text": f"{prompt}\n\n{config.get_vlm_mosaic_prompt()}"},
+                    {"type": "image_url", "image_url": {"url": data_url}},
+                ]
+            logger.warning("モザイク画像を生成できませんでした。個別に送信します")
+
+        message_content = [{"type": "text", "text": prompt}]
 
-    def analyze_images(self, image_paths: List[Path], prompt: str = None) -> Optional[str]:
-        """複数画像を分析"""
+        for data_url in self.encode_images(image_paths):
+            message_content.append({
+                "type": "image_url",
+                "image_url": {"url": data_url},
+            })
+
+        return message_content
+
+    def analyze_images(self, image_paths: List[ImageSource], prompt: str = None,
+                       labels: Optional[Sequence[str]] = None) -> Optional[str]:
+        """複数画像を分析
+
+        Args:
+            image_paths: 分析する画像（時系列順）
+            prompt: プロンプト。未指定の場合は VLM_PROMPT
+            labels: 各画像の時刻ラベル（mosaicモードでタイルに描画）
+        """
         if not image_paths:
             return "画像がありません"
 
@@ -60,26 +222,67 @@ class VLMClient:
         logger.info(f"入力画像数: {len(image_paths)}")
 
         prompt = prompt or config.get_vlm_prompt()
-        message_content = [{"type": "text", "text": prompt}]
+        message_content = self._build_message_content(image_paths, prompt, labels)
+        cache_key, cached = self._get_cached(message_content)
+        if cached is not None:
+            logger.info(f"VLM応答キャッシュにヒットしました (画像数: {len(image_paths)})")
+            return cached
 
-        for image_path in image_paths:
-            if not image_path.exists():
-                logger.warning(f"警告: 画像が見つかりません {image_path}")
-                continue
+        try:
+            message = HumanMessage(content=message_content)
+            response = self.backend_pool.invoke([message])
+            end_time = time.time()
+            elapsed_time = end_time - start_time
+            logger.info(f"VLM画像分析処理時間: {elapsed_time:.2f} 秒 (画像数: {len(image_paths)})")
+            self._put_cached(cache_key, response.content)
+            return response.content
+        except Exception as e:
+            logger.error(f"VLM分析エラー: {e}")
+            return None
 
-            _, data_url, _ = self.resize_and_encode_image(image_path)
-            message_content.append({
-                "type": "image_url",
-                "image_url": {"url": data_url},
-            })
+    async def aanalyze_images(self, image_paths: List[ImageSource], prompt: str = None,
+                              labels: Optional[Sequence[str]] = None,
+                              timeout: Optional[float] = None,
+                              on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """複数画像を非同期に分析
+
+        画像のエンコードはワーカースレッドで行い、VLMへのリクエストは
+        ainvokeで送信するため、イベントループをブロックしない。
+        timeout（未指定の場合は VLM_REQUEST_TIMEOUT）秒以内に応答がなければNoneを返す。
+        VLM_STREAMING 有効時は応答をストリーミングで受信し、途中までのテキストで on_partial を呼ぶ。
+        """
+        if not image_paths:
+            return "画像がありません"
+
+        start_time = time.time()
+        logger = logging.getLogger(__name__)
+        logger.info(f"入力画像数: {len(image_paths)}")
+
+        prompt = prompt or config.get_vlm_prompt()
 
         try:
+            message_content = await asyncio.to_thread(self._build_message_content, image_paths, prompt, labels)
+            # ディスク層の参照はSQLiteへのアクセスを伴うためワーカースレッドで行う
+            cache_key, cached = await asyncio.to_thread(self._get_cached, message_content)
+            if cached is not None:
+                logger.info(f"VLM応答キャッシュにヒットしました (画像数: {len(image_paths)})")
+                return cached
             message = HumanMessage(content=message_content)
-            response = self.client.invoke([message])
+            timeout = timeout if timeout is not None else config.get_vlm_request_timeout()
+            if on_partial is not None and config.get_vlm_streaming():
+                content = await self.backend_pool.astream([message], on_partial, timeout=timeout)
+            else:
+                content = (await self.backend_pool.ainvoke([message], timeout=timeout)).content
             end_time = time.time()
             elapsed_time = end_time - start_time
             logger.info(f"VLM画像分析処理時間: {elapsed_time:.2f} 秒 (画像数: {len(image_paths)})")
-            return response.content
+            await asyncio.to_thread(self._put_cached, cache_key, content)
+            return content
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"VLM分析がタイムアウトしました ({time.time() - start_time:.2f} 秒)")
+            return None
         except Exception as e:
             logger.error(f"VLM分析エラー: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,5 @@
+"""テスト共通設定（src のモジュールを直接インポートできるようにする）"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
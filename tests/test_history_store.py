@@ -0,0 +1,53 @@
+"""HistoryStore のテスト"""
+from history_store import HistoryRecord, HistoryStore
+
+
+def make_record(n: int, camera_id: int = 0) -> HistoryRecord:
+    return HistoryRecord(camera_id=camera_id, segment_id=n, start_offset=n * 5.0, end_offset=n * 5.0 + 5.0,
+                         description=f"説明{n}", latency=0.1, model="test", created_at=1000.0 + n)
+
+
+def test_records_are_written_and_queried_newest_first(tmp_path):
+    store = HistoryStore(tmp_path / "history.sqlite3", memory_size=2)
+    for n in range(5):
+        store.append(make_record(n, camera_id=n % 2))
+    store.flush()
+
+    assert store.version >= 1
+    assert store.count() == 5
+    assert [record.segment_id for record in store.query(limit=2, offset=1)] == [3, 2]
+    assert [record.segment_id for record in store.query(camera_id=1)] == [3, 1]
+    assert [record.segment_id for record in store.query(since=1001.0, until=1003.0)] == [2, 1]
+    # メモリ上には直近分のみを保持する
+    assert [record.segment_id for record in store.recent] == [3, 4]
+    store.close()
+
+
+def test_records_persist_after_close(tmp_path):
+    path = tmp_path / "history.sqlite3"
+    store = HistoryStore(path)
+    for n in range(3):
+        store.append(make_record(n))
+    store.close()
+    assert store.closed
+
+    reopened = HistoryStore(path)
+    try:
+        assert reopened.count() == 3
+        assert reopened.query(limit=1)[0].description == "説明2"
+        assert reopened.query(limit=1)[0].id is not None
+    finally:
+        reopened.close()
+
+
+def test_memory_only_store(monkeypatch):
+    monkeypatch.setenv("HISTORY_PATH", "")
+    store = HistoryStore(memory_size=3)
+    for n in range(4):
+        store.append(make_record(n))
+
+    assert store.version == 4
+    assert store.count() == 3
+    assert [record.segment_id for record in store.query(limit=2)] == [3, 2]
+    store.flush()
+    store.close()
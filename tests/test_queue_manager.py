@@ -0,0 +1,112 @@
+"""QueueManager のテスト"""
+import queue
+
+import pytest
+
+from queue_manager import QueueManager
+
+
+def make_video_info(segment_id: int, camera_id: int = 0, **extra) -> dict:
+    return {'camera_id': camera_id, 'segment_id': segment_id, 'file_path': f"seg{camera_id}_{segment_id}.mp4",
+            **extra}
+
+
+def make_queue(policy: str, max_size: int = 2, weights=None) -> tuple:
+    dropped = []
+    manager = QueueManager(max_size=max_size, policy=policy, on_drop=dropped.append, weights=weights)
+    return manager, dropped
+
+
+def drain(manager: QueueManager) -> list:
+    items = []
+    while True:
+        try:
+            items.append(manager.get_video_info(timeout=0.01))
+        except queue.Empty:
+            return items
+
+
+def test_drop_oldest_keeps_newest_segments():
+    manager, dropped = make_queue("drop_oldest")
+    for segment_id in range(4):
+        assert manager.put_video_info(make_video_info(segment_id))
+
+    assert [info['segment_id'] for info in drain(manager)] == [2, 3]
+    assert [info['segment_id'] for info in dropped] == [0, 1]
+    stats = manager.get_stats()
+    assert stats["dropped_oldest"] == 2
+    assert stats["dropped_total"] == 2
+
+
+def test_drop_newest_rejects_new_segments():
+    manager, dropped = make_queue("drop_newest")
+    for segment_id in range(4):
+        manager.put_video_info(make_video_info(segment_id))
+
+    assert [info['segment_id'] for info in drain(manager)] == [0, 1]
+    assert [info['segment_id'] for info in dropped] == [2, 3]
+
+
+def test_latest_wins_keeps_only_latest_segment():
+    manager, dropped = make_queue("latest_wins")
+    for segment_id in range(3):
+        manager.put_video_info(make_video_info(segment_id))
+
+    assert [info['segment_id'] for info in drain(manager)] == [2]
+    assert manager.get_stats()["replaced"] == 2
+
+
+def test_coalesce_merges_files_up_to_limit():
+    manager, dropped = make_queue("coalesce", max_size=1)
+    manager.coalesce_max_files = 3
+    for segment_id in range(5):
+        manager.put_video_info(make_video_info(segment_id, start_offset=segment_id * 5.0))
+
+    (merged,) = drain(manager)
+    # 統合のたびに先頭と末尾を残して上限数まで間引く
+    assert len(merged['file_paths']) == 3
+    assert merged['file_paths'][0] == "seg0_0.mp4" and merged['file_paths'][-1] == "seg0_4.mp4"
+    assert merged['first_segment_id'] == 0
+    assert merged['segment_id'] == 4
+    assert merged['start_offset'] == 0.0
+    # 間引いたファイルは後始末される
+    dropped_paths = [path for info in dropped for path in info['file_paths']]
+    assert sorted(dropped_paths + merged['file_paths']) == [f"seg0_{n}.mp4" for n in range(5)]
+    stats = manager.get_stats()
+    assert stats["coalesced"] == 4
+    assert stats["coalesce_dropped_files"] == 2
+
+
+def test_coalesce_thins_memory_frames_evenly():
+    merged, dropped_frames, dropped_paths = QueueManager._coalesce(
+        {'segment_id': 0, 'frames': list(range(4)), 'frame_timestamps': [0.0, 1.0, 2.0, 3.0]},
+        {'segment_id': 1, 'frames': list(range(4, 8)), 'frame_timestamps': [4.0, 5.0, 6.0, 7.0]},
+        max_frames=4, max_files=3
+    )
+    assert len(merged['frames']) == 4
+    assert merged['frames'][0] == 0 and merged['frames'][-1] == 7
+    assert merged['frame_timestamps'] == [float(frame) for frame in merged['frames']]
+    assert dropped_frames == 4
+    assert dropped_paths == []
+
+
+def test_weighted_round_robin_between_cameras():
+    manager, _ = make_queue("drop_oldest", max_size=10, weights=[2, 1])
+    for segment_id in range(4):
+        manager.put_video_info(make_video_info(segment_id, camera_id=0))
+        manager.put_video_info(make_video_info(segment_id, camera_id=1))
+
+    order = [info['camera_id'] for info in drain(manager)[:6]]
+    assert order.count(0) == 4
+    assert order.count(1) == 2
+
+
+def test_get_video_info_times_out_when_empty():
+    manager, _ = make_queue("drop_oldest")
+    with pytest.raises(queue.Empty):
+        manager.get_video_info(timeout=0.01)
+
+
+def test_invalid_video_info_is_rejected():
+    manager, _ = make_queue("drop_oldest")
+    assert not manager.put_video_info("not a dict")
@@ -0,0 +1,59 @@
+"""VideoProcessor の分析結果の公開順のテスト"""
+import asyncio
+
+import pytest
+
+from video_processor import VideoProcessor
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setenv("VLM_API_KEY", "test")
+    monkeypatch.setenv("HISTORY_PATH", "")
+    monkeypatch.setenv("VLM_RESULT_REORDER_LIMIT", "2")
+    return VideoProcessor()
+
+
+def make_video_info(segment_id: int) -> dict:
+    return {'camera_id': 0, 'segment_id': segment_id, 'start_offset': segment_id * 5.0,
+            'end_offset': segment_id * 5.0 + 5.0}
+
+
+def publish(processor: VideoProcessor, sequence: int, description: str) -> None:
+    async def process(video_info, on_partial=None, sequence=None):
+        return description
+
+    processor.process_video_segment = process
+
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        await semaphore.acquire()
+        await processor._process_and_publish(0, sequence, make_video_info(sequence), semaphore)
+
+    asyncio.run(run())
+
+
+def test_results_are_published_in_sequence_order(processor):
+    initial = processor.get_description(0)
+    publish(processor, 1, "結果1")
+    assert processor.get_description(0) == initial
+    publish(processor, 0, "結果0")
+    assert processor.get_description(0) == "結果1"
+    assert [record.segment_id for record in processor.history_store.query()] == [1, 0]
+
+
+def test_pending_results_are_published_when_head_is_too_slow(processor):
+    initial = processor.get_description(0)
+    for sequence in (1, 2):
+        publish(processor, sequence, f"結果{sequence}")
+    assert processor.get_description(0) == initial
+
+    # 待機中の結果が上限を超えたら、先行セグメントを待たずに公開する
+    publish(processor, 3, "結果3")
+    assert processor.get_description(0) == "結果3"
+    assert not processor._pending_results
+
+    # 遅れて完了した先行セグメントは履歴にのみ追加する
+    publish(processor, 0, "結果0")
+    assert processor.get_description(0) == "結果3"
+    assert processor.history_store.count() == 4
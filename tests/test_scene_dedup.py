@@ -0,0 +1,107 @@
+"""SceneDeduplicator と VideoProcessor._describe_keyframes の重複判定のテスト"""
+import asyncio
+
+import numpy as np
+
+from scene_dedup import SceneDeduplicator
+from video_processor import VideoProcessor
+
+
+def make_frame(value: int) -> np.ndarray:
+    """左右で輝度が異なる単純なフレーム（value で模様を変える）"""
+    frame = np.zeros((36, 64, 3), dtype=np.uint8)
+    frame[:, :32] = value
+    frame[:, 32:] = 255 - value
+    return frame
+
+
+class FakeVLMClient:
+    """呼び出し回数を数え、指定した回数だけ失敗（None）を返すVLMクライアント"""
+
+    def __init__(self, failures: int = 0, delay: float = 0.01):
+        self.calls = 0
+        self.failures = failures
+        self.delay = delay
+
+    async def aanalyze_images(self, keyframes, labels=None, timeout=None, on_partial=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            return None
+        return f"説明{self.calls}"
+
+
+def make_processor(vlm_client: FakeVLMClient) -> VideoProcessor:
+    processor = VideoProcessor.__new__(VideoProcessor)
+    processor.vlm_client = vlm_client
+    processor.scene_deduplicators = {0: SceneDeduplicator(threshold=4, method="ahash")}
+    processor._dedup_condition = None
+    processor._dedup_next_sequences = {}
+    processor._dedup_finished = set()
+    return processor
+
+
+async def describe_all(processor: VideoProcessor, count: int) -> list:
+    processor._dedup_condition = asyncio.Condition()
+    keyframes = [make_frame(40)]
+    return await asyncio.gather(*[
+        processor._describe_keyframes(keyframes, camera_id=0, sequence=sequence)
+        for sequence in range(count)
+    ])
+
+
+def test_find_match_counts_hits_and_misses():
+    deduplicator = SceneDeduplicator(threshold=4, method="ahash")
+    hashes = deduplicator.compute_hashes([make_frame(40)])
+    assert deduplicator.find_match(hashes) is None
+    deduplicator.update(hashes, "説明")
+    assert deduplicator.find_match(hashes) == "説明"
+    other = deduplicator.compute_hashes([make_frame(40)[:, ::-1].copy()])
+    assert deduplicator.find_match(other) is None
+    assert (deduplicator.hits, deduplicator.misses) == (1, 2)
+
+
+def test_clear_only_removes_matching_reference():
+    deduplicator = SceneDeduplicator(threshold=4, method="ahash")
+    hashes = deduplicator.compute_hashes([make_frame(40)])
+    deduplicator.update(hashes, "新しい説明")
+    deduplicator.clear("古い説明")
+    assert deduplicator.find_match(hashes, count=False) == "新しい説明"
+    deduplicator.clear("新しい説明")
+    assert deduplicator.find_match(hashes, count=False) is None
+
+
+def test_concurrent_segments_reuse_reference_description():
+    vlm_client = FakeVLMClient()
+    processor = make_processor(vlm_client)
+    results = asyncio.run(describe_all(processor, 5))
+
+    assert vlm_client.calls == 1
+    assert results[0] == "説明1"
+    assert all(result == "【変化なし】説明1" for result in results[1:])
+    assert processor.get_dedup_stats()["hits"] == 4
+    assert processor.get_dedup_stats()["misses"] == 1
+
+
+def test_failed_reference_is_replaced_and_counted_as_miss():
+    vlm_client = FakeVLMClient(failures=1)
+    processor = make_processor(vlm_client)
+    deduplicator = processor.scene_deduplicators[0]
+
+    async def scenario():
+        # 並行中のセグメントは失敗した基準を待ったあと、自身でVLMを呼び出す
+        first = await describe_all(processor, 3)
+        # 失敗した基準は取り消されているため、後続のセグメントは成功した分析を再利用する
+        processor._dedup_next_sequences = {}
+        second = await describe_all(processor, 2)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first[0] is None
+    assert all(result is not None and not result.startswith("【変化なし】") for result in first[1:])
+    assert vlm_client.calls == 4
+    assert second[0] is not None
+    assert second[1] == f"【変化なし】{second[0]}"
+    assert deduplicator.hits + deduplicator.misses == 5
+    assert deduplicator.misses == vlm_client.calls
@@ -0,0 +1,77 @@
+"""SessionRecorder / SessionReader / ReplayCapture のテスト"""
+import threading
+
+import numpy as np
+import pytest
+
+from session_recording import ReplayCapture, SessionReader, SessionRecorder
+
+
+def make_frame(value: int) -> np.ndarray:
+    return np.full((24, 32, 3), value, dtype=np.uint8)
+
+
+def record(path, count: int, chunk_frames: int = 3) -> SessionRecorder:
+    recorder = SessionRecorder(path, fps=count, source="test", jpeg_quality=95, chunk_frames=chunk_frames)
+    recorder.start()
+    for n in range(count):
+        recorder.write(make_frame(n * 20), timestamp=100.0 + n * 0.5)
+    recorder.close()
+    return recorder
+
+
+def test_recorded_frames_are_read_back_in_order(tmp_path):
+    path = tmp_path / "session.vlmrec"
+    recorder = record(path, 7)
+    assert recorder.frames_written == 7
+    assert recorder.dropped == 0
+
+    reader = SessionReader(path)
+    try:
+        assert reader.metadata["source"] == "test"
+        assert reader.metadata["fps"] == 7
+        frames = list(reader.frames())
+    finally:
+        reader.close()
+    assert [timestamp for timestamp, _ in frames] == [100.0 + n * 0.5 for n in range(7)]
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a session")
+    with pytest.raises(ValueError):
+        SessionReader(path)
+
+
+def test_replay_capture_returns_frames_until_end(tmp_path):
+    path = tmp_path / "session.vlmrec"
+    record(path, 4)
+
+    capture = ReplayCapture.from_url(f"replay://{path}?speed=max")
+    values = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        values.append(int(frame.mean()))
+    capture.release()
+
+    assert capture.ended
+    assert values == pytest.approx([0, 20, 40, 60], abs=2)
+
+
+def test_close_does_not_hang_when_writer_thread_died(tmp_path):
+    # 書き込み先を作成できない場合、書き込みスレッドは異常終了する
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    recorder = SessionRecorder(blocker / "session.vlmrec", fps=1)
+    recorder._thread = threading.Thread(target=recorder._write_loop)
+    recorder._thread.start()
+    recorder._thread.join()
+    recorder.write(make_frame(0))
+    recorder.write(make_frame(0))
+    recorder.write(make_frame(0))
+
+    recorder.close(timeout=0.1)
+    assert recorder.dropped == 1
+    assert recorder.frames_written == 0